@@ -8,9 +8,12 @@ from flask import Flask, jsonify, send_from_directory
 from config import get_config
 # Extensões
 from extensions import init_extensions
-from extensions.database import db
+from extensions.database import db, ensure_unique_index, ensure_indexes
+# Modelos
+from models.dividends import DividendsCache
 # Serviços
 from services.price_service import load_dollar_from_db
+from services.price_cache_service import normalize_price_cache
 from services.auth_service import create_test_user
 # Rotas
 from routes import register_blueprints
@@ -64,6 +67,16 @@ def init_app():
         # Criar tabelas do banco de dados
         db.create_all()
         
+        # Normalizar tickers do cache de preços e garantir a chave única
+        normalize_price_cache()
+        
+        # Garantir as chaves únicas da evolução e dos dividendos em bancos criados antes delas
+        ensure_unique_index('portfolio_evolution_cache', ['user_id', 'date'], 'uq_evolution_user_date')
+        ensure_unique_index('dividends_cache', ['user_id', 'ticker', 'date'], 'uq_dividends_user_ticker_date')
+        
+        # Índices novos em tabelas já existentes
+        ensure_indexes(DividendsCache)
+        
         # Criar usuário de teste
         create_test_user()
         
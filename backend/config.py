@@ -12,6 +12,22 @@ class Config:
     SESSION_COOKIE_HTTPONLY = False  # Permite acesso via JS
     PERMANENT_SESSION_LIFETIME = 1800  # 30 minutos em segundos
     SESSION_TIMEOUT_MINUTES = 30
+    # Provedor de dados de mercado: 'yfinance' ou 'local' (arquivos em MARKET_DATA_DIR)
+    MARKET_DATA_PROVIDER = os.environ.get('MARKET_DATA_PROVIDER', 'yfinance')
+    MARKET_DATA_DIR = os.environ.get('MARKET_DATA_DIR', 'market_data')
+    # Ritmo das requisições ao provedor: requisições por segundo e rajada máxima
+    MARKET_DATA_RATE = float(os.environ.get('MARKET_DATA_RATE', '2'))
+    MARKET_DATA_BURST = int(os.environ.get('MARKET_DATA_BURST', '5'))
+    # Consultas simultâneas ao provedor e timeout de cada uma (segundos)
+    MARKET_DATA_CONCURRENCY = int(os.environ.get('MARKET_DATA_CONCURRENCY', '8'))
+    MARKET_DATA_TIMEOUT_SECONDS = 60
+    # Pausa global após rate limit: duração inicial e teto do backoff (segundos)
+    RATE_LIMIT_PAUSE_SECONDS = 300
+    RATE_LIMIT_MAX_PAUSE_SECONDS = 3600
+    # Disjuntor por ticker: falhas seguidas para bloquear, bloqueio inicial e teto (segundos)
+    TICKER_BREAKER_THRESHOLD = 3
+    TICKER_BREAKER_COOLDOWN_SECONDS = 1800
+    TICKER_BREAKER_MAX_COOLDOWN_SECONDS = 86400
 
 class DevelopmentConfig(Config):
     """Configuração para ambiente de desenvolvimento."""
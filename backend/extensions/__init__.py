@@ -14,6 +14,10 @@ def init_extensions(app):
     # Inicializa o banco de dados
     init_db(app)
     
+    # Inicializa o provedor de dados de mercado
+    from providers import init_market_data
+    init_market_data(app)
+    
     # Cria pastas necessárias se não existirem
     import os
     for folder in [app.config['UPLOAD_FOLDER'], app.config['TEMPLATE_FOLDER']]:
@@ -64,6 +64,121 @@ def execute_with_retry(session_func, max_attempts=5):
     print(f"[DATABASE] Erro após {max_attempts} tentativas: {last_error}")
     raise last_error
 
+# Quantidade máxima de linhas por instrução INSERT em lote
+BULK_CHUNK_SIZE = 500
+
+def bulk_upsert(model, rows, index_elements, update_columns=None):
+    """
+    Insere ou atualiza um lote de linhas com INSERT ... ON CONFLICT (SQLite e
+    PostgreSQL) ou ON DUPLICATE KEY UPDATE (MySQL), sem consultar as linhas
+    existentes. Em outros bancos, cada linha é buscada pela chave única e
+    atualizada ou inserida pela sessão. Não faz commit: o lote inteiro fica na
+    transação atual.
+    
+    Args:
+        model: Modelo SQLAlchemy de destino
+        rows (list): Lista de dicionários coluna -> valor
+        index_elements (list): Colunas da chave única usada para detectar conflito
+        update_columns (list, optional): Colunas atualizadas em caso de conflito.
+            Se vazio ou None, linhas em conflito são ignoradas (INSERT OR IGNORE).
+            
+    Returns:
+        int: Quantidade de linhas enviadas
+    """
+    if not rows:
+        return 0
+        
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+    else:
+        return _upsert_rows(model, rows, index_elements, update_columns)
+        
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        stmt = insert(model.__table__).values(rows[start:start + BULK_CHUNK_SIZE])
+        if dialect in ('mysql', 'mariadb'):
+            # No MySQL o conflito é detectado por qualquer chave única da tabela
+            if update_columns:
+                stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+            else:
+                stmt = stmt.prefix_with('IGNORE')
+        elif update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={column: stmt.excluded[column] for column in update_columns}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+        db.session.execute(stmt)
+    return len(rows)
+
+def _upsert_rows(model, rows, index_elements, update_columns):
+    """Upsert linha a linha pela sessão, para bancos sem INSERT com tratamento de conflito."""
+    pending = {}
+    for row in rows:
+        key = tuple(row[column] for column in index_elements)
+        existing = pending.get(key)
+        if existing is None:
+            with db.session.no_autoflush:
+                existing = model.query.filter_by(**{column: row[column] for column in index_elements}).first()
+        if existing is None:
+            existing = model(**row)
+            db.session.add(existing)
+        elif update_columns:
+            for column in update_columns:
+                setattr(existing, column, row[column])
+        pending[key] = existing
+    db.session.flush()
+    return len(rows)
+
+def ensure_unique_index(table_name, columns, index_name):
+    """
+    Garante uma chave única em uma tabela já existente (db.create_all não altera
+    tabelas antigas). Linhas duplicadas são removidas antes, mantendo a de maior id.
+    
+    Args:
+        table_name (str): Nome da tabela
+        columns (list): Colunas da chave única
+        index_name (str): Nome do índice único a criar
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(db.engine)
+    existing = [c['column_names'] for c in inspector.get_unique_constraints(table_name)]
+    existing += [i['column_names'] for i in inspector.get_indexes(table_name) if i.get('unique')]
+    if list(columns) in [list(cols) for cols in existing]:
+        return
+        
+    column_list = ', '.join(columns)
+    removed = db.session.execute(text(
+        f"DELETE FROM {table_name} WHERE id NOT IN "
+        f"(SELECT MAX(id) FROM {table_name} GROUP BY {column_list})"
+    )).rowcount
+    db.session.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_list})"))
+    db.session.commit()
+    print(f"[DATABASE] Chave única {index_name} criada em {table_name} ({removed} duplicatas removidas)")
+
+def ensure_indexes(model):
+    """
+    Garante os índices declarados em um modelo em uma tabela já existente
+    (db.create_all não altera tabelas antigas).
+    
+    Args:
+        model: Modelo SQLAlchemy
+    """
+    from sqlalchemy import inspect
+    
+    table_name = model.__tablename__
+    existing = {i['name'] for i in inspect(db.engine).get_indexes(table_name)}
+    for index in model.__table__.indexes:
+        if index.name not in existing:
+            index.create(bind=db.engine)
+            print(f"[DATABASE] Índice {index.name} criado em {table_name}")
+
 def init_db(app):
     """Inicializa o banco de dados com a aplicação Flask."""
     db.init_app(app)
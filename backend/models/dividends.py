@@ -9,9 +9,14 @@ class DividendsCache(db.Model):
     ticker = db.Column(db.String(32), nullable=False, index=True)
     date = db.Column(db.Date, nullable=False, index=True)
     value = db.Column(db.Float, nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)  # Quantidade mantida na data ex (aceita frações)
     event_type = db.Column(db.String(32), nullable=True)
     last_updated = db.Column(db.DateTime, nullable=False, index=True)
+    # Um provento por usuário, ticker e data; consultas e resumos por período usam (user_id, date)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'ticker', 'date', name='uq_dividends_user_ticker_date'),
+        db.Index('ix_dividends_user_date', 'user_id', 'date'),
+    )
 
     def to_dict(self):
         """Converte o objeto para um dicionário."""
@@ -23,6 +28,15 @@ class DividendsCache(db.Model):
             'event_type': self.event_type or 'Dividendo'
         }
 
+class DividendsSync(db.Model):
+    """Último recálculo dos dividendos de cada usuário, gravado mesmo quando nada mudou."""
+    __tablename__ = 'dividends_sync'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), nullable=False, unique=True)
+    portfolio_id = db.Column(db.Integer, nullable=False)  # Fotografia mais recente usada no recálculo
+    last_computed = db.Column(db.DateTime, nullable=False)
+    last_event_date = db.Column(db.Date, nullable=True)  # Evento mais recente cruzado (None se não há eventos)
+
 class DividendReceiptStatus(db.Model):
     """Modelo para controle de status de recebimento de proventos."""
     __tablename__ = 'dividend_receipt_status'
@@ -39,4 +53,22 @@ class DividendReceiptStatus(db.Model):
             'ticker': self.ticker,
             'date': self.date.strftime('%Y-%m-%d'),
             'received': self.received
-        }
\ No newline at end of file
+        }
+
+class CorporateAction(db.Model):
+    """Eventos corporativos por ticker (dividendos e desdobramentos), compartilhados entre usuários."""
+    __tablename__ = 'corporate_action'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(32), nullable=False)  # Ticker formatado (ver format_ticker)
+    date = db.Column(db.Date, nullable=False)
+    event_type = db.Column(db.String(32), nullable=False)  # 'Dividendo' ou 'Desdobramento'
+    value = db.Column(db.Float, nullable=False)  # Valor por ação ou fator do desdobramento
+    __table_args__ = (db.UniqueConstraint('ticker', 'date', 'event_type', name='uq_corporate_action_event'),)
+
+class CorporateActionSync(db.Model):
+    """Última consulta dos eventos corporativos de cada ticker no provedor."""
+    __tablename__ = 'corporate_action_sync'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(32), nullable=False, unique=True)
+    first_date = db.Column(db.Date, nullable=False)  # Início do intervalo já consultado
+    last_checked = db.Column(db.DateTime, nullable=False)  # Eventos completos até esta consulta
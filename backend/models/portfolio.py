@@ -52,7 +52,7 @@ class PortfolioEvolutionCache(db.Model):
     total_value = db.Column(db.Float, nullable=False)
     last_updated = db.Column(db.DateTime, nullable=False)
     __table_args__ = (
-        db.Index('idx_evolution_user_date', 'user_id', 'date'),
+        db.UniqueConstraint('user_id', 'date', name='uq_evolution_user_date'),
     )
     
     def to_dict(self):
@@ -60,4 +60,19 @@ class PortfolioEvolutionCache(db.Model):
         return {
             'date': self.date.strftime('%Y-%m-%d'),
             'value': float(self.total_value)
-        }
\ No newline at end of file
+        }
+
+class PortfolioEvolutionSeries(db.Model):
+    """Série diária da evolução do portfólio, por versão (fotografia mais recente) da carteira."""
+    __tablename__ = 'portfolio_evolution_series'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), nullable=False)
+    portfolio_version = db.Column(db.Integer, nullable=False)  # Id do Portfolio mais recente
+    frequency = db.Column(db.String(8), nullable=False, default='D')
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON com a lista de valores, um por data de start_date a end_date
+    last_updated = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'portfolio_version', 'frequency', name='uq_evolution_series_version'),
+    )
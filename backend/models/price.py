@@ -9,6 +9,8 @@ class PriceCache(db.Model):
     ticker = db.Column(db.String(32), nullable=False, index=True)
     price = db.Column(db.Float, nullable=False)
     last_updated = db.Column(db.DateTime, nullable=False, index=True)
+    # Uma linha por ticker normalizado (ver utils.ticker_utils.format_ticker)
+    __table_args__ = (db.UniqueConstraint('ticker', name='uq_price_cache_ticker'),)
     
     def to_dict(self):
         """Converte o objeto para um dicionário."""
@@ -16,4 +18,38 @@ class PriceCache(db.Model):
             'ticker': self.ticker,
             'price': self.price,
             'last_updated': self.last_updated.isoformat() if self.last_updated else None
-        }
\ No newline at end of file
+        }
+
+class PriceHistory(db.Model):
+    """Histórico diário local (OHLC, fechamento ajustado e volume) por ticker."""
+    __tablename__ = 'price_history'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(32), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    open = db.Column(db.Float, nullable=True)
+    high = db.Column(db.Float, nullable=True)
+    low = db.Column(db.Float, nullable=True)
+    close = db.Column(db.Float, nullable=True)
+    adj_close = db.Column(db.Float, nullable=True)
+    volume = db.Column(db.Float, nullable=True)
+    __table_args__ = (db.UniqueConstraint('ticker', 'date', name='uq_price_history_ticker_date'),)
+
+class PriceHistorySync(db.Model):
+    """Intervalo já sincronizado do histórico local de cada ticker."""
+    __tablename__ = 'price_history_sync'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(32), nullable=False, unique=True)
+    first_date = db.Column(db.Date, nullable=False)  # Início do intervalo já consultado no provedor
+    last_date = db.Column(db.Date, nullable=True)  # Último pregão armazenado (None se o provedor não tem dados)
+    last_checked = db.Column(db.DateTime, nullable=False)
+
+class FailedTicker(db.Model):
+    """Tickers sem cotação no provedor (possivelmente delisted), com o próximo momento de nova tentativa."""
+    __tablename__ = 'failed_ticker'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker = db.Column(db.String(32), nullable=False, unique=True)
+    failure_count = db.Column(db.Integer, nullable=False, default=1)  # Falhas seguidas
+    first_failed = db.Column(db.DateTime, nullable=False)
+    last_attempt = db.Column(db.DateTime, nullable=False)
+    next_probe = db.Column(db.DateTime, nullable=False, index=True)  # Antes disso o ticker não é consultado
+    last_error = db.Column(db.String(255), nullable=True)
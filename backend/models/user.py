@@ -16,4 +16,11 @@ class User(db.Model):
             'name': self.name,
             'email': self.email,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class UserActivity(db.Model):
+    """Último acesso de cada usuário, usado na prioridade de atualização de preços."""
+    __tablename__ = 'user_activity'
+    user_id = db.Column(db.String(36), db.ForeignKey('user.id'), primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False, index=True)  # UTC
+    session_active = db.Column(db.Boolean, nullable=False, default=True)  # False após o logout
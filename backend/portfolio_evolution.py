@@ -7,15 +7,29 @@ de ativos financeiros e calcular a evolução do valor de um portfólio ao longo
 
 import pandas as pd
 import numpy as np
-import yfinance as yf
 from datetime import datetime, timedelta
 import random
 import time
 import threading
 import copy
-from models.portfolio import PortfolioEvolutionCache
-from extensions.database import db
-from flask import session
+import json
+from models.portfolio import PortfolioEvolutionCache, PortfolioEvolutionSeries
+from extensions.database import db, bulk_upsert
+from services import history_store
+from services.holdings_service import build_holdings_timeline
+from utils.ticker_utils import FX_PAIRS, format_ticker, get_ticker_currency
+
+# Coluna de preço usada na evolução: fechamento ajustado (equivalente ao auto_adjust do yfinance)
+PRICE_FIELD = 'Adj Close'
+
+# Dias de histórico lidos antes da data inicial para garantir um preço na primeira data
+EVOLUTION_BUFFER_DAYS = 14
+
+# Dias finais da série diária recalculados quando chegam novos pregões
+EVOLUTION_TRAILING_DAYS = 7
+
+# Intervalo mínimo entre recálculos da janela final da série diária (segundos)
+EVOLUTION_REFRESH_SECONDS = 3600
 
 def get_historical_prices(ticker, start_date, end_date, retries=3, delay=1):
     """
@@ -35,20 +49,14 @@ def get_historical_prices(ticker, start_date, end_date, retries=3, delay=1):
     
     for attempt in range(retries):
         try:
-            # Criar uma nova sessão para cada download para evitar problemas de concorrência
-            ticker_obj = yf.Ticker(ticker)
-            history = ticker_obj.history(
-                start=start_date,
-                end=end_date,
-                interval='1d'
-            )
+            history = history_store.get_history([ticker], start_date, end_date).get(ticker)
             
-            if not history.empty:
-                if 'Close' in history.columns:
+            if history is not None and not history.empty:
+                if PRICE_FIELD in history.columns:
                     print(f"[SUCCESS] Obtidos {len(history)} registros para {ticker}")
                     return history
                 else:
-                    print(f"[WARNING] Dados obtidos para {ticker}, mas sem coluna 'Close'. Colunas disponíveis: {history.columns.tolist()}")
+                    print(f"[WARNING] Dados obtidos para {ticker}, mas sem coluna '{PRICE_FIELD}'. Colunas disponíveis: {history.columns.tolist()}")
             else:
                 print(f"[WARNING] Nenhum dado histórico encontrado para {ticker}")
             
@@ -123,19 +131,17 @@ def process_asset_historical_data(asset, start_date, end_date, date_range, excha
     
     if history is not None and not history.empty:
         try:
-            # Verificar se a coluna 'Close' existe
-            if 'Close' not in history.columns:
-                print(f"[ERROR] Coluna 'Close' não encontrada para {ticker_orig}. Colunas disponíveis: {history.columns.tolist()}")
+            # Verificar se a coluna de preço existe
+            if PRICE_FIELD not in history.columns:
+                print(f"[ERROR] Coluna '{PRICE_FIELD}' não encontrada para {ticker_orig}. Colunas disponíveis: {history.columns.tolist()}")
                 # Usar uma série com valor único como fallback
                 asset_prices = pd.Series(avg_price, index=date_range)
             else:
                 # Processar preços de fechamento
                 try:
-                    close_prices = history['Close'].copy()
-                    # Converter o índice para tz-naive para compatibilidade com o date_range
-                    close_prices.index = close_prices.index.tz_localize(None)
+                    close_prices = history[PRICE_FIELD].copy()
                     # Preencher valores ausentes
-                    close_prices = close_prices.fillna(method='ffill')
+                    close_prices = close_prices.ffill()
                     
                     # Reindexar para o range de datas desejado
                     try:
@@ -171,126 +177,256 @@ def process_asset_historical_data(asset, start_date, end_date, date_range, excha
         print(f"Usando preço médio para {ticker_orig} devido à falta de dados históricos")
         return pd.Series(avg_price * qty * conv_factor, index=date_range)
 
-def calculate_portfolio_evolution(portfolio_data, start_date, end_date, exchange_rate=None, format_ticker_func=None):
+def build_price_matrix(aligned, tickers, date_range, fallback_prices):
+    """
+    Completa a matriz de preços (datas x tickers) já alinhada e com forward-fill
+    (ver services.history_store.get_aligned_prices): datas anteriores ao primeiro
+    pregão recebem o primeiro preço disponível no período, e tickers sem
+    histórico recebem o preço médio.
+    
+    Args:
+        aligned: numpy.ndarray datas x tickers com NaN onde não há preço
+        tickers: Lista de tickers, na ordem das colunas da matriz
+        date_range: pandas.DatetimeIndex com as datas da matriz
+        fallback_prices: Dicionário ticker -> preço usado quando não há histórico
+        
+    Returns:
+        pandas.DataFrame: Matriz float com índice date_range e colunas tickers
+    """
+    values = pd.DataFrame(aligned, index=date_range, columns=tickers).bfill().to_numpy(dtype=float, na_value=np.nan)
+    fallback = np.array([fallback_prices.get(ticker, np.nan) for ticker in tickers], dtype=float)
+    values = np.where(np.isnan(values), fallback, values)
+    return pd.DataFrame(values, index=date_range, columns=tickers)
+
+def build_evolution_date_range(start_date, end_date):
+    """
+    Datas exibidas no gráfico de evolução: diárias até 90 dias, a cada 3 dias até
+    um ano e semanais acima disso, sempre incluindo a data final.
+    
+    Args:
+        start_date: Data inicial (string no formato 'YYYY-MM-DD')
+        end_date: Data final (string no formato 'YYYY-MM-DD')
+        
+    Returns:
+        pandas.DatetimeIndex: Datas do gráfico
+    """
+    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+    days_diff = (end_date_obj - start_date_obj).days
+    if days_diff > 365:
+        freq = 'W-MON'
+    elif days_diff > 90:
+        freq = '3D'
+    else:
+        freq = 'D'
+    date_range = pd.date_range(start=start_date, end=end_date, freq=freq)
+    if end_date_obj not in date_range:
+        date_range = date_range.append(pd.DatetimeIndex([end_date_obj]))
+    return date_range
+
+def compute_portfolio_values(holdings, date_range, exchange_rate, history_start, with_fallback=False):
+    """
+    Valoriza a carteira em cada data: soma de preço x câmbio x quantidade em vigor.
+    
+    Args:
+        holdings: HoldingsTimeline com as quantidades ao longo do tempo
+        date_range: pandas.DatetimeIndex com as datas a valorizar
+        exchange_rate: Câmbio usado nas datas sem histórico de câmbio
+        history_start: Primeira data de histórico considerada (string 'YYYY-MM-DD')
+        with_fallback: Se True, retorna também quais datas usaram preço médio ou câmbio atual
+        
+    Returns:
+        numpy.ndarray: Valor do portfólio em cada data de date_range
+        (com with_fallback, tupla (valores, numpy.ndarray bool por data))
+    """
+    asset_tickers = list(holdings.tickers)
+    # Série histórica do câmbio de cada moeda estrangeira da carteira
+    currencies = {t: get_ticker_currency(t) for t in asset_tickers}
+    fx_tickers = sorted({FX_PAIRS[c] for c in currencies.values() if c in FX_PAIRS})
+    try:
+        # Colunas das séries por ticker compartilhadas entre usuários; o provedor só é
+        # consultado para pregões ainda não armazenados no histórico local
+        aligned = history_store.get_aligned_prices(asset_tickers + fx_tickers, date_range, history_start, field=PRICE_FIELD)
+    except Exception as e:
+        print(f"Erro no download em lote dos preços históricos: {e}")
+        aligned = np.full((len(date_range), len(asset_tickers) + len(fx_tickers)), np.nan)
+    # Preço médio como fallback para ativos sem histórico
+    price_matrix = build_price_matrix(aligned[:, :len(asset_tickers)], asset_tickers, date_range, holdings.avg_prices)
+    # Câmbio de cada data (sem histórico, usa a cotação atual) aplicado às colunas em moeda estrangeira
+    fx_matrix = build_price_matrix(aligned[:, len(asset_tickers):], fx_tickers, date_range, {pair: exchange_rate for pair in fx_tickers})
+    fx_columns = np.column_stack([np.ones(len(date_range)), fx_matrix.to_numpy()])
+    fx_index = [
+        fx_tickers.index(FX_PAIRS[currencies[t]]) + 1 if currencies[t] in FX_PAIRS else 0
+        for t in asset_tickers
+    ]
+    fx_factors = fx_columns[:, fx_index]
+    # Quantidades em vigor em cada data (datas x tickers)
+    quantities = holdings.quantities_at(date_range)
+    values = np.einsum('ij,ij,ij->i', price_matrix.to_numpy(), fx_factors, quantities)
+    if not with_fallback:
+        return values
+    # Após o forward/backward fill só ficam sem preço as colunas sem nenhum histórico,
+    # e uma data usa fallback quando alguma posição em vigor depende dessas colunas
+    missing = np.isnan(aligned).all(axis=0)
+    fx_missing = np.concatenate([[False], missing[len(asset_tickers):]])
+    uses_fallback = missing[:len(asset_tickers)] | fx_missing[fx_index]
+    return values, ((quantities != 0) & uses_fallback).any(axis=1)
+
+def _compute_daily_segment(holdings, first, last, exchange_rate, history_start):
+    """
+    Valoriza todos os dias de first a last (inclusive), incluindo o pregão de last.
+    Retorna (valores, datas que usaram fallback), ambos pandas.Series diárias.
+    """
+    days = pd.date_range(first, last, freq='D')
+    values, fallback = compute_portfolio_values(
+        holdings, days, exchange_rate, history_start.strftime('%Y-%m-%d'), with_fallback=True
+    )
+    return pd.Series(values, index=days), pd.Series(fallback, index=days)
+
+def get_evolution_series(user_id, holdings, start_date, end_date, exchange_rate):
+    """
+    Série diária da evolução, guardada em PortfolioEvolutionSeries por
+    (usuário, versão da carteira, frequência). A parte histórica é calculada uma
+    única vez; a cada novo pregão só a janela final de EVOLUTION_TRAILING_DAYS
+    dias é recalculada, e períodos ainda não cobertos são acrescentados.
+    
+    Args:
+        user_id (str): ID do usuário
+        holdings: HoldingsTimeline do usuário (holdings.version identifica a carteira)
+        start_date: Data inicial (string no formato 'YYYY-MM-DD')
+        end_date: Data final (string no formato 'YYYY-MM-DD')
+        exchange_rate: Câmbio usado nas datas sem histórico de câmbio
+        
+    Returns:
+        tuple: (pandas.Series diária cobrindo o período, bool indicando se houve recálculo)
+    """
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+    now = datetime.now()
+    buffer = timedelta(days=EVOLUTION_BUFFER_DAYS)
+
+    row = PortfolioEvolutionSeries.query.filter_by(
+        user_id=user_id, portfolio_version=holdings.version, frequency='D'
+    ).first()
+    if row is None:
+        series, fallback = _compute_daily_segment(holdings, start, end, exchange_rate, start - buffer)
+    else:
+        stored = pd.Series(
+            json.loads(row.data),
+            index=pd.date_range(row.start_date, row.end_date, freq='D'),
+            dtype=float
+        )
+        first, last = stored.index[0], stored.index[-1]
+        series = stored
+        # A série gravada nunca contém datas valorizadas com fallback
+        fallback = pd.Series(False, index=stored.index)
+        if start < first:
+            # Período anterior ao já calculado
+            prefix, prefix_fallback = _compute_daily_segment(holdings, start, first - timedelta(days=1), exchange_rate, start - buffer)
+            series = pd.concat([prefix, series])
+            fallback = pd.concat([prefix_fallback, fallback])
+        recent = last >= pd.Timestamp(now.date()) - timedelta(days=EVOLUTION_TRAILING_DAYS)
+        expired = row.last_updated < now - timedelta(seconds=EVOLUTION_REFRESH_SECONDS)
+        if end > last or (recent and expired):
+            # Janela final: o último pregão pode ter sido gravado incompleto
+            tail_start = max(first, last - timedelta(days=EVOLUTION_TRAILING_DAYS - 1))
+            tail, tail_fallback = _compute_daily_segment(holdings, tail_start, max(end, last), exchange_rate, series.index[0] - buffer)
+            series = pd.concat([series[series.index < tail_start], tail])
+            fallback = pd.concat([fallback[fallback.index < tail_start], tail_fallback])
+        if series is stored:
+            return stored.loc[start:end], False
+
+    # Só a parte anterior à primeira data valorizada com preço médio ou câmbio atual é
+    # gravada; o restante volta a ser calculado (como data nova) até o histórico existir
+    if fallback.any():
+        keep = series[series.index < fallback.idxmax()]
+        print(f"[EVOLUTION] Usuário {user_id}: datas a partir de {fallback.idxmax().date()} usaram fallback e não serão gravadas")
+    else:
+        keep = series
+    if not keep.empty:
+        _save_evolution_series(user_id, holdings.version, keep, now)
+    return series.loc[start:end], True
+
+def _save_evolution_series(user_id, version, series, now):
+    """Grava a série diária (um upsert) e descarta as séries de versões anteriores da carteira."""
+    bulk_upsert(
+        PortfolioEvolutionSeries,
+        [{
+            'user_id': user_id,
+            'portfolio_version': version,
+            'frequency': 'D',
+            'start_date': series.index[0].date(),
+            'end_date': series.index[-1].date(),
+            'data': json.dumps([round(float(v), 6) for v in series.to_numpy()]),
+            'last_updated': now,
+        }],
+        ['user_id', 'portfolio_version', 'frequency'],
+        ['start_date', 'end_date', 'data', 'last_updated']
+    )
+    PortfolioEvolutionSeries.query.filter(
+        PortfolioEvolutionSeries.user_id == user_id,
+        PortfolioEvolutionSeries.portfolio_version != version
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+def calculate_portfolio_evolution(portfolio_data, start_date, end_date, exchange_rate=None, format_ticker_func=None,
+                                  user_id=None, holdings=None):
     """
     Calcula a evolução histórica do valor do portfólio usando download em lote (multi-ticker) para máxima performance.
     Agora salva e serve cache persistente (PortfolioEvolutionCache) se yfinance falhar.
+    
+    Com holdings (linha do tempo das fotografias da carteira, ver services.holdings_service),
+    cada data é valorizada com as quantidades em vigor naquela data; sem ela, a carteira
+    portfolio_data vale para todo o período. Com user_id e holdings, as datas pedidas são
+    recortadas da série diária persistente (ver get_evolution_series).
     """
-    user_id = session.get('user_id') if hasattr(session, 'get') else None
     try:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-        days_diff = (end_date_obj - start_date_obj).days
-        if days_diff > 365:
-            freq = 'W-MON'
-        elif days_diff > 90:
-            freq = '3D'
-        else:
-            freq = 'D'
-        date_range = pd.date_range(start=start_date, end=end_date, freq=freq)
-        if end_date_obj not in date_range:
-            date_range = date_range.append(pd.DatetimeIndex([end_date_obj]))
-        safe_portfolio_data = copy.deepcopy(portfolio_data)
-        tickers = []
-        ticker_map = {}
-        for asset in safe_portfolio_data:
-            ticker_orig = asset['ticker'].strip().upper()
-            if format_ticker_func:
-                try:
-                    final_ticker = format_ticker_func(ticker_orig)
-                except Exception:
-                    final_ticker = ticker_orig
-            else:
-                final_ticker = ticker_orig
-                if not ticker_orig.endswith('.SA') and not '.' in ticker_orig and not '=' in ticker_orig:
-                    final_ticker += '.SA'
-            tickers.append(final_ticker)
-            ticker_map[final_ticker] = asset
+        date_range = build_evolution_date_range(start_date, end_date)
         if exchange_rate is None:
             exchange_rate = 5.8187
-        buffer_days = 14
-        start_with_buffer = (start_date_obj - timedelta(days=buffer_days)).strftime('%Y-%m-%d')
-        try:
-            data = yf.download(tickers=list(set(tickers)), start=start_with_buffer, end=end_date, interval='1d', group_by='ticker', progress=False, threads=True)
-        except Exception as e:
-            print(f"Erro no download em lote do yfinance: {e}")
-            data = None
-        total_values = pd.Series(0.0, index=date_range)
-        for final_ticker, asset in ticker_map.items():
-            try:
-                qty = float(asset.get('quantidade', 0))
-                avg_price = float(asset.get('preco_medio', 0))
-                is_us = not final_ticker.endswith('.SA')
-                conv_factor = exchange_rate if is_us else 1.0
-                if data is not None:
-                    if len(tickers) == 1:
-                        close_prices = data['Close'].copy()
-                    else:
-                        if (final_ticker, 'Close') in data:
-                            close_prices = data[(final_ticker, 'Close')].copy()
-                        elif final_ticker in data and 'Close' in data[final_ticker]:
-                            close_prices = data[final_ticker]['Close'].copy()
-                        else:
-                            close_prices = pd.Series(dtype=float)
-                    close_prices.index = pd.to_datetime(close_prices.index).tz_localize(None)
-                    close_prices = close_prices.fillna(method='ffill')
-                    try:
-                        asset_prices = close_prices.reindex(date_range, method='ffill')
-                    except Exception as e:
-                        last_price = close_prices.iloc[-1] if not close_prices.empty else avg_price
-                        asset_prices = pd.Series(last_price, index=date_range)
-                    if asset_prices.isna().any():
-                        first_valid = asset_prices.first_valid_index()
-                        if first_valid is not None:
-                            first_value = asset_prices.loc[first_valid]
-                            asset_prices = asset_prices.fillna(first_value)
-                        else:
-                            asset_prices = pd.Series(avg_price, index=date_range)
-                    asset_values = asset_prices * qty * conv_factor
-                else:
-                    asset_values = pd.Series(avg_price * qty * conv_factor, index=date_range)
-                total_values = total_values.add(asset_values, fill_value=0)
-            except Exception as e:
-                print(f"Erro ao processar {final_ticker}: {e}")
+        if user_id and holdings is not None and holdings.version is not None:
+            series, recomputed = get_evolution_series(user_id, holdings, start_date, end_date, exchange_rate)
+            total_values = series.reindex(date_range)
+        else:
+            if holdings is None:
+                holdings = build_holdings_timeline(
+                    [(datetime.strptime(start_date, '%Y-%m-%d'), copy.deepcopy(portfolio_data))],
+                    format_ticker_func=format_ticker_func or format_ticker
+                )
+            buffer_days = EVOLUTION_BUFFER_DAYS
+            start_with_buffer = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=buffer_days)).strftime('%Y-%m-%d')
+            total_values = pd.Series(
+                compute_portfolio_values(holdings, date_range, exchange_rate, start_with_buffer),
+                index=date_range
+            )
+            recomputed = True
         evolution_list = [
             {'date': d.strftime('%Y-%m-%d'), 'value': float(v)}
             for d, v in total_values.items()
         ]
         evolution_list.sort(key=lambda x: x['date'])
-        # Salva no cache persistente se usuário logado
-        if user_id:
-            for entry in evolution_list:
-                date_obj = datetime.strptime(entry['date'], '%Y-%m-%d').date()
-                obj = PortfolioEvolutionCache.query.filter_by(user_id=user_id, date=date_obj).first()
-                if obj:
-                    obj.total_value = entry['value']
-                    obj.last_updated = datetime.now()
-                else:
-                    db.session.add(PortfolioEvolutionCache(
-                        user_id=user_id,
-                        date=date_obj,
-                        total_value=entry['value'],
-                        last_updated=datetime.now()
-                    ))
+        # Salva no cache persistente se usuário logado e houve recálculo (um único upsert em lote)
+        if user_id and recomputed:
+            now = datetime.now()
+            bulk_upsert(
+                PortfolioEvolutionCache,
+                [
+                    {'user_id': user_id, 'date': datetime.strptime(entry['date'], '%Y-%m-%d').date(),
+                     'total_value': entry['value'], 'last_updated': now}
+                    for entry in evolution_list
+                ],
+                ['user_id', 'date'],
+                ['total_value', 'last_updated']
+            )
             db.session.commit()
         return evolution_list
     except Exception as e:
         print(f"Erro ao calcular evolução do portfólio (multi-ticker): {e}")
+        db.session.rollback()
         # Fallback: tenta servir do cache persistente se possível
         if user_id:
             try:
-                start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-                end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                days_diff = (end_date_obj - start_date_obj).days
-                if days_diff > 365:
-                    freq = 'W-MON'
-                elif days_diff > 90:
-                    freq = '3D'
-                else:
-                    freq = 'D'
-                date_range = pd.date_range(start=start_date, end=end_date, freq=freq)
-                if end_date_obj not in date_range:
-                    date_range = date_range.append(pd.DatetimeIndex([end_date_obj]))
+                date_range = build_evolution_date_range(start_date, end_date)
                 cached = PortfolioEvolutionCache.query.filter_by(user_id=user_id).order_by(PortfolioEvolutionCache.date.asc()).all()
                 if cached:
                     print("[FALLBACK] Servindo evolução do portfólio do cache persistente devido a erro no yfinance.")
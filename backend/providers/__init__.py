@@ -0,0 +1,42 @@
+from .base import MarketDataProvider, ProviderResult, unavailable_tickers
+from .yfinance_provider import YFinanceProvider
+from .local_provider import LocalFileProvider, write_synthetic_fixtures
+from utils.async_fetcher import configure_fetcher
+from utils.rate_limiter import configure_rate_limits
+
+# Provedor ativo no processo
+_provider = None
+
+def init_market_data(app):
+    """
+    Configura o provedor de dados de mercado conforme a configuração da aplicação.
+    MARKET_DATA_PROVIDER='local' usa os arquivos em MARKET_DATA_DIR; qualquer outro
+    valor usa o yfinance. Também aplica os limites de requisições e de concorrência
+    das consultas ao provedor.
+    """
+    configure_rate_limits(app.config)
+    configure_fetcher(app.config)
+    if app.config.get('MARKET_DATA_PROVIDER') == 'local':
+        provider = LocalFileProvider(app.config['MARKET_DATA_DIR'])
+    else:
+        provider = YFinanceProvider()
+    set_market_data_provider(provider)
+    print(f"[MARKETDATA] Provedor de dados de mercado: {provider.name}")
+    return provider
+
+def set_market_data_provider(provider):
+    """Substitui o provedor de dados de mercado ativo."""
+    global _provider
+    _provider = provider
+
+def get_market_data_provider():
+    """
+    Retorna o provedor de dados de mercado ativo (yfinance se nenhum foi configurado).
+
+    Returns:
+        MarketDataProvider: Provedor ativo
+    """
+    global _provider
+    if _provider is None:
+        _provider = YFinanceProvider()
+    return _provider
@@ -0,0 +1,129 @@
+"""
+Interface comum para provedores de dados de mercado.
+
+Todos os métodos trabalham em lote: recebem uma lista de tickers já formatados
+(ver utils.ticker_utils.format_ticker) e devolvem resultados indexados por ticker.
+Tickers sem dados são simplesmente omitidos dos resultados; tickers que não
+puderam ser consultados (lote com erro, rate limit ou disjuntor aberto) também
+são omitidos, mas ficam em ProviderResult.unavailable.
+"""
+import pandas as pd
+
+# Colunas padronizadas do histórico diário
+HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# Colunas padronizadas dos eventos corporativos
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+
+class ProviderResult(dict):
+    """Resultado por ticker de um provedor, com os tickers que não puderam ser consultados."""
+
+    def __init__(self, data=None, unavailable=()):
+        super().__init__(data or {})
+        self.unavailable = set(unavailable)
+
+def unavailable_tickers(result):
+    """Tickers não consultados em um resultado de provedor (vazio para dicionários simples)."""
+    return getattr(result, 'unavailable', set())
+
+class MarketDataProvider:
+    """Classe base para provedores de cotações, históricos e eventos corporativos."""
+
+    name = 'base'
+
+    def get_quotes(self, tickers):
+        """
+        Obtém o último preço de cada ticker.
+
+        Args:
+            tickers (list): Lista de tickers
+
+        Returns:
+            dict: Mapa ticker -> último preço
+        """
+        raise NotImplementedError
+
+    def get_history(self, tickers, start, end=None):
+        """
+        Obtém o histórico diário (OHLC, fechamento ajustado e volume) de cada ticker.
+
+        Args:
+            tickers (list): Lista de tickers
+            start (str): Data inicial (YYYY-MM-DD), inclusiva
+            end (str, optional): Data final (YYYY-MM-DD), exclusiva como no yfinance
+
+        Returns:
+            dict: Mapa ticker -> DataFrame com as colunas de HISTORY_COLUMNS e índice de datas sem fuso
+        """
+        raise NotImplementedError
+
+    def get_corporate_actions(self, tickers, start, end=None):
+        """
+        Obtém os eventos corporativos (dividendos e desdobramentos) de cada ticker.
+
+        Args:
+            tickers (list): Lista de tickers
+            start (str): Data inicial (YYYY-MM-DD), inclusiva
+            end (str, optional): Data final (YYYY-MM-DD), exclusiva
+
+        Returns:
+            dict: Mapa ticker -> DataFrame com as colunas de ACTION_COLUMNS, apenas datas com eventos
+        """
+        raise NotImplementedError
+
+    def validate_symbols(self, tickers):
+        """
+        Verifica se os tickers existem no provedor.
+
+        Args:
+            tickers (list): Lista de tickers
+
+        Returns:
+            dict: Mapa ticker -> bool. Tickers que não puderam ser verificados
+                  (erro de rede, por exemplo) são omitidos.
+        """
+        raise NotImplementedError
+
+    def ping(self):
+        """
+        Testa a conectividade com o provedor.
+
+        Returns:
+            bool: True se o provedor estiver respondendo
+        """
+        return True
+
+    def get_closes(self, tickers, start, end=None, field='Close'):
+        """
+        Monta a matriz de preços (datas x tickers) a partir de get_history.
+
+        Args:
+            tickers (list): Lista de tickers
+            start (str): Data inicial (YYYY-MM-DD)
+            end (str, optional): Data final (YYYY-MM-DD), exclusiva
+            field (str): Coluna do histórico a usar ('Close' ou 'Adj Close')
+
+        Returns:
+            pandas.DataFrame: Matriz de preços; tickers sem dados não aparecem nas colunas
+        """
+        history = self.get_history(tickers, start, end)
+        columns = {ticker: frame[field] for ticker, frame in history.items() if field in frame and not frame.empty}
+        if not columns:
+            return pd.DataFrame()
+        return pd.DataFrame(columns).sort_index()
+
+def normalize_frame(df, columns):
+    """
+    Padroniza um DataFrame de provedor: índice de datas sem fuso, ordenado,
+    sem duplicatas, e apenas as colunas informadas (faltantes viram NaN).
+    """
+    df = df.copy()
+    df.index = pd.to_datetime(df.index)
+    if getattr(df.index, 'tz', None) is not None:
+        df.index = df.index.tz_localize(None)
+    df.index = df.index.normalize()
+    df.index.name = 'Date'
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    if 'Adj Close' in columns and 'Adj Close' not in df.columns and 'Close' in df.columns:
+        df['Adj Close'] = df['Close']
+    return df.reindex(columns=columns)
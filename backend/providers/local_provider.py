@@ -0,0 +1,136 @@
+"""
+Provedor de dados de mercado determinístico, baseado em arquivos locais.
+
+Permite medir desempenho e fazer testes de carga dos pipelines de preços,
+evolução e dividendos sem acesso à rede nem limites de requisição.
+
+Estrutura do diretório de dados:
+    <base_dir>/history/<TICKER>.csv   Date,Open,High,Low,Close,Adj Close,Volume
+    <base_dir>/actions/<TICKER>.csv   Date,Dividends,Stock Splits
+"""
+import os
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .base import MarketDataProvider, HISTORY_COLUMNS, ACTION_COLUMNS, normalize_frame
+
+class LocalFileProvider(MarketDataProvider):
+    """Provedor que lê históricos e eventos corporativos de arquivos CSV em disco."""
+
+    name = 'local'
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _path(self, kind, ticker):
+        return os.path.join(self.base_dir, kind, f"{ticker}.csv")
+
+    def _load(self, kind, ticker, columns):
+        """Lê (e mantém em memória) o arquivo de um ticker; None se não existir."""
+        key = (kind, ticker)
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+        path = self._path(kind, ticker)
+        frame = None
+        if os.path.exists(path):
+            try:
+                frame = normalize_frame(pd.read_csv(path, index_col='Date', parse_dates=True), columns)
+            except Exception as e:
+                print(f"[LOCALDATA] Erro ao ler {path}: {e}")
+        with self._lock:
+            self._frames[key] = frame
+        return frame
+
+    @staticmethod
+    def _slice(frame, start, end):
+        frame = frame.loc[frame.index >= pd.Timestamp(start)]
+        if end is not None:
+            frame = frame.loc[frame.index < pd.Timestamp(end)]
+        return frame
+
+    def get_quotes(self, tickers):
+        quotes = {}
+        for ticker in dict.fromkeys(tickers):
+            frame = self._load('history', ticker, HISTORY_COLUMNS)
+            if frame is None:
+                continue
+            closes = frame['Close'].dropna()
+            if not closes.empty:
+                quotes[ticker] = float(closes.iloc[-1])
+        return quotes
+
+    def get_history(self, tickers, start, end=None):
+        history = {}
+        for ticker in dict.fromkeys(tickers):
+            frame = self._load('history', ticker, HISTORY_COLUMNS)
+            if frame is None:
+                continue
+            frame = self._slice(frame, start, end).dropna(how='all')
+            if not frame.empty:
+                history[ticker] = frame.copy()
+        return history
+
+    def get_corporate_actions(self, tickers, start, end=None):
+        actions = {}
+        for ticker in dict.fromkeys(tickers):
+            frame = self._load('actions', ticker, ACTION_COLUMNS)
+            if frame is None:
+                continue
+            frame = self._slice(frame, start, end).fillna(0.0)
+            frame = frame[(frame != 0).any(axis=1)]
+            if not frame.empty:
+                actions[ticker] = frame.copy()
+        return actions
+
+    def validate_symbols(self, tickers):
+        return {ticker: os.path.exists(self._path('history', ticker)) for ticker in dict.fromkeys(tickers)}
+
+def write_synthetic_fixtures(base_dir, tickers, start, end, seed=0):
+    """
+    Gera arquivos determinísticos de histórico e dividendos para o LocalFileProvider.
+    Os preços seguem um passeio aleatório geométrico em dias úteis, com semente
+    derivada de (seed, ticker), e ações pagam um dividendo por trimestre.
+
+    Args:
+        base_dir (str): Diretório de dados do provedor local
+        tickers (list): Tickers formatados a gerar
+        start (str): Data inicial (YYYY-MM-DD)
+        end (str): Data final (YYYY-MM-DD), inclusiva
+        seed (int): Semente global
+    """
+    os.makedirs(os.path.join(base_dir, 'history'), exist_ok=True)
+    os.makedirs(os.path.join(base_dir, 'actions'), exist_ok=True)
+    dates = pd.bdate_range(start=start, end=end)
+
+    for ticker in tickers:
+        rng = np.random.default_rng([seed, zlib.crc32(ticker.encode('utf-8'))])
+        is_fx = '=' in ticker
+        first_price = 5.0 if is_fx else rng.uniform(10, 200)
+        volatility = 0.005 if is_fx else 0.02
+        close = first_price * np.exp(np.cumsum(rng.normal(0.0002, volatility, len(dates))))
+        spread = np.abs(rng.normal(0, volatility, len(dates))) * close
+        open_ = close * (1 + rng.normal(0, volatility / 2, len(dates)))
+        history = pd.DataFrame({
+            'Open': open_,
+            'High': np.maximum(open_, close) + spread,
+            'Low': np.minimum(open_, close) - spread,
+            'Close': close,
+            'Adj Close': close,
+            'Volume': rng.integers(1_000, 1_000_000, len(dates)) if not is_fx else 0
+        }, index=pd.DatetimeIndex(dates, name='Date'))
+        history.round(4).to_csv(os.path.join(base_dir, 'history', f"{ticker}.csv"))
+
+        if is_fx:
+            continue
+        event_dates = dates[int(rng.integers(0, 63))::63]
+        actions = pd.DataFrame({
+            'Dividends': (history.loc[event_dates, 'Close'] * rng.uniform(0.005, 0.02)).round(4),
+            'Stock Splits': 0.0
+        }, index=pd.DatetimeIndex(event_dates, name='Date'))
+        actions.to_csv(os.path.join(base_dir, 'actions', f"{ticker}.csv"))
@@ -0,0 +1,227 @@
+"""
+Provedor de dados de mercado baseado no yfinance.
+
+Todas as consultas usam yf.download multi-símbolo, divididas em lotes de
+chunk_size tickers, de modo que o número de requisições cresce com o número
+de lotes e não com o número de tickers. Os lotes são buscados ao mesmo tempo
+pela camada assíncrona (utils.async_fetcher), cada um aguardando uma ficha do
+limitador de requisições; tickers com disjuntor aberto não são consultados.
+"""
+import pandas as pd
+import yfinance as yf
+
+from utils.cache_utils import is_rate_limited, handle_rate_limit
+from utils.async_fetcher import fetcher
+from utils.rate_limiter import request_limiter, ticker_breakers
+from .base import MarketDataProvider, ProviderResult, HISTORY_COLUMNS, ACTION_COLUMNS, normalize_frame
+
+# Quantidade máxima de tickers por requisição multi-símbolo ao yfinance
+QUOTE_CHUNK_SIZE = 50
+
+# Timeout de cada requisição HTTP do yf.download (segundos)
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+def _log_download_error(error):
+    """Registra um erro do yf.download e aciona a pausa se for rate limit."""
+    error_msg = str(error)
+    if 'possibly delisted' in error_msg or 'no price data found' in error_msg:
+        print(f"[YFINANCE] YFPricesMissingError (simulado): {error}")
+    elif 'HTTP Error' in error_msg:
+        print(f"[YFINANCE] HTTPError: {error}")
+    elif 'timed out' in error_msg or isinstance(error, TimeoutError):
+        print(f"[YFINANCE] Timeout: {error}")
+    else:
+        print(f"[YFINANCE] Erro inesperado no download do yfinance: {error}")
+    if 'rate limit' in error_msg.lower() or 'too many requests' in error_msg.lower():
+        handle_rate_limit()
+
+def split_by_ticker(df, tickers):
+    """
+    Separa um DataFrame do yf.download em um DataFrame por ticker.
+
+    Args:
+        df (pandas.DataFrame): Resultado do yf.download (group_by='ticker' ou padrão)
+        tickers (list): Tickers solicitados
+
+    Returns:
+        dict: Mapa ticker -> DataFrame com as colunas do yfinance (linhas vazias removidas)
+    """
+    frames = {}
+    if df is None or df.empty:
+        return frames
+    if isinstance(df.columns, pd.MultiIndex):
+        # group_by='ticker' gera (ticker, campo); o padrão do yfinance gera (campo, ticker)
+        ticker_level = 0 if set(tickers) & set(df.columns.get_level_values(0)) else 1
+        available = set(df.columns.get_level_values(ticker_level))
+        for ticker in tickers:
+            if ticker in available:
+                frame = df.xs(ticker, axis=1, level=ticker_level).dropna(how='all')
+                if not frame.empty:
+                    frames[ticker] = frame
+    elif len(tickers) == 1:
+        frame = df.dropna(how='all')
+        if not frame.empty:
+            frames[tickers[0]] = frame
+    return frames
+
+def tickers_with_data(df, tickers):
+    """
+    Identifica, com operações vetorizadas, os tickers que têm algum valor no resultado.
+
+    Args:
+        df (pandas.DataFrame): Resultado do yf.download
+        tickers (list): Tickers solicitados
+
+    Returns:
+        set: Tickers com ao menos um valor não nulo
+    """
+    if df is None or df.empty:
+        return set()
+    if isinstance(df.columns, pd.MultiIndex):
+        ticker_level = 0 if set(tickers) & set(df.columns.get_level_values(0)) else 1
+        present = df.notna().any(axis=0).groupby(level=ticker_level).any()
+        return set(present.index[present]) & set(tickers)
+    if len(tickers) == 1 and df.notna().any().any():
+        return set(tickers)
+    return set()
+
+def last_closes(df, tickers):
+    """
+    Extrai o último fechamento válido de cada ticker com operações vetorizadas
+    (seleção das colunas Close, forward-fill e última linha).
+
+    Args:
+        df (pandas.DataFrame): Resultado do yf.download
+        tickers (list): Tickers solicitados
+
+    Returns:
+        dict: Mapa ticker -> último preço de fechamento
+    """
+    if df is None or df.empty:
+        return {}
+    if isinstance(df.columns, pd.MultiIndex):
+        field_level = 1 if 'Close' in df.columns.get_level_values(1) else 0
+        if 'Close' not in df.columns.get_level_values(field_level):
+            return {}
+        closes = df.xs('Close', axis=1, level=field_level)
+    elif 'Close' in df.columns and len(tickers) == 1:
+        closes = df[['Close']].set_axis(list(tickers), axis=1)
+    else:
+        return {}
+    last = closes.ffill().iloc[-1]
+    last = last[last.index.isin(tickers) & last.notna()]
+    return {ticker: float(price) for ticker, price in last.items()}
+
+class YFinanceProvider(MarketDataProvider):
+    """Provedor que consulta o Yahoo Finance via yfinance."""
+
+    name = 'yfinance'
+
+    def __init__(self, chunk_size=QUOTE_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def _fetch_chunk(self, chunk, **kwargs):
+        """Busca um lote no ritmo do limitador; retorna None se a pausa por rate limit estiver ativa."""
+        if is_rate_limited():
+            return None
+        request_limiter.acquire()
+        # O yfinance reaproveita a mesma sessão HTTP (e cookies) em todas as threads
+        df = yf.download(
+            tickers=chunk, interval='1d', group_by='ticker', progress=False, threads=True,
+            timeout=DOWNLOAD_TIMEOUT_SECONDS, **kwargs
+        )
+        return df if df is not None else pd.DataFrame()
+
+    def _download(self, tickers, breakers=True, track_missing=False, **kwargs):
+        """
+        Executa yf.download em lotes de chunk_size tickers, todos submetidos de uma
+        vez à camada assíncrona e no ritmo do limitador de requisições.
+
+        Args:
+            tickers (list): Tickers a consultar
+            breakers (bool): Se True, ignora tickers com disjuntor aberto e registra
+                o resultado de cada ticker
+            track_missing (bool): Se True, tickers sem dados contam como falha no
+                disjuntor (apenas consultas em que todo ticker válido tem dados)
+
+        Returns:
+            tuple: (lista de tuplas (tickers do lote, DataFrame) dos lotes que responderam,
+                set de tickers não consultados: disjuntor aberto, rate limit ou lote com erro)
+        """
+        tickers = list(dict.fromkeys(tickers))
+        unavailable = set()
+        if breakers:
+            allowed = ticker_breakers.allowed(tickers)
+            if len(allowed) < len(tickers):
+                print(f"[YFINANCE] {len(tickers) - len(allowed)} tickers ignorados (disjuntor aberto)")
+                unavailable.update(set(tickers) - set(allowed))
+            tickers = allowed
+        if not tickers:
+            return [], unavailable
+        if is_rate_limited():
+            return [], unavailable | set(tickers)
+
+        chunks = [tickers[start:start + self.chunk_size] for start in range(0, len(tickers), self.chunk_size)]
+        responses = fetcher.run_all([
+            lambda chunk=chunk: self._fetch_chunk(chunk, **kwargs) for chunk in chunks
+        ])
+        results = []
+        for chunk, df in zip(chunks, responses):
+            if df is None:
+                print(f"[YFINANCE] Rate limit atingido, lote de {len(chunk)} tickers não consultado")
+                unavailable.update(chunk)
+                continue
+            if isinstance(df, Exception):
+                # Falha do lote inteiro não é atribuída a nenhum ticker no disjuntor
+                _log_download_error(df)
+                unavailable.update(chunk)
+                continue
+            if breakers:
+                present = tickers_with_data(df, chunk)
+                # Lote sem nenhum dado indica falha do provedor, não dos tickers
+                missing = [t for t in chunk if t not in present] if track_missing and present else []
+                ticker_breakers.record(present, missing)
+            request_limiter.reward()
+            # Um lote vazio também é resposta válida: nenhum dos tickers tem dados
+            results.append((chunk, df))
+        return results, unavailable
+
+    def get_quotes(self, tickers):
+        # Período de 30 dias para evitar problemas de série vazia em ativos pouco líquidos
+        results, unavailable = self._download(tickers, track_missing=True, period='30d')
+        quotes = ProviderResult(unavailable=unavailable)
+        for chunk, df in results:
+            quotes.update(last_closes(df, chunk))
+        return quotes
+
+    def get_history(self, tickers, start, end=None):
+        results, unavailable = self._download(tickers, start=start, end=end, auto_adjust=False)
+        history = ProviderResult(unavailable=unavailable)
+        for chunk, df in results:
+            for ticker, frame in split_by_ticker(df, chunk).items():
+                history[ticker] = normalize_frame(frame, HISTORY_COLUMNS)
+        return history
+
+    def get_corporate_actions(self, tickers, start, end=None):
+        results, unavailable = self._download(tickers, start=start, end=end, actions=True)
+        actions = ProviderResult(unavailable=unavailable)
+        for chunk, df in results:
+            for ticker, frame in split_by_ticker(df, chunk).items():
+                frame = normalize_frame(frame, ACTION_COLUMNS).fillna(0.0)
+                frame = frame[(frame != 0).any(axis=1)]
+                if not frame.empty:
+                    actions[ticker] = frame
+        return actions
+
+    def validate_symbols(self, tickers):
+        checked = {}
+        # A validação consulta todos os tickers, inclusive os bloqueados pelo disjuntor
+        results, _ = self._download(tickers, breakers=False, period='5d')
+        for chunk, df in results:
+            found = last_closes(df, chunk)
+            for ticker in chunk:
+                checked[ticker] = ticker in found
+        return checked
+
+    def ping(self):
+        return bool(self.get_quotes(['AAPL']))
@@ -10,10 +10,11 @@ from flask import Blueprint, request, jsonify, session
 
 from extensions.database import db
 from models.portfolio import Portfolio, PortfolioEvolutionCache
-from models.price import PriceCache
-from services.price_service import get_cached_dollar_rate
-from utils.ticker_utils import format_ticker
-from utils.cache_utils import get_from_evolution_cache, set_evolution_cache, is_rate_limited
+from services import price_cache_service
+from services.holdings_service import get_holdings_timeline
+from services.price_service import get_cached_dollar_rate, schedule_price_refresh
+from utils.ticker_utils import format_ticker, resolve_symbol
+from utils.cache_utils import get_cached_response, is_rate_limited
 
 # Importar o módulo de evolução do portfólio
 try:
@@ -53,32 +54,58 @@ def portfolio_summary():
         start_date_obj = end_date_obj - max_period
         start_date = start_date_obj.strftime('%Y-%m-%d')
     
+    # Resposta do cache; desatualizada (stale) enquanto é recalculada em segundo plano
+    cache_key = f"{user_id}:{start_date}:{end_date}"
+    response_data, stale = get_cached_response(
+        'evolution', cache_key,
+        lambda: build_portfolio_summary(user_id, start_date, end_date),
+        user_id
+    )
+    if response_data is None:
+        return jsonify({'summary': {}, 'assets': [], 'evolution': []}), 200
+    return jsonify(dict(response_data, stale=stale)), 200
+
+def build_portfolio_summary(user_id, start_date, end_date):
+    """
+    Calcula o resumo, a performance dos ativos e a evolução do portfólio.
+    Não depende da requisição nem da sessão, podendo rodar em segundo plano.
+    
+    Args:
+        user_id (str): ID do usuário
+        start_date (str): Data inicial (YYYY-MM-DD)
+        end_date (str): Data final (YYYY-MM-DD)
+        
+    Returns:
+        dict: Resposta de /portfolio-summary, ou None se não houver carteira válida
+    """
+    portfolio = Portfolio.query.filter_by(user_id=user_id).order_by(Portfolio.uploaded_at.desc()).first()
+    if not portfolio:
+        return None
+
     # Carrega os dados do portfólio
     try:
         portfolio_data = json.loads(portfolio.data)
     except Exception as e:
         print(f"Erro ao decodificar os dados do portfólio: {e}")
-        return jsonify({'summary': {}, 'assets': [], 'evolution': []}), 200
-
-    # Verificar cache
-    cache_key = f"{user_id}:{start_date}:{end_date}"
-    cached_data = get_from_evolution_cache(cache_key)
-    if cached_data:
-        return jsonify(cached_data), 200
+        return None
 
     # Verificar rate limit
     is_rate_limited_flag = is_rate_limited()
 
-    # Busca preços do cache
-    price_cache = {p.ticker: p.price for p in PriceCache.query.all()}
-    exch_rate = get_cached_dollar_rate()
+    # Lê uma fotografia consistente dos preços do cache, sem acessar a rede
+    price_snapshot = price_cache_service.get_many([asset['ticker'] for asset in portfolio_data])
+    exch_rate = get_cached_dollar_rate(background=True)
 
-    # Busca preços faltantes
-    if not is_rate_limited_flag:
-        update_missing_prices(portfolio_data, price_cache)
+    # Preços desatualizados ou ausentes são atualizados em segundo plano
+    outdated_tickers = [t for t, entry in price_snapshot.items() if entry['status'] != 'fresh']
+    refresh_scheduled = 0
+    if outdated_tickers and not is_rate_limited_flag:
+        refresh_scheduled = schedule_price_refresh(outdated_tickers)
 
     # Calcula performance dos ativos
-    assets_performance, summary = calculate_assets_performance(portfolio_data, price_cache, exch_rate)
+    assets_performance, summary = calculate_assets_performance(portfolio_data, price_snapshot, exch_rate)
+    summary['prices_refresh_pending'] = len(outdated_tickers)
+    summary['prices_refresh_scheduled'] = refresh_scheduled
 
     # Calcula evolução do portfólio
     evolution_list = []
@@ -99,7 +126,10 @@ def portfolio_summary():
                 start_date=start_date,
                 end_date=end_date,
                 exchange_rate=exch_rate,
-                format_ticker_func=format_ticker
+                format_ticker_func=format_ticker,
+                user_id=user_id,
+                # Quantidades de cada data conforme o histórico de fotografias da carteira
+                holdings=get_holdings_timeline(user_id, version=portfolio.id)
             )
             
         if not evolution_list or len(evolution_list) < 2:
@@ -110,91 +140,39 @@ def portfolio_summary():
         evolution_list = None
 
     # Monta resposta final
-    response_data = {
+    return {
         'summary': summary,
         'assets': assets_performance,
         'evolution': evolution_list
     }
-    
-    # Salva no cache
-    set_evolution_cache(cache_key, response_data)
-    
-    return jsonify(response_data), 200
-
-def update_missing_prices(portfolio_data, price_cache):
-    """Atualiza preços faltantes do cache."""
-    from services.price_service import get_price
-    
-    missing_tickers = []
-    for asset in portfolio_data:
-        ticker_orig = asset['ticker'].strip().upper()
-        if ticker_orig not in price_cache:
-            missing_tickers.append(ticker_orig)
-            
-    if missing_tickers:
-        print(f"Buscando preços para ativos não presentes no cache: {missing_tickers}")
-        for ticker in missing_tickers:
-            price = get_price(ticker)
-            if price is not None:
-                price_cache[ticker] = price
-                # Atualiza no banco
-                obj = PriceCache.query.filter_by(ticker=ticker).first()
-                if obj:
-                    obj.price = price
-                    obj.last_updated = datetime.now()
-                    db.session.commit()
-                else:
-                    db.session.add(PriceCache(
-                        user_id=None,
-                        ticker=ticker,
-                        price=price,
-                        last_updated=datetime.now()
-                    ))
-                    db.session.commit()
 
-def calculate_assets_performance(portfolio_data, price_cache, exch_rate):
-    """Calcula a performance dos ativos e retorna resumo."""
-    from services.price_service import get_price
+def calculate_assets_performance(portfolio_data, price_snapshot, exch_rate):
+    """
+    Calcula a performance dos ativos e retorna resumo.
+    Usa apenas a fotografia de preços recebida (ver price_cache_service.get_many), sem
+    chamadas de rede nem gravações no banco, e informa a atualidade de cada preço.
+    """
     total_invested = 0.0
     total_current_value = 0.0
     assets_performance = []
     
     for asset in portfolio_data:
         ticker_orig = asset['ticker'].strip().upper()
-        final_ticker = format_ticker(ticker_orig)
+        symbol = resolve_symbol(ticker_orig)
+        final_ticker = symbol.ticker
         try:
             avg_price = float(asset.get('preco_medio', 0))
             quantity = float(asset.get('quantidade', 0))
         except:
             continue
 
-        is_bdr = False
-        is_us = False
-        if final_ticker.endswith('.SA'):
-            if final_ticker.endswith('34.SA') or final_ticker.endswith('35.SA') or final_ticker.endswith('32.SA'):
-                is_bdr = True
-        else:
-            is_us = True
+        # Classificação memorizada na tabela canônica de símbolos
+        is_bdr = symbol.type == 'BDR'
+        is_us = symbol.currency == 'USD'
 
-        # Busca preço mais recente do yfinance (ou cache se falhar)
-        current_price_original = get_price(ticker_orig) or price_cache.get(ticker_orig) or price_cache.get(final_ticker) or avg_price
-        price_cache[ticker_orig] = current_price_original  # Atualiza cache local
-
-        # Atualiza o banco de dados PriceCache sempre que buscar um preço novo
-        obj = PriceCache.query.filter_by(ticker=ticker_orig).first()
-        if obj:
-            if obj.price != current_price_original:
-                obj.price = current_price_original
-                obj.last_updated = datetime.now()
-                db.session.commit()
-        else:
-            db.session.add(PriceCache(
-                user_id=None,
-                ticker=ticker_orig,
-                price=current_price_original,
-                last_updated=datetime.now()
-            ))
-            db.session.commit()
+        # Preço da fotografia do cache; sem preço, usa o preço médio
+        price_entry = price_snapshot.get(final_ticker) or {'price': None, 'last_updated': None, 'age_seconds': None, 'status': 'missing'}
+        current_price_original = price_entry['price'] or avg_price
 
         if is_us:
             invested_value = avg_price * quantity * exch_rate
@@ -218,7 +196,10 @@ def calculate_assets_performance(portfolio_data, price_cache, exch_rate):
             'current_value': current_value,
             'return_pct': return_pct,
             'is_us_ticker': is_us,
-            'is_bdr': is_bdr
+            'is_bdr': is_bdr,
+            'price_status': price_entry['status'],
+            'price_updated_at': price_entry['last_updated'].isoformat() if price_entry['last_updated'] else None,
+            'price_age_seconds': round(price_entry['age_seconds']) if price_entry['age_seconds'] is not None else None
         })
 
     # Calcula indicadores gerais
@@ -240,6 +221,10 @@ def calculate_assets_performance(portfolio_data, price_cache, exch_rate):
         best_return_pct = None
         worst_return_pct = None
 
+    # Preço mais antigo usado no cálculo
+    price_dates = [price_snapshot[a['final_ticker']]['last_updated'] for a in assets_performance
+                   if a['final_ticker'] in price_snapshot and price_snapshot[a['final_ticker']]['last_updated']]
+
     # Monta resumo
     summary = {
         'total_invested': total_invested,
@@ -252,7 +237,8 @@ def calculate_assets_performance(portfolio_data, price_cache, exch_rate):
         'best_asset_return_pct': best_return_pct,
         'worst_asset': worst_ticker,
         'worst_asset_return_pct': worst_return_pct,
-        'updated_at': datetime.now().isoformat()
+        'updated_at': datetime.now().isoformat(),
+        'prices_as_of': min(price_dates).isoformat() if price_dates else None
     }
     
     return assets_performance, summary
\ No newline at end of file
@@ -11,7 +11,7 @@ from flask import Blueprint, request, jsonify, session
 
 from services.auth_service import (
     register_user, login_user, logout_user, 
-    get_current_user, check_session_timeout
+    get_current_user, check_session_timeout, touch_user
 )
 
 # Criação do Blueprint para autenticação
@@ -24,6 +24,11 @@ def before_request():
     if result:
         return jsonify(result[0]), result[1]
 
+@auth_bp.before_app_request
+def track_activity():
+    """Registra o último acesso do usuário autenticado (prioridade de atualização de preços)."""
+    touch_user(session.get('user_id'))
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Endpoint para registro de novos usuários."""
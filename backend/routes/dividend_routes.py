@@ -11,8 +11,9 @@ from flask import Blueprint, request, jsonify, session
 
 from services.dividend_service import (
     get_user_dividends, set_dividend_receipt_status,
-    get_dividend_receipt_status
+    get_dividend_receipt_status, get_dividend_summary, get_dividend_summaries
 )
+from utils.cache_utils import get_cached_response
 
 # Criação do Blueprint para dividendos
 dividend_bp = Blueprint('dividends', __name__, url_prefix='/api')
@@ -26,9 +27,51 @@ def get_dividends():
         print("[DIVIDENDS] Erro: Usuário não autenticado na sessão!")
         return jsonify({'error': 'Usuário não autenticado'}), 401
 
+    year = request.args.get('year', type=int)
+    month = request.args.get('month', type=int)
+    if month is not None and (year is None or not 1 <= month <= 12):
+        return jsonify({'error': 'Mês inválido'}), 400
+
     print(f"[DIVIDENDS] Buscando dividendos para usuário {user_id}")
-    dividends = get_user_dividends(user_id)
-    return jsonify({'dividends': dividends})
+    # Resposta do cache; desatualizada (stale) enquanto é recalculada em segundo plano
+    response, stale = get_cached_response(
+        'dividends', f"{user_id}:{year}:{month}",
+        lambda: {'dividends': get_user_dividends(user_id, year=year, month=month)},
+        user_id
+    )
+    return jsonify(dict(response, stale=stale))
+
+@dividend_bp.route('/dividends/summary', methods=['GET'])
+def get_dividends_summary():
+    """Endpoint com os totais de dividendos por mês, ano e ticker (recebidos e pendentes)."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Usuário não autenticado'}), 401
+
+    year = request.args.get('year', type=int)
+    response, stale = get_cached_response(
+        'dividends', f"{user_id}:summary:{year}",
+        lambda: get_dividend_summaries(user_id, year),
+        user_id
+    )
+    return jsonify(dict(response, stale=stale))
+
+@dividend_bp.route('/dividends/summary/<group_by>', methods=['GET'])
+def get_dividends_summary_by(group_by):
+    """Endpoint com os totais de dividendos em um agrupamento ('month', 'year' ou 'ticker')."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Usuário não autenticado'}), 401
+    if group_by not in ('month', 'year', 'ticker'):
+        return jsonify({'error': 'Agrupamento inválido'}), 400
+
+    year = request.args.get('year', type=int)
+    response, stale = get_cached_response(
+        'dividends', f"{user_id}:summary:{group_by}:{year}",
+        lambda: {'group_by': group_by, 'year': year, 'summary': get_dividend_summary(user_id, group_by, year)},
+        user_id
+    )
+    return jsonify(dict(response, stale=stale))
 
 @dividend_bp.route('/dividend-receipt', methods=['POST'])
 def set_dividend_receipt():
@@ -57,13 +100,3 @@ def get_dividend_receipts():
     
     receipts = get_dividend_receipt_status(user_id)
     return jsonify({'receipts': receipts})
-
-@dividend_bp.route('/debug/dividends-raw', methods=['GET'])
-def debug_dividends_raw():
-    """Endpoint de debug para ver dividendos brutos do banco."""
-    user_id = session.get('user_id')
-    if not user_id:
-        return jsonify({'error': 'Usuário não autenticado'}), 401
-    
-    all_divs = get_user_dividends(user_id)
-    return jsonify({'raw_dividends': all_divs})
\ No newline at end of file
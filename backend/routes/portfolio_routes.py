@@ -11,6 +11,7 @@ from services.portfolio_service import (
     register_transaction
 )
 from services.price_service import get_cached_dollar_rate
+from utils.cache_utils import get_cached_response
 
 # Criação do Blueprint para portfólio
 portfolio_bp = Blueprint('portfolio', __name__, url_prefix='/api')
@@ -37,7 +38,15 @@ def portfolio_distribution():
     if not user_id:
         return jsonify({'error': 'Usuário não autenticado'}), 401
         
-    response, status_code = get_portfolio_distribution(user_id)
+    # Resposta do cache; desatualizada (stale) enquanto é recalculada em segundo plano
+    (response, status_code), stale = get_cached_response(
+        'distribution', user_id,
+        lambda: get_portfolio_distribution(user_id),
+        user_id,
+        should_cache=lambda result: result[1] == 200
+    )
+    if status_code == 200:
+        response = dict(response, stale=stale)
     return jsonify(response), status_code
 
 @portfolio_bp.route('/register-aporte', methods=['POST'])
@@ -9,6 +9,12 @@ from datetime import datetime
 
 # Acesso ao scheduler para verificar status das atualizações
 from tasks.scheduler import last_price_update_time
+from services.price_service import get_quote_flight_stats
+from services.ticker_registry import get_registry_stats
+from services.refresh_planner import get_refresh_stats
+from utils.cache_utils import get_response_cache_stats
+from utils.rate_limiter import get_rate_limit_state
+from utils.async_fetcher import fetcher
 
 # Criação do Blueprint para status
 status_bp = Blueprint('status', __name__, url_prefix='/api')
@@ -30,5 +36,11 @@ def system_status():
             'last_update_minutes_ago': round(last_price_update_minutes, 1),
             'update_in_progress': price_update_in_progress
         },
+        'quote_fetches': get_quote_flight_stats(),
+        'response_caches': get_response_cache_stats(),
+        'rate_limits': get_rate_limit_state(),
+        'market_data_fetches': fetcher.stats(),
+        'failed_tickers': get_registry_stats(),
+        'price_refresh': get_refresh_stats(),
         'system_ready': True
     }), 200
@@ -3,16 +3,24 @@ from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import session, jsonify
 
-from extensions.database import db
-from models.user import User
+from extensions.database import db, bulk_upsert
+from models.user import User, UserActivity
 from models.portfolio import Portfolio
+from utils.cache_utils import LRUCache
 
-# Conjunto de IDs de usuários ativos
-active_user_ids = set()
+# Intervalo mínimo entre duas gravações do último acesso de um usuário (segundos)
+ACTIVITY_WRITE_SECONDS = 60
+
+# Último acesso gravado em UserActivity por este processo (user_id -> datetime UTC);
+# a entrada expira junto com o intervalo, liberando a próxima gravação
+_last_seen_written = LRUCache(max_entries=10000, ttl=ACTIVITY_WRITE_SECONDS)
 
 # Limite de sessão em minutos
 SESSION_TIMEOUT_MINUTES = 30
 
+# Janela em que um usuário sem sessão ativa ainda é considerado recente (dias)
+RECENT_USER_DAYS = 7
+
 def register_user(name, email, password):
     """
     Registra um novo usuário no sistema.
@@ -79,8 +87,8 @@ def login_user(email, password):
     session['last_activity'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
     session['authenticated'] = True
     
-    # Adiciona usuário à lista de ativos
-    active_user_ids.add(user.id)
+    # Registra o acesso (usuário passa a contar como ativo)
+    touch_user(user.id)
     
     # Verifica se o usuário tem portfólio
     has_portfolio = Portfolio.query.filter_by(user_id=user.id).first() is not None
@@ -102,7 +110,7 @@ def logout_user():
     """
     user_id = session.pop('user_id', None)
     if user_id:
-        active_user_ids.discard(user_id)
+        _record_activity(user_id, datetime.utcnow(), session_active=False)
         
     return {'message': 'Logout realizado com sucesso'}, 200
 
@@ -140,6 +148,7 @@ def check_session_timeout():
             last_activity = datetime.strptime(last_activity, '%Y-%m-%dT%H:%M:%S')
             if (now - last_activity) > timedelta(minutes=SESSION_TIMEOUT_MINUTES):
                 session.clear()
+                _last_seen_written.pop(user_id)
                 return {'error': 'Sessão expirada. Faça login novamente.'}, 401
         
         # Atualiza o timestamp da última atividade
@@ -147,6 +156,57 @@ def check_session_timeout():
     
     return None
 
+def _record_activity(user_id, now, session_active=True):
+    """Grava o último acesso do usuário (upsert), compartilhado entre processos."""
+    try:
+        bulk_upsert(
+            UserActivity,
+            [{'user_id': user_id, 'last_seen': now, 'session_active': session_active}],
+            ['user_id'], ['last_seen', 'session_active']
+        )
+        db.session.commit()
+        if session_active:
+            _last_seen_written.put(user_id, now)
+        else:
+            _last_seen_written.pop(user_id)
+    except Exception as e:
+        db.session.rollback()
+        print(f"[AUTH] Erro ao registrar acesso de {user_id}: {e}")
+
+def touch_user(user_id):
+    """
+    Registra o acesso de um usuário autenticado. O último acesso é gravado no
+    banco no máximo a cada ACTIVITY_WRITE_SECONDS por usuário.
+    
+    Args:
+        user_id (str): ID do usuário (None é ignorado)
+    """
+    if not user_id:
+        return
+    if _last_seen_written.get(user_id) is None:
+        _record_activity(user_id, datetime.utcnow())
+
+def get_user_activity_tiers():
+    """
+    Classifica os usuários conforme o último acesso gravado em UserActivity
+    (válido após reinícios e entre processos, como o do scheduler).
+    
+    Returns:
+        tuple: (set de usuários com sessão ativa, set de usuários vistos nos últimos RECENT_USER_DAYS dias)
+    """
+    now = datetime.utcnow()
+    rows = UserActivity.query.with_entities(
+        UserActivity.user_id, UserActivity.last_seen, UserActivity.session_active
+    ).filter(UserActivity.last_seen >= now - timedelta(days=RECENT_USER_DAYS))
+    active = set()
+    recent = set()
+    for user_id, last_seen, session_active in rows:
+        if session_active and now - last_seen <= timedelta(minutes=SESSION_TIMEOUT_MINUTES):
+            active.add(user_id)
+        else:
+            recent.add(user_id)
+    return active, recent
+
 def create_test_user():
     """
     Cria um usuário de teste se não existir.
@@ -0,0 +1,134 @@
+"""
+Eventos corporativos por ticker (tabela CorporateAction), compartilhados entre
+usuários. Cada ticker é consultado no provedor no máximo uma vez por dia,
+independentemente de quantos usuários o possuem, e apenas a partir da sua
+última consulta; os dividendos de cada usuário são derivados desses eventos
+(ver dividend_service).
+"""
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from extensions.database import db, bulk_upsert
+from models.dividends import CorporateAction, CorporateActionSync
+from providers import get_market_data_provider
+from utils.async_fetcher import run_batch
+from utils.cache_utils import is_rate_limited
+
+# Dias reconsultados antes da última consulta de cada ticker, para correções tardias
+ACTIONS_OVERLAP_DAYS = 30
+
+# Colunas do provedor (providers.base.ACTION_COLUMNS) -> tipo de evento gravado
+ACTION_EVENT_TYPES = {
+    'Dividends': 'Dividendo',
+    'Stock Splits': 'Desdobramento',
+}
+
+def _plan_fetches(tickers, start, today):
+    """
+    Agrupa pela data inicial da busca os tickers não consultados hoje: tickers novos
+    desde start e os demais a partir da última consulta, menos ACTIONS_OVERLAP_DAYS.
+
+    Returns:
+        tuple: (mapa data inicial -> lista de tickers, mapa ticker -> CorporateActionSync)
+    """
+    states = {s.ticker: s for s in CorporateActionSync.query.filter(CorporateActionSync.ticker.in_(tickers))}
+    plan = {}
+    for ticker in tickers:
+        state = states.get(ticker)
+        if state is None or start < state.first_date:
+            fetch_start = start
+        elif state.last_checked.date() < today:
+            fetch_start = max(start, state.last_checked.date() - timedelta(days=ACTIONS_OVERLAP_DAYS))
+        else:
+            continue
+        plan.setdefault(fetch_start, []).append(ticker)
+    return plan, states
+
+def _action_rows(actions):
+    """Converte os eventos do provedor em linhas da tabela CorporateAction."""
+    rows = []
+    for ticker, frame in actions.items():
+        for column, event_type in ACTION_EVENT_TYPES.items():
+            if column not in frame:
+                continue
+            values = frame[column]
+            values = values[values > 0]
+            rows.extend(
+                {'ticker': ticker, 'date': date.date(), 'event_type': event_type, 'value': float(value)}
+                for date, value in values.items()
+            )
+    return rows
+
+def sync_corporate_actions(tickers, start):
+    """
+    Atualiza os eventos corporativos dos tickers não consultados hoje. Cada ticker
+    é buscado apenas a partir da sua última consulta (com sobreposição para
+    correções tardias); tickers com a mesma data inicial vão no mesmo lote.
+
+    Args:
+        tickers (list): Tickers formatados
+        start (date): Data inicial dos eventos
+
+    Returns:
+        int: Quantidade de eventos gravados
+    """
+    tickers = sorted(set(tickers))
+    if not tickers or is_rate_limited():
+        return 0
+    now = datetime.now()
+    plan, states = _plan_fetches(tickers, start, now.date())
+    if not plan:
+        return 0
+
+    provider = get_market_data_provider()
+    responses = run_batch([
+        lambda fetch_start=fetch_start, group=group: provider.get_corporate_actions(group, start=fetch_start.strftime('%Y-%m-%d'))
+        for fetch_start, group in plan.items()
+    ])
+    rows = []
+    checked = []
+    errors = []
+    for (fetch_start, group), actions in zip(plan.items(), responses):
+        if isinstance(actions, Exception):
+            print(f"[ACTIONS] Erro ao buscar eventos de {len(group)} tickers desde {fetch_start}: {actions!r}")
+            errors.append(actions)
+            continue
+        rows.extend(_action_rows(actions))
+        # Apenas tickers presentes na resposta são marcados como consultados; os demais
+        # (sem eventos, lote com erro ou não consultados) buscam todo o intervalo na próxima vez
+        checked.extend(t for t in group if t in actions)
+
+    bulk_upsert(CorporateAction, rows, ['ticker', 'date', 'event_type'], ['value'])
+    for ticker in checked:
+        state = states.get(ticker)
+        if state is None:
+            db.session.add(CorporateActionSync(ticker=ticker, first_date=start, last_checked=now))
+            continue
+        state.first_date = min(state.first_date, start)
+        state.last_checked = now
+    db.session.commit()
+    print(f"[ACTIONS] {len(rows)} eventos corporativos gravados para {len(checked)} tickers")
+    if errors and not checked:
+        # Nenhum lote respondeu: repassa o erro para o tratamento de rate limit do chamador
+        raise errors[0]
+    return len(rows)
+
+def get_events(tickers, start, event_type='Dividendo'):
+    """
+    Lê os eventos corporativos dos tickers a partir da tabela compartilhada.
+
+    Args:
+        tickers (list): Tickers formatados
+        start (date): Data inicial
+        event_type (str): Tipo de evento ('Dividendo' ou 'Desdobramento')
+
+    Returns:
+        pandas.DataFrame: Colunas ticker, date e value
+    """
+    records = db.session.query(CorporateAction.ticker, CorporateAction.date, CorporateAction.value).filter(
+        CorporateAction.ticker.in_(list(tickers)),
+        CorporateAction.event_type == event_type,
+        CorporateAction.date >= start
+    ).all()
+    return pd.DataFrame(records, columns=['ticker', 'date', 'value'])
@@ -1,17 +1,26 @@
-from datetime import datetime
-import json
-import yfinance as yf
+from datetime import date, datetime, timedelta
 
-from extensions.database import db
-from models.dividends import DividendsCache, DividendReceiptStatus
+import numpy as np
+import pandas as pd
+
+from extensions.database import db, bulk_upsert
+from models.dividends import DividendsCache, DividendsSync, DividendReceiptStatus
 from models.portfolio import Portfolio
+from services.corporate_actions import ACTIONS_OVERLAP_DAYS, sync_corporate_actions, get_events
+from services.holdings_service import get_holdings_timeline
+from utils.cache_utils import is_rate_limited, reset_rate_limit, handle_rate_limit, clear_response_caches_for_user
 from utils.ticker_utils import format_ticker
-from utils.cache_utils import is_rate_limited, reset_rate_limit, handle_rate_limit
+
+# Data inicial dos dividendos buscados no provedor
+DIVIDENDS_START_DATE = datetime(2023, 1, 1)
 
 def update_dividends_cache_for_all_users():
     """
     Atualiza o cache de dividendos para todos os usuários.
-    Busca os dividendos desde 2023 utilizando o yfinance.
+    Os eventos corporativos ficam em uma tabela por ticker (ver services.corporate_actions),
+    consultada no provedor uma vez por dia por ticker; os dividendos de todos os
+    usuários pendentes são derivados da junção desses eventos com as posições
+    mantidas em cada data ex.
     """
     from models.user import User
     
@@ -21,10 +30,7 @@ def update_dividends_cache_for_all_users():
         return
         
     print('[DIVIDENDS] Verificando necessidade de atualização do cache de dividendos...')
-    
-    users = User.query.all()
-    for user in users:
-        update_dividends_for_user(user)
+    _update_dividends(User.query.all())
 
 def update_dividends_for_user(user):
     """
@@ -33,135 +39,305 @@ def update_dividends_for_user(user):
     Args:
         user (User): Usuário para atualizar os dividendos
     """
-    # Busca o portfólio mais recente do usuário
-    portfolio = Portfolio.query.filter_by(user_id=user.id).order_by(Portfolio.uploaded_at.desc()).first()
-    if not portfolio:
+    _update_dividends([user])
+
+def _update_dividends(users):
+    """Sincroniza os eventos dos tickers dos usuários pendentes e recalcula os seus dividendos."""
+    pending = []
+    for user in users:
+        holdings = _pending_dividend_holdings(user)
+        if holdings is not None and holdings[0].tickers:
+            pending.append((user, *holdings))
+    if not pending:
         return
         
+    start_date = DIVIDENDS_START_DATE.date()
+    # Inclui tickers já vendidos: os proventos do período em que eram mantidos continuam devidos
+    tickers = sorted({ticker for _, timeline, _ in pending for ticker in timeline.tickers})
     try:
-        portfolio_data = json.loads(portfolio.data)
-    except Exception:
-        return
+        sync_corporate_actions(tickers, start_date)
+        # Reset pausa se sucesso
+        reset_rate_limit()
+    except Exception as e:
+        db.session.rollback()
+        print(f'[DIVIDENDS] Erro ao buscar eventos corporativos de {len(tickers)} tickers: {e}')
+        if 'rate limit' in str(e).lower() or 'too many requests' in str(e).lower():
+            handle_rate_limit()
+        # Segue com os eventos já armazenados
+        
+    # Só são lidos os eventos a partir da janela mais antiga entre os usuários pendentes
+    events_start = min(start_date if since is None else since for _, _, since in pending)
+    _save_dividends(pending, get_events(tickers, events_start))
+
+def _pending_dividend_holdings(user):
+    """
+    Retorna a linha do tempo das posições do usuário se os dividendos ainda não
+    foram atualizados hoje ou se a carteira mudou desde a última atualização.
+    
+    Com a mesma fotografia do último recálculo, as posições passadas não mudaram e
+    só os eventos a partir do último evento conhecido (menos ACTIONS_OVERLAP_DAYS,
+    para correções tardias) precisam ser cruzados; com carteira nova, todos.
+    
+    Returns:
+        tuple: (HoldingsTimeline (ver holdings_service), date inicial dos eventos
+        ou None para recálculo completo), ou None se já atualizado
+    """
+    # Busca o portfólio mais recente do usuário
+    portfolio = Portfolio.query.with_entities(Portfolio.id, Portfolio.uploaded_at).filter_by(
+        user_id=user.id
+    ).order_by(Portfolio.uploaded_at.desc()).first()
+    if not portfolio:
+        return None
         
-    # Verifica se já atualizou dividendos hoje
-    today = datetime.now().date()
-    last_div = DividendsCache.query.filter_by(user_id=user.id).order_by(DividendsCache.last_updated.desc()).first()
-    if last_div and last_div.last_updated.date() >= today:
-        return  # Já atualizado hoje
+    # Verifica se já recalculou os dividendos hoje com a fotografia mais recente
+    sync = DividendsSync.query.filter_by(user_id=user.id).first()
+    if sync and sync.portfolio_id == portfolio.id and sync.last_computed.date() >= datetime.now().date():
+        return None  # Já atualizado hoje
         
-    # Prepara o mapa de tickers e quantidades
-    ticker_qty_map = {}
-    tickers = []
+    since = None
+    if sync and sync.portfolio_id == portfolio.id and sync.last_event_date:
+        since = sync.last_event_date - timedelta(days=ACTIONS_OVERLAP_DAYS)
+    return get_holdings_timeline(user.id, version=portfolio.id), since
+
+def _dividend_amounts(user, timeline, events):
+    """
+    Calcula os dividendos de um usuário com a quantidade mantida em cada data ex,
+    por uma junção as-of vetorizada (searchsorted) com as fotografias da carteira.
     
-    for asset in portfolio_data:
-        ticker_str = asset['ticker'].strip().upper()
-        final_ticker = format_ticker(ticker_str)
-        qty = float(asset.get('quantidade', 0))
-        ticker_qty_map[final_ticker] = {'ticker': ticker_str, 'quantity': int(qty)}
-        tickers.append(final_ticker)
+    Args:
+        user (User): Usuário
+        timeline (HoldingsTimeline): Linha do tempo das posições do usuário
+        events (pandas.DataFrame): Dividendos por ação (colunas ticker, date e value)
         
-    tickers = list(set(tickers))
-    start_date = datetime(2023, 1, 1)
-    dividends_to_insert = []
+    Returns:
+        pandas.DataFrame: Colunas user_id, symbol (ticker formatado), ticker (como na
+        carteira), date, quantity e value (inclui quantidade 0)
+    """
+    column = {ticker: j for j, ticker in enumerate(timeline.tickers)}
+    events = events[events['ticker'].isin(column)]
+    # Tem direito ao provento quem mantinha o ativo no fechamento do dia anterior à data ex;
+    # antes da primeira fotografia vale a primeira, como na evolução (ver HoldingsTimeline.quantities_at)
+    entitled_at = pd.DatetimeIndex(events['date']) - pd.Timedelta(days=1)
+    quantity = timeline.quantities_at(entitled_at)[np.arange(len(events)), events['ticker'].map(column).to_numpy(dtype=int)]
+    return pd.DataFrame({
+        'user_id': user.id,
+        'symbol': events['ticker'].to_numpy(),
+        'ticker': events['ticker'].map(timeline.source_tickers).to_numpy(),
+        'date': events['date'].to_numpy(),
+        'quantity': quantity,
+        'value': (events['value'].to_numpy() * quantity).round(2)
+    })
+
+def _save_dividends(pending, events):
+    """
+    Recalcula os dividendos de cada usuário a partir dos eventos por ticker e do
+    histórico de posições, e grava apenas as diferenças em relação ao cache: linhas
+    novas ou alteradas em um único upsert em lote e, em um DELETE, as linhas de
+    datas em que o usuário não tinha o ativo ou gravadas com outra grafia do ticker.
+    O recálculo fica registrado em DividendsSync mesmo quando nada muda.
     
-    try:
-        # Download dos dividendos usando yfinance
-        df = yf.download(
-            tickers=tickers, 
-            start=start_date.strftime('%Y-%m-%d'), 
-            group_by='ticker', 
-            actions=True, 
-            progress=False, 
-            threads=True
-        )
+    Args:
+        pending (list): Lista de tuplas (usuário, HoldingsTimeline, date inicial dos
+            eventos ou None para todos)
+        events (pandas.DataFrame): Dividendos por ação (colunas ticker, date e value)
+    """
+    events = events[events['value'] > 0]
+    last_event_date = events['date'].max() if not events.empty else None
+    if events.empty:
+        _record_dividends_sync(pending, last_event_date)
+        return
         
-        # Reset pausa se sucesso
-        reset_rate_limit()
+    keys = ['user_id', 'ticker', 'date']
+    computed = pd.concat([
+        _dividend_amounts(user, timeline, events if since is None else events[events['date'] >= since])
+        for user, timeline, since in pending
+    ], ignore_index=True)
+    stored = pd.DataFrame(
+        db.session.query(
+            DividendsCache.user_id, DividendsCache.ticker, DividendsCache.date,
+            DividendsCache.quantity, DividendsCache.value
+        ).filter(
+            DividendsCache.user_id.in_([user.id for user, _, _ in pending]),
+            DividendsCache.date >= events['date'].min()
+        ).all(),
+        columns=['user_id', 'stored_ticker', 'date', 'stored_quantity', 'stored_value']
+    )
+    # Compara pelo ticker formatado: a grafia na carteira pode mudar entre fotografias
+    stored['symbol'] = stored['stored_ticker'].map(format_ticker)
+    merged = computed.merge(stored, on=['user_id', 'symbol', 'date'], how='left')
+    held = merged['quantity'] > 0
+    is_stored = merged['stored_value'].notna()
+    renamed = held & is_stored & (merged['stored_ticker'] != merged['ticker'])
+    changed = held & (~is_stored | renamed | (merged['stored_quantity'] != merged['quantity']) | (merged['stored_value'] != merged['value']))
+    stale = (~held & is_stored) | renamed
+    if not (changed.any() or stale.any()):
+        _record_dividends_sync(pending, last_event_date)
+        return
         
-        # Processa os dividendos de cada ticker
-        for final_ticker in tickers:
-            info = ticker_qty_map.get(final_ticker)
-            if not info:
-                continue
-                
-            ticker_str = info['ticker']
-            qty = info['quantity']
-            
-            div_series = None
-            
-            if len(tickers) == 1:
-                div_series = df['Dividends'] if 'Dividends' in df else None
-            else:
-                if (final_ticker, 'Dividends') in df:
-                    div_series = df[(final_ticker, 'Dividends')]
-                elif final_ticker in df and 'Dividends' in df[final_ticker]:
-                    div_series = df[final_ticker]['Dividends']
-            
-            if div_series is not None:
-                for date, amount in div_series.items():
-                    if amount > 0 and qty > 0 and date >= start_date:
-                        # Verifica se já existe no cache
-                        date_obj = date.date() if hasattr(date, 'date') else date
-                        exists = DividendsCache.query.filter_by(
-                            user_id=user.id, 
-                            ticker=ticker_str, 
-                            date=date_obj
-                        ).first()
-                        
-                        if not exists:
-                            dividends_to_insert.append(DividendsCache(
-                                user_id=user.id,
-                                ticker=ticker_str,
-                                date=date_obj,
-                                value=round(float(amount) * qty, 2),
-                                quantity=qty,
-                                event_type='Dividendo',
-                                last_updated=datetime.now()
-                            ))
-        
-        # Salva os novos dividendos no banco
-        if dividends_to_insert:
-            db.session.bulk_save_objects(dividends_to_insert)
-            db.session.commit()
-            print(f'[DIVIDENDS] {len(dividends_to_insert)} dividendos inseridos para {user.email}')
-    
+    rows = merged.loc[changed, keys + ['quantity', 'value']].drop_duplicates(keys).assign(
+        event_type='Dividendo',
+        last_updated=datetime.now()
+    ).to_dict('records')
+    try:
+        for user_id, removed in merged.loc[stale].groupby('user_id'):
+            DividendsCache.query.filter(
+                DividendsCache.user_id == user_id,
+                db.tuple_(DividendsCache.ticker, DividendsCache.date).in_(list(zip(removed['stored_ticker'], removed['date'])))
+            ).delete(synchronize_session=False)
+        bulk_upsert(DividendsCache, rows, keys, ['quantity', 'value', 'event_type', 'last_updated'])
+        db.session.commit()
     except Exception as e:
-        print(f'[DIVIDENDS] Erro ao atualizar dividendos para {user.email}: {e}')
-        if 'rate limit' in str(e).lower() or 'too many requests' in str(e).lower():
-            handle_rate_limit()
+        db.session.rollback()
+        print(f'[DIVIDENDS] Erro ao gravar dividendos: {e}')
+        return
+    _record_dividends_sync(pending, last_event_date)
+        
+    changes = merged.loc[changed | stale].groupby('user_id').size()
+    for user, _, _ in pending:
+        if user.id in changes.index:
+            clear_response_caches_for_user(user.id, ['dividends'])
+            print(f'[DIVIDENDS] {changes[user.id]} dividendos gravados ou corrigidos para {user.email}')
 
-def get_user_dividends(user_id, start_date=None):
+def _record_dividends_sync(pending, last_event_date):
+    """Registra o recálculo dos dividendos de cada usuário com a fotografia e o último evento usados."""
+    now = datetime.now()
+    try:
+        bulk_upsert(
+            DividendsSync,
+            [
+                {'user_id': user.id, 'portfolio_id': timeline.version, 'last_computed': now, 'last_event_date': last_event_date}
+                for user, timeline, _ in pending
+            ],
+            ['user_id'], ['portfolio_id', 'last_computed', 'last_event_date']
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f'[DIVIDENDS] Erro ao registrar o recálculo dos dividendos: {e}')
+
+def _dividends_query(user_id, start_date=None, year=None, month=None):
+    """
+    Filtro dos dividendos de um usuário por período (intervalo de datas, para usar o
+    índice (user_id, date)), com LEFT JOIN no status de recebimento.
+    Dividendos sem status registrado contam como recebidos.
+    """
+    if start_date is None:
+        start_date = DIVIDENDS_START_DATE.date()
+    end_date = None
+    if year is not None:
+        period_start = date(year, month or 1, 1)
+        start_date = max(start_date, period_start)
+        if month is None or month == 12:
+            end_date = date(year + 1, 1, 1)
+        else:
+            end_date = date(year, month + 1, 1)
+            
+    query = DividendsCache.query.outerjoin(DividendReceiptStatus, db.and_(
+        DividendReceiptStatus.user_id == DividendsCache.user_id,
+        DividendReceiptStatus.ticker == DividendsCache.ticker,
+        DividendReceiptStatus.date == DividendsCache.date
+    )).filter(
+        DividendsCache.user_id == user_id,
+        DividendsCache.date >= start_date
+    )
+    if end_date is not None:
+        query = query.filter(DividendsCache.date < end_date)
+    return query
+
+def get_user_dividends(user_id, start_date=None, year=None, month=None):
     """
     Obtém os dividendos de um usuário.
     
     Args:
         user_id (str): ID do usuário
         start_date (datetime.date, optional): Data inicial para filtrar. Default é 2023-01-01.
+        year (int, optional): Apenas dividendos deste ano
+        month (int, optional): Apenas dividendos deste mês (1-12) do ano informado
         
     Returns:
         list: Lista de dividendos formatados com informação de recebimento
     """
-    if start_date is None:
-        start_date = datetime(2023, 1, 1).date()
-        
-    # Busca dividendos do cache
-    cache_query = DividendsCache.query.filter(
-        DividendsCache.user_id == user_id,
-        DividendsCache.date >= start_date
+    rows = _dividends_query(user_id, start_date, year, month).with_entities(
+        DividendsCache, DividendReceiptStatus.received
     ).order_by(DividendsCache.date.asc())
     
-    dividends = [d.to_dict() for d in cache_query]
+    dividends = []
+    for dividend, received in rows:
+        d = dividend.to_dict()
+        d['received'] = received is not False
+        dividends.append(d)
+    return dividends
+
+def get_dividend_summary(user_id, group_by, year=None):
+    """
+    Totais de dividendos de um usuário agregados no banco (GROUP BY), separados
+    entre recebidos e pendentes.
     
-    # Busca status de recebimento
-    receipts = DividendReceiptStatus.query.filter_by(user_id=user_id).all()
-    receipt_map = {(r.ticker, r.date): r.received for r in receipts}
+    Args:
+        user_id (str): ID do usuário
+        group_by (str): Agrupamento ('month', 'year' ou 'ticker')
+        year (int, optional): Apenas dividendos deste ano
+        
+    Returns:
+        list: Lista de dicionários com a chave do grupo ('period' ou 'ticker'),
+              total, received, pending e count
+    """
+    if group_by == 'month':
+        keys = [db.extract('year', DividendsCache.date), db.extract('month', DividendsCache.date)]
+    elif group_by == 'year':
+        keys = [db.extract('year', DividendsCache.date)]
+    elif group_by == 'ticker':
+        keys = [DividendsCache.ticker]
+    else:
+        raise ValueError(f"Agrupamento inválido: {group_by}")
+        
+    pending = db.case((DividendReceiptStatus.received == db.false(), DividendsCache.value), else_=0.0)
+    rows = _dividends_query(user_id, year=year).with_entities(
+        *keys,
+        db.func.sum(DividendsCache.value),
+        db.func.sum(pending),
+        db.func.count(DividendsCache.id)
+    ).group_by(*keys).order_by(*keys).all()
     
-    # Adiciona informação de recebimento aos dividendos
-    for d in dividends:
-        key = (d['ticker'], datetime.strptime(d['date'], '%Y-%m-%d').date())
-        d['received'] = receipt_map.get(key, True)
+    summary = []
+    for row in rows:
+        *key, total, pending_total, count = row
+        if group_by == 'month':
+            group = {'period': f'{int(key[0]):04d}-{int(key[1]):02d}'}
+        elif group_by == 'year':
+            group = {'period': str(int(key[0]))}
+        else:
+            group = {'ticker': key[0]}
+        group.update(
+            total=round(total, 2),
+            received=round(total - pending_total, 2),
+            pending=round(pending_total, 2),
+            count=count
+        )
+        summary.append(group)
+    return summary
+
+def get_dividend_summaries(user_id, year=None):
+    """
+    Resumo dos dividendos de um usuário: totais por mês, por ano e por ticker.
     
-    return dividends
+    Args:
+        user_id (str): ID do usuário
+        year (int, optional): Apenas dividendos deste ano
+        
+    Returns:
+        dict: {'year', 'total', 'received', 'pending', 'months', 'years', 'tickers'}
+    """
+    years = get_dividend_summary(user_id, 'year', year)
+    return {
+        'year': year,
+        'total': round(sum(y['total'] for y in years), 2),
+        'received': round(sum(y['received'] for y in years), 2),
+        'pending': round(sum(y['pending'] for y in years), 2),
+        'months': get_dividend_summary(user_id, 'month', year),
+        'years': years,
+        'tickers': get_dividend_summary(user_id, 'ticker', year)
+    }
 
 def set_dividend_receipt_status(user_id, ticker, date, received):
     """
@@ -201,6 +377,7 @@ def set_dividend_receipt_status(user_id, ticker, date, received):
         db.session.add(status)
         
     db.session.commit()
+    clear_response_caches_for_user(user_id, ['dividends'])
     return {'success': True}, 200
 
 def get_dividend_receipt_status(user_id):
@@ -0,0 +1,343 @@
+"""
+Armazenamento local do histórico diário de preços (tabela PriceHistory).
+
+O provedor de dados de mercado só é consultado para as datas que ainda não
+estão no banco: o intervalo já sincronizado de cada ticker fica em
+PriceHistorySync, e cada sincronização busca apenas a partir do último pregão
+armazenado (inclusive, pois ele pode ter sido gravado com o pregão em curso).
+Evolução do portfólio e análises leem o histórico direto do banco.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from extensions.database import db, bulk_upsert
+from models.price import PriceHistory, PriceHistorySync
+from providers import get_market_data_provider, unavailable_tickers
+from utils.async_fetcher import run_batch
+from utils.cache_utils import is_rate_limited, LRUCache
+from utils.market_utils import get_price_expiry, MARKET_TZ
+from utils.singleflight import SingleFlight
+from utils.ticker_utils import get_ticker_exchange
+
+# Intervalo mínimo entre duas consultas incrementais do mesmo ticker (segundos)
+HISTORY_RECHECK_SECONDS = 3600
+
+# Colunas do provedor (providers.base.HISTORY_COLUMNS) -> colunas da tabela PriceHistory
+HISTORY_FIELDS = {
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Adj Close': 'adj_close',
+    'Volume': 'volume',
+}
+
+# Memória máxima das séries por ticker compartilhadas entre usuários (bytes)
+SERIES_CACHE_BYTES = 64 * 1024 * 1024
+
+_history_flight = SingleFlight('history')
+
+# Intervalos anteriores ao sincronizado consultados sem pregões (ex.: ticker listado depois),
+# chave (ticker, início): só são consultados de novo após HISTORY_RECHECK_SECONDS
+_empty_backfills = LRUCache(max_entries=4096, ttl=HISTORY_RECHECK_SECONDS)
+
+class AlignedSeries:
+    """
+    Preços de um ticker no calendário compartilhado (um valor por dia corrido a
+    partir de origin), com forward-fill já aplicado e NaN antes do primeiro pregão.
+    version é o estado de PriceHistorySync do ticker quando a série foi lida.
+    """
+
+    def __init__(self, origin, values, version=None):
+        self.origin = origin
+        self.values = values
+        self.version = version
+
+# Séries normalizadas compartilhadas entre usuários, chave (ticker, campo). Cada
+# entrada é conferida com PriceHistorySync a cada leitura, pois outros processos
+# (workers e scheduler) também gravam no histórico local
+_series_cache = LRUCache(max_bytes=SERIES_CACHE_BYTES, sizeof=lambda series: series.values.nbytes)
+
+# Lock para escrita no histórico local
+history_write_lock = threading.Lock()
+
+def _to_date(value):
+    """Converte string YYYY-MM-DD, datetime ou Timestamp para date."""
+    return pd.Timestamp(value).date()
+
+def _needs_recheck(ticker, last_checked, now):
+    """Indica se o fim do histórico de um ticker deve ser consultado de novo no provedor."""
+    expiry = get_price_expiry(get_ticker_exchange(ticker), last_checked)
+    expiry = max(expiry, (last_checked + timedelta(seconds=HISTORY_RECHECK_SECONDS)).astimezone(MARKET_TZ))
+    return now.astimezone(MARKET_TZ) >= expiry
+
+def _plan_fetches(tickers, start):
+    """
+    Calcula, para cada ticker, os intervalos que faltam no histórico local.
+
+    Returns:
+        dict: Mapa (início, fim) -> lista de tickers, com fim exclusivo (None = até hoje)
+    """
+    now = datetime.now()
+    states = {s.ticker: s for s in PriceHistorySync.query.filter(PriceHistorySync.ticker.in_(tickers))}
+    plan = {}
+    for ticker in tickers:
+        state = states.get(ticker)
+        if state is None:
+            plan.setdefault((start, None), []).append(ticker)
+            continue
+        if start < state.first_date and _empty_backfills.get((ticker, start)) is None:
+            # Período anterior ao já sincronizado
+            plan.setdefault((start, state.first_date), []).append(ticker)
+        if _needs_recheck(ticker, state.last_checked, now):
+            resume = state.last_date or state.first_date
+            plan.setdefault((resume, None), []).append(ticker)
+    return plan
+
+def _store(history, fetched, start, checked_at):
+    """
+    Grava os históricos obtidos e atualiza o intervalo sincronizado dos tickers que
+    retornaram pregões. Tickers consultados sem pregões novos apenas registram a
+    consulta (se já sincronizados); tickers não consultados não são alterados.
+    """
+    rows = []
+    last_dates = {}
+    for ticker, frame in history.items():
+        frame = frame.reindex(columns=list(HISTORY_FIELDS)).dropna(how='all')
+        if frame.empty:
+            continue
+        values = frame.rename(columns=HISTORY_FIELDS).astype(float)
+        values = values.astype(object).where(values.notna(), None)
+        dates = [d.date() for d in values.index]
+        for date, record in zip(dates, values.to_dict('records')):
+            record['ticker'] = ticker
+            record['date'] = date
+            rows.append(record)
+        last_dates[ticker] = dates[-1]
+
+    queried = [t for t in fetched if t not in unavailable_tickers(history)]
+    with history_write_lock:
+        bulk_upsert(PriceHistory, rows, ['ticker', 'date'], list(HISTORY_FIELDS.values()))
+        states = {s.ticker: s for s in PriceHistorySync.query.filter(PriceHistorySync.ticker.in_(queried))}
+        for ticker in queried:
+            state = states.get(ticker)
+            last_date = last_dates.get(ticker)
+            if last_date is None:
+                # Sem pregões no intervalo: o intervalo sincronizado não é estendido
+                if state is not None and start < state.first_date:
+                    _empty_backfills.put((ticker, start), True)
+                elif state is not None:
+                    state.last_checked = checked_at
+                continue
+            if state is None:
+                db.session.add(PriceHistorySync(ticker=ticker, first_date=start, last_date=last_date, last_checked=checked_at))
+                continue
+            state.first_date = min(state.first_date, start)
+            if state.last_date is None or last_date > state.last_date:
+                state.last_date = last_date
+            state.last_checked = checked_at
+        db.session.commit()
+    invalidate_series(last_dates)
+    return len(rows)
+
+def sync_history(tickers, start):
+    """
+    Completa o histórico local dos tickers desde start, consultando o provedor
+    apenas para os intervalos ainda não armazenados. Tickers com o mesmo
+    intervalo pendente são buscados juntos em uma única chamada em lote, e os
+    intervalos distintos são buscados ao mesmo tempo.
+
+    Args:
+        tickers (list): Lista de tickers já formatados
+        start (str|date): Data inicial desejada (YYYY-MM-DD)
+
+    Returns:
+        int: Quantidade de pregões gravados
+    """
+    tickers = sorted(set(tickers))
+    if not tickers or is_rate_limited():
+        return 0
+    start = _to_date(start)
+
+    def _sync():
+        plan = list(_plan_fetches(tickers, start).items())
+        if not plan:
+            return 0
+        provider = get_market_data_provider()
+        checked_at = datetime.now()
+        fetches = [
+            lambda fetch_start=fetch_start, fetch_end=fetch_end, group=group: provider.get_history(
+                group,
+                fetch_start.strftime('%Y-%m-%d'),
+                fetch_end.strftime('%Y-%m-%d') if fetch_end else None
+            )
+            for (fetch_start, fetch_end), group in plan
+        ]
+        # Intervalos distintos são buscados juntos; a gravação fica nesta thread
+        responses = run_batch(fetches)
+
+        stored = 0
+        for ((fetch_start, fetch_end), group), history in zip(plan, responses):
+            if isinstance(history, Exception):
+                print(f"[HISTORY] Erro ao buscar histórico de {len(group)} tickers: {history!r}")
+                continue
+            stored += _store(history, group, fetch_start, checked_at)
+        if stored:
+            print(f"[HISTORY] {stored} pregões gravados no histórico local de {len(tickers)} tickers")
+        return stored
+
+    # Requisições simultâneas para os mesmos tickers compartilham a sincronização
+    return _history_flight.do(('sync', start) + tuple(tickers), _sync)
+
+def get_history(tickers, start, end=None, sync=True):
+    """
+    Lê o histórico diário do banco local, no mesmo formato de
+    MarketDataProvider.get_history.
+
+    Args:
+        tickers (list): Lista de tickers já formatados
+        start (str): Data inicial (YYYY-MM-DD), inclusiva
+        end (str, optional): Data final (YYYY-MM-DD), exclusiva
+        sync (bool): Se True, completa o histórico local antes da leitura
+
+    Returns:
+        dict: Mapa ticker -> DataFrame com as colunas de HISTORY_COLUMNS
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return {}
+    if sync:
+        sync_history(tickers, start)
+
+    columns = [getattr(PriceHistory, column) for column in HISTORY_FIELDS.values()]
+    query = db.session.query(PriceHistory.ticker, PriceHistory.date, *columns).filter(
+        PriceHistory.ticker.in_(tickers),
+        PriceHistory.date >= _to_date(start)
+    )
+    if end is not None:
+        query = query.filter(PriceHistory.date < _to_date(end))
+    records = query.order_by(PriceHistory.ticker, PriceHistory.date).all()
+    if not records:
+        return {}
+
+    df = pd.DataFrame(records, columns=['ticker', 'Date'] + list(HISTORY_FIELDS))
+    df['Date'] = pd.to_datetime(df['Date'])
+    df[list(HISTORY_FIELDS)] = df[list(HISTORY_FIELDS)].astype(float)
+    return {
+        ticker: frame.drop(columns='ticker').set_index('Date')
+        for ticker, frame in df.groupby('ticker', sort=False)
+    }
+
+def get_closes(tickers, start, end=None, field='Adj Close', sync=True):
+    """
+    Monta a matriz de preços (datas x tickers) a partir do histórico local.
+
+    Args:
+        tickers (list): Lista de tickers já formatados
+        start (str): Data inicial (YYYY-MM-DD)
+        end (str, optional): Data final (YYYY-MM-DD), exclusiva
+        field (str): Coluna do histórico ('Close' ou 'Adj Close')
+        sync (bool): Se True, completa o histórico local antes da leitura
+
+    Returns:
+        pandas.DataFrame: Matriz de preços; tickers sem dados não aparecem nas colunas
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return pd.DataFrame()
+    if sync:
+        sync_history(tickers, start)
+
+    column = getattr(PriceHistory, HISTORY_FIELDS[field])
+    query = db.session.query(PriceHistory.ticker, PriceHistory.date, column).filter(
+        PriceHistory.ticker.in_(tickers),
+        PriceHistory.date >= _to_date(start),
+        column.isnot(None)
+    )
+    if end is not None:
+        query = query.filter(PriceHistory.date < _to_date(end))
+    records = query.all()
+    if not records:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(records, columns=['ticker', 'date', 'price'])
+    closes = df.pivot(index='date', columns='ticker', values='price').astype(np.float64)
+    closes.index = pd.to_datetime(closes.index)
+    closes.columns.name = None
+    return closes.sort_index()
+
+def invalidate_series(tickers):
+    """Descarta as séries normalizadas em memória dos tickers (após gravar novos pregões)."""
+    for ticker in tickers:
+        for field in HISTORY_FIELDS:
+            _series_cache.pop((ticker, field))
+
+def _sync_versions(tickers):
+    """Estado sincronizado de cada ticker (primeira e última data, última consulta); None se nunca sincronizado."""
+    rows = db.session.query(
+        PriceHistorySync.ticker, PriceHistorySync.first_date, PriceHistorySync.last_date, PriceHistorySync.last_checked
+    ).filter(PriceHistorySync.ticker.in_(tickers))
+    return {row.ticker: (row.first_date, row.last_date, row.last_checked) for row in rows}
+
+def _align(closes, tickers, origin, last_day):
+    """Converte a matriz de preços em séries diárias no calendário compartilhado."""
+    days = pd.date_range(origin, last_day, freq='D')
+    if closes.empty:
+        aligned = pd.DataFrame(np.nan, index=days, columns=tickers)
+    else:
+        closes = closes.reindex(columns=tickers)
+        aligned = closes.reindex(closes.index.union(days)).ffill().reindex(days)
+    return {ticker: AlignedSeries(origin, aligned[ticker].to_numpy(dtype=float, na_value=np.nan)) for ticker in tickers}
+
+def get_aligned_prices(tickers, date_range, start, field='Adj Close', sync=True):
+    """
+    Matriz de preços (datas x tickers) montada a partir das séries por ticker
+    compartilhadas entre usuários: cada série é lida do banco e alinhada ao
+    calendário uma única vez por processo, e cada requisição apenas seleciona
+    as datas desejadas. O custo cresce com o número de tickers distintos, não
+    com o número de usuários.
+
+    Args:
+        tickers (list): Lista de tickers já formatados
+        date_range (pandas.DatetimeIndex): Datas desejadas (crescentes)
+        start (str|date): Primeira data de histórico considerada
+        field (str): Coluna do histórico ('Close' ou 'Adj Close')
+        sync (bool): Se True, completa o histórico local antes da leitura
+
+    Returns:
+        numpy.ndarray: Matriz datas x tickers com o último preço até cada data;
+            NaN antes do primeiro pregão de cada ticker
+    """
+    tickers = list(tickers)
+    matrix = np.full((len(date_range), len(tickers)), np.nan)
+    if not tickers or len(date_range) == 0:
+        return matrix
+    if sync:
+        sync_history(tickers, start)
+
+    origin = pd.Timestamp(_to_date(start))
+    versions = _sync_versions(list(dict.fromkeys(tickers)))
+    cached = _series_cache.get_many([(ticker, field) for ticker in tickers])
+    # Séries gravadas por outro processo desde a leitura são lidas de novo
+    missing = [
+        t for t in dict.fromkeys(tickers)
+        if (t, field) not in cached or cached[(t, field)].origin > origin or cached[(t, field)].version != versions.get(t)
+    ]
+    if missing:
+        last_day = max(pd.Timestamp(datetime.now().date()), date_range[-1].normalize())
+        loaded = _align(get_closes(missing, origin, field=field, sync=False), missing, origin, last_day)
+        for ticker, series in loaded.items():
+            series.version = versions.get(ticker)
+            _series_cache.put((ticker, field), series)
+            cached[(ticker, field)] = series
+
+    days = pd.DatetimeIndex(date_range).normalize()
+    for j, ticker in enumerate(tickers):
+        series = cached[(ticker, field)]
+        # Datas após o fim da série repetem o último preço
+        index = np.clip((days - series.origin).days.to_numpy(), 0, len(series.values) - 1)
+        matrix[:, j] = series.values[index]
+    return matrix
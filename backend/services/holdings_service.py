@@ -0,0 +1,143 @@
+"""
+Linha do tempo das posições do usuário, montada a partir do histórico de
+fotografias da carteira (tabela Portfolio).
+
+Cada registro de transação ou atualização manual grava uma nova fotografia
+completa; a quantidade de cada ticker ao longo do tempo é, portanto, uma função
+em degraus que muda nas datas dessas fotografias.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from models.portfolio import Portfolio
+from utils.cache_utils import LRUCache
+from utils.ticker_utils import format_ticker
+
+# Quantidade máxima de usuários com linha do tempo mantida em memória
+HOLDINGS_CACHE_SIZE = 256
+
+_timelines = LRUCache(HOLDINGS_CACHE_SIZE)
+
+class HoldingsTimeline:
+    """
+    Quantidades por ticker em cada fotografia da carteira.
+
+    Attributes:
+        version: Id da fotografia mais recente usada na montagem
+        dates (pandas.DatetimeIndex): Data a partir da qual cada fotografia vale (crescente)
+        tickers (list): Tickers formatados presentes em alguma fotografia
+        quantities (numpy.ndarray): Matriz fotografias x tickers (0 onde o ticker não está na carteira)
+        avg_prices (dict): Último preço médio conhecido de cada ticker
+        source_tickers (dict): Ticker formatado -> ticker como informado na carteira
+    """
+
+    def __init__(self, version, dates, tickers, quantities, avg_prices, source_tickers=None):
+        self.version = version
+        self.dates = dates
+        self.tickers = tickers
+        self.quantities = quantities
+        self.avg_prices = avg_prices
+        self.source_tickers = source_tickers or {}
+
+    def quantities_at(self, dates):
+        """
+        Quantidades em vigor em cada data (datas x tickers). Datas anteriores à
+        primeira fotografia usam a primeira fotografia: a carteira importada é
+        tratada como mantida desde o início do período, tanto na evolução quanto
+        nos dividendos.
+
+        Args:
+            dates (pandas.DatetimeIndex): Datas desejadas
+
+        Returns:
+            numpy.ndarray: Matriz float datas x tickers
+        """
+        index = np.searchsorted(self.dates.values, pd.DatetimeIndex(dates).values, side='right') - 1
+        return self.quantities[np.clip(index, 0, None)]
+
+def build_holdings_timeline(snapshots, format_ticker_func=format_ticker, version=None):
+    """
+    Monta a linha do tempo a partir de fotografias da carteira.
+
+    Args:
+        snapshots (list): Lista de tuplas (datetime, lista de ativos) em ordem cronológica
+        format_ticker_func: Função para formatar o ticker para a API
+        version: Identificador da fotografia mais recente
+
+    Returns:
+        HoldingsTimeline: Linha do tempo; várias fotografias no mesmo dia valem pela última
+    """
+    by_day = {}
+    for taken_at, assets in snapshots:
+        positions = {}
+        for asset in assets:
+            ticker_orig = asset['ticker'].strip().upper()
+            try:
+                final_ticker = format_ticker_func(ticker_orig)
+            except Exception:
+                final_ticker = ticker_orig
+            try:
+                positions[final_ticker] = (float(asset.get('quantidade', 0)), float(asset.get('preco_medio', 0)), ticker_orig)
+            except (ValueError, TypeError) as e:
+                print(f"Erro ao processar {final_ticker}: {e}")
+        by_day[pd.Timestamp(taken_at).normalize()] = positions
+
+    tickers = []
+    avg_prices = {}
+    source_tickers = {}
+    for positions in by_day.values():
+        for final_ticker, (_, avg_price, ticker_orig) in positions.items():
+            if final_ticker not in avg_prices:
+                tickers.append(final_ticker)
+            avg_prices[final_ticker] = avg_price
+            source_tickers[final_ticker] = ticker_orig
+
+    column = {ticker: j for j, ticker in enumerate(tickers)}
+    quantities = np.zeros((len(by_day), len(tickers)))
+    for i, positions in enumerate(by_day.values()):
+        for final_ticker, (qty, _, _) in positions.items():
+            quantities[i, column[final_ticker]] = qty
+
+    return HoldingsTimeline(version, pd.DatetimeIndex(list(by_day)), tickers, quantities, avg_prices, source_tickers)
+
+def get_holdings_timeline(user_id, version=None):
+    """
+    Retorna a linha do tempo das posições do usuário. O resultado fica em memória
+    e só é remontado quando surge uma fotografia nova.
+
+    Args:
+        user_id (str): ID do usuário
+        version (int, optional): Id da fotografia mais recente, se já conhecido
+
+    Returns:
+        HoldingsTimeline: Linha do tempo ou None se o usuário não tiver carteira
+    """
+    if version is None:
+        latest = Portfolio.query.with_entities(Portfolio.id).filter_by(user_id=user_id).order_by(Portfolio.uploaded_at.desc()).first()
+        if latest is None:
+            return None
+        version = latest.id
+
+    cached = _timelines.get(user_id)
+    if cached is not None and cached.version == version:
+        return cached
+
+    rows = Portfolio.query.with_entities(Portfolio.uploaded_at, Portfolio.data).filter_by(user_id=user_id).order_by(
+        Portfolio.uploaded_at.asc(), Portfolio.id.asc()
+    ).all()
+    snapshots = []
+    for row in rows:
+        if row.uploaded_at is None:
+            continue
+        try:
+            snapshots.append((row.uploaded_at, json.loads(row.data)))
+        except Exception:
+            continue
+    if not snapshots:
+        return None
+
+    timeline = build_holdings_timeline(snapshots, version=version)
+    _timelines.put(user_id, timeline)
+    return timeline
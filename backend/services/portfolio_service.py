@@ -6,10 +6,12 @@ from flask import current_app
 
 from extensions.database import db
 from models.portfolio import Portfolio
+from providers import get_market_data_provider
+from services import price_cache_service
 from services.price_service import get_price, get_cached_dollar_rate
 from services.dividend_service import update_dividends_for_user
 from utils.ticker_utils import format_ticker
-from utils.cache_utils import clear_evolution_cache_for_user
+from utils.cache_utils import clear_response_caches_for_user
 
 def upload_portfolio(user_id, file):
     """
@@ -49,8 +51,8 @@ def upload_portfolio(user_id, file):
         db.session.add(portfolio)
         db.session.commit()
         
-        # Limpa cache de evolução do portfólio para este usuário
-        clear_evolution_cache_for_user(user_id)
+        # Limpa as respostas em cache (evolução, distribuição, dividendos) deste usuário
+        clear_response_caches_for_user(user_id)
         
         # Inicia atualização de cache em background
         from models.user import User
@@ -213,9 +215,8 @@ def get_portfolio_distribution(user_id):
     if not portfolio_data:
         return {'distribution': []}, 200
         
-    # Busca preços atuais
-    from models.price import PriceCache
-    price_cache = {p.ticker: p.price for p in PriceCache.query.all()}
+    # Busca preços atuais do cache unificado
+    price_cache = price_cache_service.get_many([asset['ticker'] for asset in portfolio_data])
     exch_rate = get_cached_dollar_rate()
     
     total_current_value = 0.0
@@ -232,7 +233,7 @@ def get_portfolio_distribution(user_id):
             continue
             
         is_us = not final_ticker.endswith('.SA')
-        current_price = price_cache.get(ticker_orig) or price_cache.get(final_ticker) or avg_price
+        current_price = price_cache[final_ticker]['price'] or avg_price
         current_value = current_price * quantity * exch_rate if is_us else current_price * quantity
         
         if current_value <= 0:
@@ -283,11 +284,13 @@ def register_transaction(user_id, tipo, ticker, preco, quantidade):
         
     # Validação do ticker (checa se existe na B3 ou EUA)
     try:
-        import yfinance as yf
         yf_ticker = format_ticker(ticker)
-        tinfo = yf.Ticker(yf_ticker).info
-        if not tinfo.get('regularMarketPrice') and not tinfo.get('currentPrice'):
+        valid = get_market_data_provider().validate_symbols([yf_ticker]).get(yf_ticker)
+        if valid is False:
             return {'error': 'Ticker não encontrado'}, 400
+        if valid is None:
+            # Validação não realizada (ex.: rate limit): permite registrar a transação
+            print(f"Não foi possível validar o ticker {ticker}, mas permitindo a transação")
     except Exception:
         return {'error': 'Ticker não encontrado'}, 400
         
@@ -343,8 +346,8 @@ def register_transaction(user_id, tipo, ticker, preco, quantidade):
     db.session.add(new_portfolio)
     db.session.commit()
     
-    # Limpa cache de evolução do portfólio para este usuário
-    clear_evolution_cache_for_user(user_id)
+    # Limpa as respostas em cache (evolução, distribuição, dividendos) deste usuário
+    clear_response_caches_for_user(user_id)
     
     return {'message': 'Transação registrada com sucesso!'}, 200
 
@@ -384,11 +387,13 @@ def update_empresa_manual(user_id, codigo, preco, quantidade, tipo_operacao='com
         
         # Validar se o ticker existe
         try:
-            import yfinance as yf
             yf_ticker = format_ticker(codigo)
-            tinfo = yf.Ticker(yf_ticker).info
-            if not tinfo.get('regularMarketPrice') and not tinfo.get('currentPrice'):
+            valid = get_market_data_provider().validate_symbols([yf_ticker]).get(yf_ticker)
+            if valid is False:
                 return {'error': 'Ticker não encontrado'}, 400
+            if valid is None:
+                # Se falhar a validação online, ainda permite atualizar
+                print(f"Erro ao validar ticker {codigo}, mas permitindo atualização")
         except Exception:
             # Se falhar a validação online, ainda permite atualizar
             print(f"Erro ao validar ticker {codigo}, mas permitindo atualização")
@@ -460,7 +465,7 @@ def update_empresa_manual(user_id, codigo, preco, quantidade, tipo_operacao='com
         db.session.add(new_portfolio)
         db.session.commit()
           # Limpar cache
-        clear_evolution_cache_for_user(user_id)
+        clear_response_caches_for_user(user_id)
         
         operacao_desc = 'comprada' if tipo_operacao == 'compra' else 'vendida'
         return {
@@ -0,0 +1,142 @@
+"""
+Cache unificado de preços em duas camadas: um LRU em memória, limitado, na
+frente da tabela PriceCache. A validade de cada preço depende do pregão da
+bolsa do ticker (ver utils.market_utils.get_price_expiry): preços obtidos com
+a bolsa fechada valem até a próxima abertura e preços ao vivo expiram rápido.
+"""
+import threading
+from datetime import datetime
+
+from extensions.database import db, bulk_upsert, ensure_unique_index
+from models.price import PriceCache
+from utils.cache_utils import LRUCache
+from utils.market_utils import get_price_expiry, MARKET_TZ
+from utils.ticker_utils import format_ticker, get_ticker_exchange
+
+# Quantidade máxima de tickers mantidos no LRU em memória
+PRICE_LRU_SIZE = 2048
+
+_lru = LRUCache(PRICE_LRU_SIZE)
+
+# Lock global para operações de escrita no PriceCache
+pricecache_write_lock = threading.Lock()
+
+def _make_entry(ticker, price, last_updated):
+    """Monta a entrada armazenada no LRU para um preço."""
+    return {
+        'price': price,
+        'last_updated': last_updated,
+        'expires_at': get_price_expiry(get_ticker_exchange(ticker), last_updated)
+    }
+
+def _describe(entry, now):
+    """Acrescenta idade e status ('fresh', 'stale' ou 'missing') a uma entrada do LRU."""
+    if entry is None:
+        return {'price': None, 'last_updated': None, 'expires_at': None, 'age_seconds': None, 'status': 'missing'}
+    return {
+        'price': entry['price'],
+        'last_updated': entry['last_updated'],
+        'expires_at': entry['expires_at'],
+        'age_seconds': (now - entry['last_updated']).total_seconds(),
+        'status': 'fresh' if now.astimezone(MARKET_TZ) < entry['expires_at'] else 'stale'
+    }
+
+def get_many(tickers):
+    """
+    Lê os preços de vários tickers. Entradas válidas vêm do LRU; as demais são
+    buscadas no PriceCache em uma única consulta pelo ticker normalizado.
+
+    Args:
+        tickers (list): Lista de tickers (originais ou formatados)
+
+    Returns:
+        dict: Mapa ticker normalizado -> {'price', 'last_updated', 'expires_at',
+              'age_seconds', 'status'}, onde status é 'fresh', 'stale' ou 'missing'
+    """
+    now = datetime.now()
+    final_tickers = {format_ticker(ticker) for ticker in tickers}
+
+    entries = _lru.get_many(final_tickers)
+    # Entradas expiradas no LRU são relidas do banco: outro processo pode já tê-las atualizado
+    to_load = [t for t in final_tickers if t not in entries or _describe(entries[t], now)['status'] != 'fresh']
+
+    if to_load:
+        for row in PriceCache.query.filter(PriceCache.ticker.in_(to_load)).all():
+            if row.price is None:
+                continue
+            cached = entries.get(row.ticker)
+            if cached is None or row.last_updated >= cached['last_updated']:
+                entry = _make_entry(row.ticker, row.price, row.last_updated)
+                entries[row.ticker] = entry
+                _lru.put(row.ticker, entry)
+
+    return {t: _describe(entries.get(t), now) for t in final_tickers}
+
+def put_many(prices, last_updated=None):
+    """
+    Grava um lote de preços no PriceCache com um único upsert em lote
+    (INSERT ... ON CONFLICT sobre o ticker) e um commit, e atualiza o LRU.
+
+    Args:
+        prices (dict): Mapa ticker normalizado -> preço (preços None são ignorados)
+        last_updated (datetime, optional): Momento da cotação. Default é agora.
+    """
+    prices = {ticker: price for ticker, price in prices.items() if price is not None}
+    if not prices:
+        return
+
+    now = last_updated or datetime.now()
+    rows = [
+        {'user_id': None, 'ticker': ticker, 'price': price, 'last_updated': now}
+        for ticker, price in prices.items()
+    ]
+    with pricecache_write_lock:
+        bulk_upsert(PriceCache, rows, ['ticker'], ['price', 'last_updated'])
+        db.session.commit()
+
+    for ticker, price in prices.items():
+        _lru.put(ticker, _make_entry(ticker, price, now))
+
+def normalize_price_cache():
+    """
+    Migração de inicialização: bancos antigos podem ter o mesmo ativo gravado com
+    o ticker original e com o formatado (ex.: PETR4 e PETR4.SA). Mantém a linha
+    mais recente de cada ticker normalizado, renomeia-a para o ticker formatado
+    e garante a chave única uq_price_cache_ticker.
+    """
+    with pricecache_write_lock:
+        latest = {}
+        stale_ids = []
+        for row in PriceCache.query.order_by(PriceCache.last_updated.desc(), PriceCache.id.desc()):
+            final_ticker = format_ticker(row.ticker)
+            if final_ticker in latest:
+                stale_ids.append(row.id)
+            else:
+                latest[final_ticker] = row
+        if stale_ids:
+            PriceCache.query.filter(PriceCache.id.in_(stale_ids)).delete(synchronize_session=False)
+            db.session.flush()
+        renamed = 0
+        for final_ticker, row in latest.items():
+            if row.ticker != final_ticker:
+                row.ticker = final_ticker
+                renamed += 1
+        db.session.commit()
+        if stale_ids or renamed:
+            print(f"[PRICECACHE] Migração: {len(stale_ids)} duplicatas removidas, {renamed} tickers normalizados")
+        ensure_unique_index(PriceCache.__tablename__, ['ticker'], 'uq_price_cache_ticker')
+    _lru.clear()
+
+def invalidate(tickers=None):
+    """
+    Remove tickers do LRU em memória (todos, se tickers for None). O PriceCache
+    não é alterado; a próxima leitura volta a consultar o banco.
+
+    Args:
+        tickers (list, optional): Tickers a invalidar
+    """
+    if tickers is None:
+        _lru.clear()
+        return
+    for ticker in tickers:
+        _lru.pop(format_ticker(ticker))
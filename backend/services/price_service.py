@@ -1,39 +1,47 @@
-import yfinance as yf
 from datetime import datetime
 from flask import current_app
 import json
 import types  # Para retornar objeto de resultado com atributos
 import threading
 
-# Lock global para operações de escrita no PriceCache
-pricecache_write_lock = threading.Lock()
+from utils.singleflight import SingleFlight
+from utils.ticker_utils import FX_PAIRS
+
+# Ticker da cotação do dólar
+DOLLAR_TICKER = FX_PAIRS['USD']
+
+# Coalescência de buscas simultâneas de cotações (por ticker ou por conjunto de tickers)
+_quote_flight = SingleFlight('quotes')
+
+# Tickers com atualização em segundo plano já agendada
+_pending_refresh = set()
+_pending_refresh_lock = threading.Lock()
 
 from extensions.database import db
 from models.price import PriceCache
+from providers import get_market_data_provider, ProviderResult, unavailable_tickers
+from services import price_cache_service, ticker_registry
 from utils.ticker_utils import format_ticker
 from utils.cache_utils import is_rate_limited, handle_rate_limit, reset_rate_limit, dollar_cache, dollar_cache_lock
 
-def test_yfinance_request():
+def test_market_data_connection():
     """
-    Testa a conectividade com a API do yfinance.
+    Testa a conectividade com o provedor de dados de mercado.
     
     Returns:
         bool: True se a conexão estiver funcionando, False caso contrário
     """
     try:
-        # Testa uma requisição simples ao yfinance
-        yf.Ticker("AAPL").info
-        return True
+        return get_market_data_provider().ping()
     except Exception as e:
-        print(f"[YFINANCE] Erro ao testar yfinance: {e}")
+        print(f"[MARKETDATA] Erro ao testar o provedor de dados de mercado: {e}")
         return False
 
 def get_price(ticker, formatar=True):
     """
-    Busca o preço atual de um ticker via yfinance.
+    Busca o preço atual de um ticker no provedor de dados de mercado.
     Se for um ativo brasileiro (sem separadores), adiciona ".SA" ao final.
     Respeita o rate limit e usa cache se estiver em pausa.
-    Prioriza o uso do método info para obter preços em tempo real.
     
     Args:
         ticker (str): Código do ticker
@@ -45,89 +53,68 @@ def get_price(ticker, formatar=True):
     # Verificar se está em pausa por rate limit
     if is_rate_limited():
         # Em pausa, busca apenas do cache
-        ticker_formatted = format_ticker(ticker) if formatar else ticker
-        ticker_stripped = ticker.strip().upper()
-        
-        # Procura no cache
-        obj = PriceCache.query.filter(
-            (PriceCache.ticker == ticker_stripped) | 
-            (PriceCache.ticker == ticker_formatted)
-        ).first()
-        
-        if obj and obj.price:
-            return obj.price
-        return None
+        entry = price_cache_service.get_many([ticker])
+        return next(iter(entry.values()))['price'] if entry else None
 
     try:
         yf_ticker = format_ticker(ticker) if formatar else ticker
-        
-        # Primeiro tenta obter o preço direto da API info (preço em tempo real)
-        try:
-            ticker_info = yf.Ticker(yf_ticker).info
-            # Tenta obter o preço atual ou preço de mercado regular
-            price = ticker_info.get('currentPrice') or ticker_info.get('regularMarketPrice')
-            if price:
-                return float(price)
-        except Exception as e:
-            print(f"[get_price] Erro ao buscar info para {yf_ticker}: {e}")
-        
-        # Se não conseguiu via info, tenta usar o download histórico
-        df = None
-        try:
-            df = yf.download(yf_ticker, period="5d", interval="1d", progress=False)
-        except Exception as e:
-            if 'possibly delisted' in str(e) or 'no price data found' in str(e):
-                print(f"[get_price] YFPricesMissingError (simulado): {e}")
-            elif 'HTTP Error' in str(e):
-                print(f"[get_price] HTTPError: {e}")
-            elif 'timed out' in str(e):
-                print(f"[get_price] Timeout: {e}")
-            else:
-                print(f"[get_price] Erro inesperado no download do yfinance: {e}")
-                
-        if df is not None and not df.empty and 'Close' in df.columns:
-            try:
-                return float(df['Close'].dropna().iloc[-1])
-            except IndexError:
-                print(f"[get_price] IndexError: série vazia para {yf_ticker}, ignorando.")
-            except Exception as e:
-                print(f"[get_price] Erro ao acessar preço para {yf_ticker}: {e}")
-            
-        return None
+        # Chamadores simultâneos do mesmo ticker compartilham uma única busca
+        return _quote_flight.do(
+            yf_ticker,
+            lambda: get_market_data_provider().get_quotes([yf_ticker]).get(yf_ticker)
+        )
     except Exception as e:
         print(f"[get_price] Erro ao buscar {ticker}: {e}")
         if 'rate limit' in str(e).lower() or 'too many requests' in str(e).lower():
             handle_rate_limit()
         return None
 
-def get_cached_dollar_rate(force_update=False):
+def get_quote_flight_stats():
+    """
+    Retorna os contadores da coalescência de buscas de cotações.
+    
+    Returns:
+        dict: Buscas reais, chamadas coalescidas e buscas em andamento
+    """
+    return _quote_flight.stats()
+
+def get_cached_dollar_rate(force_update=False, background=False):
     """
     Obtém a taxa de câmbio USD/BRL do cache ou atualiza se necessário/solicitado.
     
     Args:
         force_update (bool): Se True, força atualização do cache
+        background (bool): Se True, um cache expirado é devolvido imediatamente e a
+            atualização é agendada em segundo plano (uso no caminho das requisições)
         
     Returns:
         float: Taxa de câmbio USD/BRL
     """
-    # Verificar se está em pausa por rate limit
-    if is_rate_limited():
-        # Em pausa, retorna o último valor conhecido
-        with dollar_cache_lock:
-            return dollar_cache['rate']
-            
+    # Último valor aceito, vindo do cache unificado de preços
+    entry = price_cache_service.get_many([DOLLAR_TICKER])[DOLLAR_TICKER]
     with dollar_cache_lock:
-        now = datetime.now()
-        if not force_update and (now - dollar_cache['timestamp']).total_seconds() < 300:
-            return dollar_cache['rate']
+        if entry['price'] and (entry['last_updated'] > dollar_cache['timestamp']):
+            dollar_cache['rate'] = entry['price']
+            dollar_cache['timestamp'] = entry['last_updated']
+        rate = dollar_cache['rate']
+
+    # Em pausa por rate limit ou com cotação ainda válida, retorna o último valor conhecido
+    if is_rate_limited() or (entry['status'] == 'fresh' and not force_update):
+        return rate
+
+    # No caminho das requisições, nunca espera pela rede
+    if background and not force_update:
+        schedule_price_refresh([DOLLAR_TICKER])
+        return rate
             
+    with dollar_cache_lock:
         last_rate = dollar_cache['rate']
-        rate = get_price("USDBRL=X")
+        rate = get_price(DOLLAR_TICKER)
         
         # Proteção: só aceita se variar no máximo 100% para cima ou para baixo
         if rate and rate > 0 and 0.5 * last_rate <= rate <= 2 * last_rate:
             dollar_cache['rate'] = rate
-            dollar_cache['timestamp'] = now
+            dollar_cache['timestamp'] = datetime.now()
             save_dollar_to_db(rate)
             return rate
             
@@ -136,11 +123,11 @@ def get_cached_dollar_rate(force_update=False):
 
 def load_dollar_from_db():
     """Carrega a taxa de câmbio do dólar do banco de dados."""
-    obj = PriceCache.query.filter_by(user_id=None, ticker="USDBRL=X").order_by(PriceCache.last_updated.desc()).first()
-    if obj:
+    entry = price_cache_service.get_many([DOLLAR_TICKER])[DOLLAR_TICKER]
+    if entry['price']:
         with dollar_cache_lock:
-            dollar_cache['rate'] = obj.price
-            dollar_cache['timestamp'] = obj.last_updated
+            dollar_cache['rate'] = entry['price']
+            dollar_cache['timestamp'] = entry['last_updated']
 
 def save_dollar_to_db(rate):
     """
@@ -150,25 +137,63 @@ def save_dollar_to_db(rate):
         rate (float): Taxa de câmbio a ser salva
     """
     if rate is None:
-        print("[PRICECACHE] Ignorando update/insert para USDBRL=X pois price=None")
+        print(f"[PRICECACHE] Ignorando update/insert para {DOLLAR_TICKER} pois price=None")
         return
-        
-    obj = PriceCache.query.filter_by(user_id=None, ticker="USDBRL=X").first()
-    now = datetime.now()
-    
-    if obj:
-        obj.price = rate
-        obj.last_updated = now
-    else:
-        db.session.add(PriceCache(user_id=None, ticker="USDBRL=X", price=rate, last_updated=now))
-        
-    db.session.commit()
+    price_cache_service.put_many({DOLLAR_TICKER: rate})
 
-def update_price_cache_for_all_tickers():
+def schedule_price_refresh(tickers):
+    """
+    Agenda a atualização de preços em segundo plano, sem bloquear a requisição.
+    Tickers que já possuem atualização pendente são ignorados.
+
+    Args:
+        tickers (list): Lista de tickers normalizados
+
+    Returns:
+        int: Quantidade de tickers efetivamente agendados
+    """
+    if not tickers or is_rate_limited():
+        return 0
+
+    with _pending_refresh_lock:
+        new_tickers = [t for t in tickers if t not in _pending_refresh]
+        _pending_refresh.update(new_tickers)
+
+    if not new_tickers:
+        return 0
+
+    app = current_app._get_current_object()
+    thread = threading.Thread(target=_refresh_prices_worker, args=(app, new_tickers), daemon=True)
+    thread.start()
+    return len(new_tickers)
+
+def _refresh_prices_worker(app, tickers):
+    """Busca os preços agendados por schedule_price_refresh e grava no PriceCache."""
+    with app.app_context():
+        try:
+            print(f"[PRICECACHE] Atualização em segundo plano para {len(tickers)} tickers: {tickers}")
+            if DOLLAR_TICKER in tickers:
+                # O dólar passa pela validação de variação de get_cached_dollar_rate
+                get_cached_dollar_rate(force_update=True)
+            # Tickers sem cotação recente aguardam a próxima tentativa do registro
+            due, _ = ticker_registry.filter_due([ticker for ticker in tickers if ticker != DOLLAR_TICKER])
+            prices = fetch_last_prices(due)
+            price_cache_service.put_many(prices)
+        except Exception as e:
+            print(f"[PRICECACHE] Erro na atualização em segundo plano: {e}")
+            db.session.rollback()
+        finally:
+            with _pending_refresh_lock:
+                _pending_refresh.difference_update(tickers)
+
+def update_price_cache_for_all_tickers(only_expired=True):
     """
     Atualiza o cache de preços para todos os tickers únicos no sistema.
     Busca tickers de todos os portfolios e do cache existente.
     
+    Args:
+        only_expired (bool): Se True, atualiza apenas os tickers cuja cotação expirou
+    
     Returns:
         Object: Objeto com informações sobre a operação, incluindo tickers que deram erro "possibly delisted"
     """
@@ -184,8 +209,8 @@ def update_price_cache_for_all_tickers():
         print(f"[RATE LIMIT] Pausando update_price_cache_for_all_tickers devido ao rate limit")
         return result
         
-    # Testa a conectividade com o yfinance
-    if not test_yfinance_request():
+    # Testa a conectividade com o provedor de dados de mercado
+    if not test_market_data_connection():
         handle_rate_limit()
         return result
         
@@ -207,7 +232,14 @@ def update_price_cache_for_all_tickers():
     # Adiciona também os já presentes no PriceCache, normalizando
     for p in PriceCache.query.with_entities(PriceCache.ticker).distinct():
         tickers.add(format_ticker(p.ticker))
-    tickers = list(tickers)
+    # Apenas tickers cuja cotação expirou, conforme o pregão de cada bolsa
+    if only_expired:
+        cached = price_cache_service.get_many(tickers)
+        tickers = {t for t in tickers if cached[t]['status'] != 'fresh'}
+    # Tickers que falharam recentemente só voltam a ser consultados após next_probe
+    tickers, skipped = ticker_registry.filter_due(sorted(tickers))
+    if skipped:
+        print(f"[PRICECACHE] {len(skipped)} tickers sem cotação aguardando nova tentativa")
     result.total_tickers = len(tickers)
     
     if not tickers:
@@ -216,42 +248,18 @@ def update_price_cache_for_all_tickers():
 
     print(f"[PRICECACHE] Iniciando download de preços para {len(tickers)} ativos únicos...")
     try:
-        df = None
-        try:
-            # Período de 30 dias para evitar problemas de série vazia
-            df = yf.download(tickers=tickers, period='30d', group_by='ticker', progress=False, threads=True)
-        except Exception as e:
-            if 'possibly delisted' in str(e) or 'no price data found' in str(e):
-                # Processa os tickers que falharam para identificar os "possibly delisted"
-                error_msg = str(e)
-                if 'Failed download:' in error_msg:
-                    lines = error_msg.split('\n')
-                    for line in lines:
-                        if "possibly delisted" in line.lower():
-                            # Extrai o ticker do formato ['TICKER']: YFPricesMissingError...
-                            start_idx = line.find("['") + 2
-                            end_idx = line.find("']")
-                            if start_idx > 0 and end_idx > start_idx:
-                                ticker_with_error = line[start_idx:end_idx]
-                                print(f"[PRICECACHE] Ticker possivelmente delisted: {ticker_with_error}")
-                                result.delisted_tickers.append(ticker_with_error)
-                
-                print(f"[PRICECACHE] YFPricesMissingError (simulado): {e}")
-            elif 'HTTP Error' in str(e):
-                print(f"[PRICECACHE] HTTPError: {e}")
-            elif 'timed out' in str(e):
-                print(f"[PRICECACHE] Timeout: {e}")
-            else:
-                print(f"[PRICECACHE] Erro inesperado no download do yfinance: {e}")
+        # Cotações em lotes multi-símbolo (uma requisição por lote, não por ticker)
+        prices = fetch_last_prices(tickers)
         
         # Reset pausa se sucesso
         reset_rate_limit()
         
         # Processa os resultados
-        process_yfinance_results(df, tickers, result)
+        process_quote_results(prices, tickers, result)
         
-        # Atualiza o banco conforme as regras de delisted/rate limit
-        update_price_cache_db(result.delisted_tickers, result.total_tickers)
+        # Atualiza o registro de tickers sem cotação conforme as regras de delisted/rate limit
+        consulted = [t for t in tickers if t not in unavailable_tickers(prices)]
+        update_price_cache_db(result.delisted_tickers, len(consulted), consulted)
         
         return result
         
@@ -261,124 +269,76 @@ def update_price_cache_for_all_tickers():
             handle_rate_limit()
         return result
 
-def process_yfinance_results(df, tickers, result=None):
+def fetch_last_prices(tickers):
+    """
+    Motor de cotações em lote: obtém o último preço de todos os tickers com
+    poucas requisições multi-símbolo ao provedor de dados de mercado.
+    
+    Args:
+        tickers (list): Lista de tickers já formatados
+        
+    Returns:
+        ProviderResult: Mapa ticker -> último preço (tickers sem preço são omitidos;
+            os não consultados ficam em unavailable)
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return ProviderResult()
+    if is_rate_limited():
+        return ProviderResult(unavailable=tickers)
+    # Chamadores simultâneos do mesmo conjunto de tickers compartilham uma única busca
+    key = ('batch',) + tuple(sorted(tickers))
+    quotes = _quote_flight.do(key, lambda: get_market_data_provider().get_quotes(tickers))
+    return ProviderResult(quotes, unavailable_tickers(quotes))
+
+def process_quote_results(prices, tickers, result=None):
     """
-    Processa os resultados do yfinance e atualiza o banco de dados.
-    Prioriza o uso do método info para obter preços em tempo real.
+    Grava as cotações obtidas em lote e identifica os tickers sem preço.
+    O lock de escrita é mantido apenas durante o upsert em lote.
     
     Args:
-        df (pandas.DataFrame): DataFrame com os preços
-        tickers (list): Lista de tickers
+        prices (dict): Mapa ticker -> último preço (ver fetch_last_prices)
+        tickers (list): Lista de tickers solicitados
         result (object): Objeto opcional para armazenar informações sobre tickers delisted
     """
-    BATCH_SIZE = 10
-    batch_count = 0
-    with pricecache_write_lock:
-        for ticker in tickers:
-            # Pula tickers que já sabemos que estão delisted
-            if result and ticker in result.delisted_tickers:
-                continue
-                
-            # Primeiro tenta obter o preço direto da API info (preço em tempo real)
-            price = None
-            try:
-                ticker_info = yf.Ticker(ticker).info
-                # Tenta obter o preço atual ou preço de mercado regular
-                price = ticker_info.get('currentPrice') or ticker_info.get('regularMarketPrice')
-                if price:
-                    print(f"[PRICECACHE] Preço em tempo real obtido para {ticker}: {price}")
-            except Exception as e:
-                print(f"[PRICECACHE] Erro ao buscar preço em tempo real para {ticker}: {e}")
-                # Verifica se é um erro de "possibly delisted"
-                if 'possibly delisted' in str(e).lower() and result is not None:
-                    print(f"[PRICECACHE] Ticker {ticker} possivelmente delisted (via info)")
-                    result.delisted_tickers.append(ticker)
-                    continue
-                
-            # Se não conseguiu via info, tenta usar o DataFrame do histórico
-            if price is None and df is not None:
-                close_series = None
-                if len(tickers) == 1:
-                    close_series = df['Close'] if 'Close' in df else None
-                else:
-                    if (ticker, 'Close') in df:
-                        close_series = df[(ticker, 'Close')]
-                    elif ticker in df and 'Close' in df[ticker]:
-                        close_series = df[ticker]['Close']
-                
-                try:
-                    if close_series is not None and not close_series.empty:
-                        price = float(close_series.dropna().iloc[-1])
-                        print(f"[PRICECACHE] Preço histórico usado para {ticker}: {price}")
-                    else:
-                        print(f"[PRICECACHE] Série de preços vazia para {ticker}, ignorando.")
-                        # Ticker pode estar delisted se não tem preços históricos
-                        if result is not None:
-                            result.delisted_tickers.append(ticker)
-                            print(f"[PRICECACHE] Ticker {ticker} possivelmente delisted (via série vazia)")
-                except IndexError:
-                    print(f"[PRICECACHE] IndexError: série vazia para {ticker}, ignorando.")
-                    # Ticker pode estar delisted se gera IndexError
-                    if result is not None:
-                        result.delisted_tickers.append(ticker)
-                        print(f"[PRICECACHE] Ticker {ticker} possivelmente delisted (via IndexError)")
-                except Exception as e:
-                    print(f"[PRICECACHE] Erro ao acessar preço para {ticker}: {e}")
-                
-            if price is not None:
-                # Sempre salva o ticker normalizado
-                obj = PriceCache.query.filter_by(user_id=None, ticker=ticker).first()
-                if obj:
-                    obj.price = price
-                    obj.last_updated = datetime.now()
-                else:
-                    db.session.add(PriceCache(
-                        user_id=None,
-                        ticker=ticker,
-                        price=price,
-                        last_updated=datetime.now()
-                     ))
-                batch_count += 1
-                if batch_count % BATCH_SIZE == 0:
-                    db.session.commit()
-            else:
-                print(f"[PRICECACHE] Ignorando update/insert para {ticker} pois price=None")
-                # Se não conseguimos nenhum preço, pode estar delisted
-                if result is not None and ticker not in result.delisted_tickers:
-                    result.delisted_tickers.append(ticker)
-                    print(f"[PRICECACHE] Ticker {ticker} possivelmente delisted (via price=None)")
-        
-        db.session.commit()
-    print(f'[PRICECACHE] Preços atualizados para {len(tickers)} ativos únicos')
+    delisted = set(result.delisted_tickers) if result is not None else set()
+    # Tickers não consultados (lote com erro, rate limit, disjuntor aberto) não contam como sem cotação
+    unavailable = unavailable_tickers(prices)
+    prices = {t: p for t, p in prices.items() if t not in delisted}
+    if unavailable:
+        print(f"[PRICECACHE] {len(unavailable)} tickers não consultados; ficam para a próxima atualização")
+
+    for ticker in tickers:
+        if ticker not in prices and ticker not in delisted and ticker not in unavailable:
+            print(f"[PRICECACHE] Ignorando update/insert para {ticker} pois price=None")
+            # Se não conseguimos nenhum preço, pode estar delisted
+            if result is not None:
+                result.delisted_tickers.append(ticker)
+                print(f"[PRICECACHE] Ticker {ticker} possivelmente delisted (via price=None)")
+
+    price_cache_service.put_many(prices)
+    print(f'[PRICECACHE] Preços atualizados para {len(prices)} de {len(tickers)} ativos únicos')
     if result and result.delisted_tickers:
         print(f'[PRICECACHE] {len(result.delisted_tickers)} tickers possivelmente delisted')
 
-def remove_delisted_from_cache(delisted_tickers):
-    """Remove tickers delisted do PriceCache e loga a ação."""
-    if not delisted_tickers:
-        return
-    for ticker in delisted_tickers:
-        with pricecache_write_lock:
-            obj = PriceCache.query.filter_by(ticker=ticker).first()
-            if obj:
-                db.session.delete(obj)
-                print(f"[PRICECACHE] Removido ticker delisted do cache: {ticker}")
-    db.session.commit()
-
-def update_price_cache_db(delisted_tickers, total_tickers):
+def update_price_cache_db(delisted_tickers, total_tickers, tickers=()):
     """
-    Atualiza o banco de dados PriceCache conforme as regras:
-    - Se todos os tickers deram erro, não remove nenhum (rate limit).
-    - Se apenas alguns deram erro, remove apenas esses do banco.
+    Atualiza o registro de tickers sem cotação (ver services.ticker_registry) conforme as regras:
+    - Se todos os tickers deram erro, não registra nenhum (rate limit).
+    - Se apenas alguns deram erro, registra esses com nova tentativa adiada e
+      remove do registro os que voltaram a ter cotação.
+    O PriceCache não é alterado: o último preço conhecido continua disponível.
+
+    Args:
+        delisted_tickers (list): Tickers sem cotação
+        total_tickers (int): Quantidade de tickers consultados
+        tickers (list): Tickers consultados
     """
     if total_tickers > 0 and len(delisted_tickers) == total_tickers:
-        print("[PRICECACHE] Todos os tickers falharam, possível rate limit. Não removendo tickers do banco.")
+        print("[PRICECACHE] Todos os tickers falharam, possível rate limit. Não registrando tickers sem cotação.")
         return
-    if delisted_tickers:
-        for ticker in delisted_tickers:
-            obj = PriceCache.query.filter_by(ticker=ticker).first()
-            if obj:
-                db.session.delete(obj)
-                print(f"[PRICECACHE] Removido ticker delisted do cache: {ticker}")
-        db.session.commit()
-        print(f"[PRICECACHE] {len(delisted_tickers)} tickers removidos do cache.")
\ No newline at end of file
+    delisted = set(delisted_tickers)
+    ticker_registry.record_results([t for t in tickers if t not in delisted], delisted)
+    db.session.commit()
+    if delisted:
+        print(f"[PRICECACHE] {len(delisted)} tickers sem cotação registrados para nova tentativa posterior.")
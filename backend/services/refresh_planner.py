@@ -0,0 +1,187 @@
+"""
+Atualização de preços por prioridade de demanda.
+
+Os tickers são divididos em camadas conforme os usuários que os possuem: com
+sessão ativa, vistos recentemente (ver auth_service.get_user_activity_tiers) e
+inativos. A cada ciclo o orçamento é gasto nessa ordem, e cada camada só volta a
+consultar um ticker após o seu intervalo mínimo: tickers em uso ficam com preço
+de minutos atrás e tickers sem demanda são atualizados raramente.
+
+O orçamento é contado em requisições ao provedor (um lote de cotações de até
+chunk_size tickers cada). Ele se acumula no ritmo da atualização completa
+anterior (todos os tickers a cada BASELINE_REFRESH_SECONDS), de modo que o
+total de requisições nunca passa do que aquela atualização fazia; uma requisição
+disponível já leva, em um lote pequeno, os tickers ativos vencidos, sem esperar
+um lote completo.
+"""
+import json
+import math
+import threading
+import time
+import types
+
+from extensions.database import db
+from models.portfolio import Portfolio
+from models.price import PriceCache
+from providers import get_market_data_provider, unavailable_tickers
+from services import price_cache_service, ticker_registry
+from services.price_service import fetch_last_prices, process_quote_results, update_price_cache_db
+from services.auth_service import get_user_activity_tiers
+from utils.cache_utils import LRUCache
+from utils.market_utils import is_exchange_open
+from utils.ticker_utils import FX_PAIRS, format_ticker, get_ticker_exchange
+
+# Intervalo entre ciclos do agendador durante o pregão (segundos)
+REFRESH_CYCLE_SECONDS = 60
+
+# Camadas em ordem de prioridade e intervalo mínimo entre atualizações de um ticker (segundos)
+REFRESH_TIERS = (
+    ('active', 60),
+    ('recent', 15 * 60),
+    ('dormant', 60 * 60),
+)
+
+# Intervalo da atualização completa de todos os tickers que o orçamento substitui (segundos)
+BASELINE_REFRESH_SECONDS = 1800
+
+# Tickers por requisição quando o provedor não informa o tamanho do lote (chunk_size)
+REFRESH_REQUEST_TICKERS = 50
+
+# Orçamento acumulado (requisições) e momento do último acúmulo
+_budget = {'credit': 0.0, 'updated': None}
+
+# Fotografias de carteira com tickers já extraídos (id do Portfolio -> tickers)
+_portfolio_tickers = LRUCache(1024)
+
+# Resumo do último planejamento, exposto em /api/system-status
+_last_plan = {}
+_last_plan_lock = threading.Lock()
+
+def _tickers_by_user():
+    """Tickers formatados da carteira mais recente de cada usuário."""
+    # Ids são crescentes: o maior id de cada usuário é a fotografia mais recente
+    latest = db.session.query(Portfolio.user_id, db.func.max(Portfolio.id)).group_by(Portfolio.user_id).all()
+    cached = _portfolio_tickers.get_many([portfolio_id for _, portfolio_id in latest])
+    missing = [portfolio_id for _, portfolio_id in latest if portfolio_id not in cached]
+    if missing:
+        for row in Portfolio.query.with_entities(Portfolio.id, Portfolio.data).filter(Portfolio.id.in_(missing)):
+            try:
+                tickers = frozenset(format_ticker(asset['ticker']) for asset in json.loads(row.data))
+            except Exception:
+                tickers = frozenset()
+            _portfolio_tickers.put(row.id, tickers)
+            cached[row.id] = tickers
+    return {user_id: cached.get(portfolio_id, frozenset()) for user_id, portfolio_id in latest}
+
+def _request_tickers():
+    """Quantidade de tickers cotados em uma requisição ao provedor."""
+    return getattr(get_market_data_provider(), 'chunk_size', REFRESH_REQUEST_TICKERS)
+
+def _accrue_budget(total_tickers, per_request):
+    """Acumula o orçamento proporcional ao tempo decorrido e retorna quantas requisições podem ser feitas."""
+    now = time.monotonic()
+    # O primeiro ciclo após o início do processo recebe uma atualização completa,
+    # como a que a atualização anterior fazia na inicialização
+    elapsed = BASELINE_REFRESH_SECONDS if _budget['updated'] is None else now - _budget['updated']
+    _budget['updated'] = now
+    sweep_requests = math.ceil(total_tickers / per_request)
+    rate = sweep_requests / BASELINE_REFRESH_SECONDS
+    # Orçamento guardado nunca passa de uma atualização completa
+    _budget['credit'] = min(max(sweep_requests, 1), _budget['credit'] + rate * elapsed)
+    return int(_budget['credit'])
+
+def plan_refresh():
+    """
+    Escolhe os tickers a atualizar neste ciclo, dentro do orçamento acumulado de
+    requisições (cada uma com até chunk_size tickers).
+
+    Returns:
+        dict: {'tickers': lista em ordem de prioridade, 'budget': requisições disponíveis,
+              'requests': requisições usadas, 'tiers': tamanho de cada camada,
+              'selected': quantidade escolhida por camada}
+    """
+    active_users, recent_users = get_user_activity_tiers()
+    tiers = {'active': set(), 'recent': set(), 'dormant': set()}
+    for user_id, tickers in _tickers_by_user().items():
+        if user_id in active_users:
+            tiers['active'].update(tickers)
+        elif user_id in recent_users:
+            tiers['recent'].update(tickers)
+        else:
+            tiers['dormant'].update(tickers)
+    # Tickers que só estão no PriceCache também são mantidos, como inativos
+    tiers['dormant'].update(format_ticker(row.ticker) for row in PriceCache.query.with_entities(PriceCache.ticker))
+    # Cada ticker fica na camada mais prioritária; o câmbio é atualizado à parte
+    tiers['recent'] -= tiers['active']
+    tiers['dormant'] -= tiers['active'] | tiers['recent']
+    for tickers in tiers.values():
+        tickers.difference_update(FX_PAIRS.values())
+
+    all_tickers = set().union(*tiers.values())
+    per_request = _request_tickers()
+    budget = _accrue_budget(len(all_tickers), per_request)
+    if not budget:
+        return {'tickers': [], 'budget': 0, 'requests': 0, 'tiers': {tier: len(tickers) for tier, tickers in tiers.items()}, 'selected': {}}
+    due, _ = ticker_registry.filter_due(all_tickers)
+    due = set(due)
+    entries = price_cache_service.get_many(due)
+    open_exchanges = {exchange: is_exchange_open(exchange) for exchange in ('B3', 'NYSE', 'FX')}
+
+    plan = []
+    selected = {}
+    for tier, interval in REFRESH_TIERS:
+        candidates = []
+        for ticker in tiers[tier] & due:
+            entry = entries[ticker]
+            if entry['status'] == 'missing':
+                candidates.append((math.inf, ticker))
+                continue
+            # Preço obtido com a bolsa fechada continua válido até a próxima abertura
+            if entry['status'] == 'fresh' and not open_exchanges[get_ticker_exchange(ticker)]:
+                continue
+            if entry['age_seconds'] >= interval:
+                candidates.append((entry['age_seconds'], ticker))
+        # Preços mais antigos primeiro
+        candidates.sort(reverse=True)
+        chosen = [ticker for _, ticker in candidates[:budget * per_request - len(plan)]]
+        selected[tier] = len(chosen)
+        plan.extend(chosen)
+
+    return {
+        'tickers': plan,
+        'budget': budget,
+        'requests': math.ceil(len(plan) / per_request),
+        'tiers': {tier: len(tickers) for tier, tickers in tiers.items()},
+        'selected': selected
+    }
+
+def refresh_prices_by_priority():
+    """
+    Executa um ciclo de atualização: planeja e busca em lote os tickers escolhidos.
+
+    Returns:
+        dict: Resumo do planejamento (ver plan_refresh) com a quantidade atualizada
+    """
+    plan = plan_refresh()
+    tickers = plan['tickers']
+    updated = 0
+    if tickers:
+        result = types.SimpleNamespace(delisted_tickers=[], total_tickers=len(tickers))
+        prices = fetch_last_prices(tickers)
+        process_quote_results(prices, tickers, result)
+        consulted = [t for t in tickers if t not in unavailable_tickers(prices)]
+        update_price_cache_db(result.delisted_tickers, len(consulted), consulted)
+        updated = len(consulted) - len(result.delisted_tickers)
+        _budget['credit'] = max(0.0, _budget['credit'] - plan['requests'])
+        print(f"[REFRESH] {updated}/{len(tickers)} tickers atualizados em {plan['requests']} requisições "
+              f"(orçamento {plan['budget']}, por camada {plan['selected']})")
+
+    with _last_plan_lock:
+        _last_plan.clear()
+        _last_plan.update({k: v for k, v in plan.items() if k != 'tickers'}, updated=updated)
+    return plan
+
+def get_refresh_stats():
+    """Retorna o resumo do último ciclo de atualização por prioridade."""
+    with _last_plan_lock:
+        return dict(_last_plan)
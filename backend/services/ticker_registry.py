@@ -0,0 +1,92 @@
+"""
+Registro persistente de tickers sem cotação no provedor (possivelmente delisted).
+
+Um ticker que falha não é mais removido do PriceCache: ele entra na tabela
+FailedTicker e deixa de ser consultado até next_probe. O intervalo até a próxima
+tentativa dobra a cada falha seguida (até PROBE_MAX_SECONDS), e um sucesso
+remove o ticker do registro.
+"""
+from datetime import datetime, timedelta
+
+from extensions.database import db, bulk_upsert
+from models.price import FailedTicker
+
+# Intervalo até a primeira nova tentativa e teto do backoff (segundos)
+PROBE_BASE_SECONDS = 3600
+PROBE_MAX_SECONDS = 7 * 24 * 3600
+
+def _probe_interval(failure_count):
+    """Intervalo até a próxima tentativa após failure_count falhas seguidas."""
+    return timedelta(seconds=min(PROBE_BASE_SECONDS * 2 ** (failure_count - 1), PROBE_MAX_SECONDS))
+
+def filter_due(tickers):
+    """
+    Separa os tickers que podem ser consultados agora dos que aguardam nova tentativa.
+
+    Args:
+        tickers (iterable): Tickers formatados
+
+    Returns:
+        tuple: (lista de tickers a consultar, set de tickers ignorados)
+    """
+    tickers = list(tickers)
+    if not tickers:
+        return [], set()
+    now = datetime.now()
+    waiting = {
+        row.ticker for row in FailedTicker.query.with_entities(FailedTicker.ticker).filter(
+            FailedTicker.ticker.in_(tickers),
+            FailedTicker.next_probe > now
+        )
+    }
+    return [t for t in tickers if t not in waiting], waiting
+
+def record_results(succeeded=(), failed=(), error=None):
+    """
+    Atualiza o registro após uma consulta: tickers com cotação saem do registro e
+    tickers sem cotação têm a contagem de falhas incrementada. Não faz commit.
+
+    Args:
+        succeeded (iterable): Tickers que retornaram cotação
+        failed (iterable): Tickers sem cotação
+        error (str, optional): Descrição da falha
+    """
+    succeeded = list(succeeded)
+    failed = list(failed)
+    if succeeded:
+        FailedTicker.query.filter(FailedTicker.ticker.in_(succeeded)).delete(synchronize_session=False)
+    if not failed:
+        return
+
+    now = datetime.now()
+    existing = {row.ticker: row for row in FailedTicker.query.filter(FailedTicker.ticker.in_(failed))}
+    rows = []
+    for ticker in failed:
+        row = existing.get(ticker)
+        failure_count = row.failure_count + 1 if row else 1
+        rows.append({
+            'ticker': ticker,
+            'failure_count': failure_count,
+            'first_failed': row.first_failed if row else now,
+            'last_attempt': now,
+            'next_probe': now + _probe_interval(failure_count),
+            'last_error': (error or 'Sem cotação no provedor')[:255]
+        })
+    bulk_upsert(FailedTicker, rows, ['ticker'], ['failure_count', 'last_attempt', 'next_probe', 'last_error'])
+
+def get_registry_stats():
+    """
+    Retorna o tamanho do registro e quantos tickers aguardam nova tentativa.
+
+    Returns:
+        dict: {'tracked', 'waiting', 'next_probe'}
+    """
+    now = datetime.now()
+    tracked = FailedTicker.query.count()
+    waiting = FailedTicker.query.filter(FailedTicker.next_probe > now).count()
+    next_probe = db.session.query(db.func.min(FailedTicker.next_probe)).filter(FailedTicker.next_probe > now).scalar()
+    return {
+        'tracked': tracked,
+        'waiting': waiting,
+        'next_probe': next_probe.isoformat() if next_probe else None
+    }
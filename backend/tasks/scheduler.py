@@ -12,12 +12,12 @@ import uuid
 import sys
 
 from flask import Flask
-from services.price_service import update_price_cache_for_all_tickers, get_cached_dollar_rate
+from services.price_service import get_cached_dollar_rate
 from services.dividend_service import update_dividends_cache_for_all_users
+from services.refresh_planner import refresh_prices_by_priority, REFRESH_CYCLE_SECONDS
 from utils.market_utils import is_market_open
 from utils.cache_utils import is_rate_limited, handle_rate_limit, reset_rate_limit
 from extensions.database import execute_with_retry, db
-from models.price import PriceCache
 
 # Detectar se está rodando no reloader do Flask
 # WERKZEUG_RUN_MAIN == 'true' indica processo principal do Flask
@@ -33,64 +33,8 @@ instance_id = str(uuid.uuid4())
 # Controle de última atualização para evitar atualizações muito frequentes
 last_price_update_time = datetime.now() - timedelta(hours=1)
 
-# Lista de tickers que foram marcados como "delisted" e devem ser ignorados
-delisted_tickers = set()
-
-# Função para atualizar preços com remoção de tickers "possibly delisted"
-def update_prices_with_delisted_handling():
-    """
-    Atualiza preços e remove tickers marcados como "possibly delisted"
-    """
-    from models.portfolio import Portfolio
-    import json
-    
-    global last_price_update_time
-    
-    # Verifica se já atualizou recentemente (menos de 25 minutos atrás)
-    now = datetime.now()
-    if (now - last_price_update_time).total_seconds() < 1500:  # 25 minutos em segundos
-        print(f"[PRICECACHE] Última atualização foi há {(now - last_price_update_time).total_seconds() / 60:.1f} minutos. Pulando atualização.")
-        return
-    
-    print(f"[PRICECACHE] Iniciando atualização de preços (última atualização: {(now - last_price_update_time).total_seconds() / 60:.1f} minutos atrás).")
-    
-    # Atualiza o tempo da última atualização ANTES de começar para evitar múltiplas atualizações simultâneas
-    last_price_update_time = now
-        
-    # Se todos os tickers derem erro, pode ser rate limit
-    all_tickers_failed = False
-    
-    try:
-        # Primeira tentativa de atualização normal
-        result = update_price_cache_for_all_tickers()
-        
-        # Verificar se temos tickers com erro "possibly delisted"
-        if hasattr(result, 'delisted_tickers') and result.delisted_tickers:
-            # Se todos os tickers falharam, provavelmente é rate limit
-            if result.total_tickers > 0 and len(result.delisted_tickers) == result.total_tickers:
-                print("[RATE LIMIT] Todos os tickers falharam, possível rate limit. Não removendo tickers.")
-                all_tickers_failed = True
-                return
-                
-            # Caso contrário, podemos remover os tickers delisted
-            if not all_tickers_failed and result.delisted_tickers:
-                # Adiciona à lista global de delisted
-                for ticker in result.delisted_tickers:
-                    delisted_tickers.add(ticker)
-                    
-                # Remove do banco de dados
-                for ticker in result.delisted_tickers:
-                    print(f"[DELISTED] Removendo ticker {ticker} marcado como 'possibly delisted'")
-                    try:
-                        PriceCache.query.filter_by(ticker=ticker).delete()
-                    except Exception as e:
-                        print(f"[ERROR] Erro ao remover ticker {ticker}: {e}")
-                
-                # Commit das alterações
-                db.session.commit()
-                print(f"[DELISTED] {len(result.delisted_tickers)} tickers removidos do cache")
-    except Exception as e:
-        print(f"[ERROR] Erro ao atualizar preços com tratamento de delisted: {e}")
+# Intervalo de atualização do dólar durante o pregão (segundos)
+DOLLAR_REFRESH_SECONDS = 1800
 
 def schedule_dividends_update():
     """
@@ -178,8 +122,8 @@ def schedule_prices_update():
             try:
                 print('[PRICECACHE] Atualização diária programada iniciada.')
                 with flask_app.app_context():
-                    # Usando o sistema de retry
-                    execute_with_retry(update_price_cache_for_all_tickers)
+                    # Mesmo orçamento de requisições dos ciclos do pregão
+                    execute_with_retry(update_prices_by_priority)
             except Exception as e:
                 print(f'[PRICECACHE] Erro na atualização diária programada: {e}')
                 
@@ -192,9 +136,19 @@ def schedule_prices_update():
             sleep_seconds = (next_run - now).total_seconds()
             time.sleep(sleep_seconds)
 
+def update_prices_by_priority():
+    """
+    Ciclo de atualização de preços por prioridade de demanda (ver services.refresh_planner).
+    """
+    global last_price_update_time
+    refresh_prices_by_priority()
+    last_price_update_time = datetime.now()
+
 def update_all_portfolios():
     """
     Thread para atualização automática de preços enquanto o mercado está aberto.
+    A cada REFRESH_CYCLE_SECONDS atualiza os tickers escolhidos pelo planejador de
+    prioridade, dentro do orçamento de requisições do ciclo.
     """
     last_market_status = None
     dollar_counter = 0
@@ -230,14 +184,14 @@ def update_all_portfolios():
                 
                 with flask_app.app_context():
                     try:
-                        # Usando o sistema de retry com tratamento de delisted
-                        execute_with_retry(update_prices_with_delisted_handling)
+                        # Tickers de usuários ativos primeiro, dentro do orçamento do ciclo
+                        execute_with_retry(update_prices_by_priority)
                     except Exception as e:
                         print(f"[ERROR] Erro ao atualizar preços: {e}")
                 
-                # Atualiza o dólar a cada 10 ciclos (30 minutos)
+                # Atualiza o dólar a cada DOLLAR_REFRESH_SECONDS
                 dollar_counter += 1
-                if dollar_counter >= 10:
+                if dollar_counter >= DOLLAR_REFRESH_SECONDS // REFRESH_CYCLE_SECONDS:
                     with flask_app.app_context():
                         try:
                             def update_dollar():
@@ -251,8 +205,7 @@ def update_all_portfolios():
                                 handle_rate_limit()
                     dollar_counter = 0
                 
-                print(f"[SCHEDULER] Dormindo por 30 minutos antes da próxima atualização (mercado aberto)")
-                time.sleep(1800)  # 30 minutos entre atualizações quando mercado aberto
+                time.sleep(REFRESH_CYCLE_SECONDS)  # Ciclos curtos; o orçamento limita o volume de requisições
             else:
                 # Mercado fechado
                 if last_market_status != False:
@@ -299,7 +252,7 @@ def start_scheduled_tasks(app):
                     with app.app_context():
                         try:
                             print("[SCHEDULER] Iniciando atualização de preços em segundo plano...")
-                            execute_with_retry(update_prices_with_delisted_handling)
+                            execute_with_retry(update_prices_by_priority)
                             print("[SCHEDULER] Atualização de preços em segundo plano concluída.")
                         except Exception as e:
                             print(f"[SCHEDULER] Erro na atualização de preços em segundo plano: {e}")
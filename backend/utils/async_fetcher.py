@@ -0,0 +1,149 @@
+"""
+Camada assíncrona para as consultas de I/O ao provedor de dados de mercado.
+
+As bibliotecas de dados (yfinance) são síncronas: cada chamada roda em um pool de
+threads a partir de um loop asyncio dedicado, com um semáforo limitando a
+concorrência e um timeout por chamada. Um lote de chamadas submetido de uma vez
+leva o tempo da mais lenta, e não a soma de todas.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Chamadas simultâneas ao provedor e tempo máximo de cada uma (segundos)
+FETCH_CONCURRENCY = 8
+FETCH_TIMEOUT_SECONDS = 60
+
+class AsyncFetcher:
+    """
+    Executa lotes de chamadas bloqueantes de forma concorrente em um loop asyncio
+    próprio (em uma thread de fundo), para ser usado a partir de código síncrono
+    (requisições Flask e threads do scheduler).
+    """
+
+    def __init__(self, concurrency=FETCH_CONCURRENCY, timeout=FETCH_TIMEOUT_SECONDS):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.submitted = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._loop = None
+        self._executor = None
+        self._semaphore = None
+        self._worker = threading.local()
+        self._lock = threading.Lock()
+
+    def configure(self, concurrency, timeout):
+        """Redefine a concorrência e o timeout (vale para o próximo loop iniciado)."""
+        with self._lock:
+            self.concurrency = concurrency
+            self.timeout = timeout
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._executor.shutdown(wait=False)
+                self._loop = None
+
+    def _ensure_loop(self):
+        """Inicia, na primeira utilização, o loop asyncio e o pool de threads."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency,
+                    thread_name_prefix='fetcher',
+                    initializer=self._mark_worker
+                )
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                threading.Thread(target=loop.run_forever, name='fetcher-loop', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _mark_worker(self):
+        self._worker.active = True
+
+    async def _call(self, loop, func, timeout):
+        async with self._semaphore:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, func), timeout)
+
+    async def _gather(self, loop, calls, timeout):
+        return await asyncio.gather(*(self._call(loop, func, timeout) for func in calls), return_exceptions=True)
+
+    def run_all(self, calls, timeout=None):
+        """
+        Executa as chamadas concorrentemente e aguarda todas.
+
+        Args:
+            calls (list): Funções sem argumentos (bloqueantes)
+            timeout (float, optional): Tempo máximo de cada chamada. Default é self.timeout.
+
+        Returns:
+            list: Resultado de cada chamada, na mesma ordem; chamadas que falharam
+                ou excederam o timeout retornam a exceção correspondente
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+        self.submitted += len(calls)
+        if getattr(self._worker, 'active', False):
+            # Chamada aninhada a partir do próprio pool: executa em sequência para não esgotá-lo
+            results = []
+            for func in calls:
+                try:
+                    results.append(func())
+                except Exception as e:
+                    results.append(e)
+        else:
+            loop = self._ensure_loop()
+            future = asyncio.run_coroutine_threadsafe(self._gather(loop, calls, timeout or self.timeout), loop)
+            results = future.result()
+        for result in results:
+            if isinstance(result, asyncio.TimeoutError):
+                self.timeouts += 1
+            elif isinstance(result, Exception):
+                self.errors += 1
+        return results
+
+    def stats(self):
+        """Retorna a configuração e os contadores da camada de busca."""
+        return {
+            'concurrency': self.concurrency,
+            'timeout_seconds': self.timeout,
+            'submitted': self.submitted,
+            'timeouts': self.timeouts,
+            'errors': self.errors
+        }
+
+# Camada de busca compartilhada pelo processo
+fetcher = AsyncFetcher()
+
+def run_batch(calls):
+    """
+    Executa um lote de buscas de alto nível (ex.: um get_history por intervalo).
+    Uma única chamada roda na própria thread, pois o provedor já busca os seus
+    lotes em paralelo; várias chamadas são submetidas juntas à camada assíncrona.
+
+    Args:
+        calls (list): Funções sem argumentos
+
+    Returns:
+        list: Resultado ou exceção de cada chamada, na mesma ordem
+    """
+    calls = list(calls)
+    if len(calls) != 1:
+        return fetcher.run_all(calls)
+    try:
+        return [calls[0]()]
+    except Exception as e:
+        return [e]
+
+def configure_fetcher(config):
+    """
+    Aplica a concorrência e o timeout definidos na configuração da aplicação.
+
+    Args:
+        config (dict): app.config (MARKET_DATA_CONCURRENCY e MARKET_DATA_TIMEOUT_SECONDS)
+    """
+    fetcher.configure(
+        config.get('MARKET_DATA_CONCURRENCY', FETCH_CONCURRENCY),
+        config.get('MARKET_DATA_TIMEOUT_SECONDS', FETCH_TIMEOUT_SECONDS)
+    )
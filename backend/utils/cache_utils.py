@@ -1,79 +1,400 @@
+import json
 import threading
-from datetime import datetime, timedelta
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-# Cache global para evolução do portfólio
-_evolution_cache = {}
-evolution_cache_lock = threading.Lock()
+from flask import current_app
+
+from utils.rate_limiter import rate_limit_pause, request_limiter
+
+# Limites do cache de evolução do portfólio: tempo de vida (segundos), entradas e memória (bytes)
+EVOLUTION_CACHE_TTL = 120
+EVOLUTION_CACHE_ENTRIES = 512
+EVOLUTION_CACHE_BYTES = 32 * 1024 * 1024
+
+# Tempo após a expiração em que uma resposta ainda é servida, marcada como desatualizada,
+# enquanto é recalculada em segundo plano (segundos)
+STALE_WHILE_REVALIDATE_SECONDS = 600
+
+# Workers das revalidações em segundo plano
+REVALIDATE_WORKERS = 2
 
 # Cache para cotação do dólar
 dollar_cache = {'rate': 5.8187, 'timestamp': datetime(2000, 1, 1)}
 dollar_cache_lock = threading.Lock()
 
-# Cache para controle de rate limit
-rate_limit_pause = {'until': None, 'hours': 1}
-rate_limit_lock = threading.Lock()
+class LRUCache:
+    """
+    Cache em memória com descarte do item menos usado (LRU), limitado por
+    quantidade de entradas e/ou por memória (bytes estimados por sizeof).
+    
+    Opcionalmente, as entradas expiram após ttl segundos e podem ser agrupadas
+    por uma etiqueta (ex.: o usuário) para invalidação conjunta com pop_tag.
+    Mantém contadores de acertos, faltas, descartes e expirações.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._tags = {}
+        self._key_tags = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        """Retorna (True, valor) se a chave existir e não estiver expirada (chamado com o lock adquirido)."""
+        if key not in self._data:
+            self.misses += 1
+            return False, None
+        if key in self._expires and self._expires[key] <= now:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return True, self._data[key]
+
+    def get(self, key, default=None):
+        """Retorna o valor da chave (marcando-a como recém-usada) ou default."""
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            return value if found else default
+
+    def get_many(self, keys):
+        """Retorna um dicionário apenas com as chaves presentes no cache."""
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for key in keys:
+                found, value = self._lookup(key, now)
+                if found:
+                    result[key] = value
+            return result
+
+    def put(self, key, value, tag=None, ttl=None):
+        """
+        Armazena um valor, descartando os itens menos usados se passar dos limites.
+        
+        Args:
+            key: Chave
+            value: Valor
+            tag (optional): Etiqueta para invalidação conjunta (ver pop_tag)
+            ttl (float, optional): Tempo de vida em segundos (default: self.ttl)
+        """
+        with self._lock:
+            now = time.monotonic()
+            ttl = self.ttl if ttl is None else ttl
+            if self._expires and now - self._last_sweep >= (self.ttl or 60):
+                self._sweep(now)
+            self._remove(key)
+            self._data[key] = value
+            self._sizes[key] = self.sizeof(value)
+            self.bytes += self._sizes[key]
+            if ttl is not None:
+                self._expires[key] = now + ttl
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+                self._key_tags[key] = tag
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes and len(self._data) > 1)
+            ):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _sweep(self, now):
+        """Remove todas as entradas expiradas (chamado com o lock adquirido)."""
+        for key in [k for k, expires in self._expires.items() if expires <= now]:
+            self._remove(key)
+            self.expirations += 1
+        self._last_sweep = now
+
+    def _remove(self, key):
+        """Remove uma chave (chamado com o lock adquirido)."""
+        if key in self._data:
+            del self._data[key]
+            self.bytes -= self._sizes.pop(key)
+            self._expires.pop(key, None)
+            tag = self._key_tags.pop(key, None)
+            if tag is not None:
+                keys = self._tags[tag]
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def pop(self, key):
+        """Remove uma chave do cache, se existir."""
+        with self._lock:
+            self._remove(key)
+
+    def pop_tag(self, tag):
+        """
+        Remove todas as entradas de uma etiqueta, sem percorrer o cache inteiro.
+        
+        Returns:
+            int: Quantidade de entradas removidas
+        """
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        """Remove todas as entradas."""
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._expires.clear()
+            self._tags.clear()
+            self._key_tags.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Retorna o estado e os contadores do cache.
+        
+        Returns:
+            dict: entries, bytes, hits, misses, evictions, expirations e hit_rate (%)
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(100.0 * self.hits / lookups, 1) if lookups else 0.0
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+def _estimate_size(value):
+    """Estimativa do tamanho de uma resposta em memória (bytes do JSON serializado)."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
 
-# Lock para cache de portfólio
-portfolio_cache_lock = threading.Lock()
+# Marca de um cálculo que terminou com exceção (nada é armazenado)
+_FAILED = object()
 
-def get_from_evolution_cache(key):
+# Executor das revalidações em segundo plano das respostas desatualizadas
+_revalidate_executor = ThreadPoolExecutor(max_workers=REVALIDATE_WORKERS, thread_name_prefix='revalidate')
+
+class StaleWhileRevalidateCache:
+    """
+    Cache de respostas com política stale-while-revalidate: dentro de ttl a
+    resposta é servida normalmente; até stale_ttl segundos depois ela ainda é
+    servida imediatamente, marcada como desatualizada, enquanto um worker em
+    segundo plano (no contexto da aplicação) a recalcula para as próximas
+    requisições. Só sem resposta em cache o cálculo é feito na requisição.
+    
+    Cada cálculo em andamento guarda a geração da sua chave; set e pop_tag avançam
+    a geração, e o resultado de um cálculo iniciado antes disso é descartado, para
+    que uma resposta anterior à invalidação não volte ao cache.
+    """
+
+    def __init__(self, ttl, stale_ttl=STALE_WHILE_REVALIDATE_SECONDS, max_entries=None, max_bytes=None):
+        self.ttl = ttl
+        self._cache = LRUCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            sizeof=lambda entry: _estimate_size(entry['data']),
+            ttl=ttl + stale_ttl
+        )
+        self._revalidating = set()
+        # Cálculos em andamento: chave -> {'generation', 'tag', 'count'}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.revalidations = 0
+
+    def get(self, key):
+        """Retorna a resposta se ainda estiver dentro do ttl, ou None."""
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() < entry['fresh_until']:
+            return entry['data']
+        return None
+
+    def set(self, key, data, tag=None):
+        """Armazena uma resposta, opcionalmente etiquetada (ex.: pelo usuário)."""
+        with self._lock:
+            state = self._inflight.get(key)
+            if state is not None:
+                state['generation'] += 1
+            self._put(key, data, tag)
+
+    def _put(self, key, data, tag):
+        """Grava a entrada no LRUCache (chamado com o lock adquirido)."""
+        self._cache.put(key, {'data': data, 'fresh_until': time.monotonic() + self.ttl}, tag=tag)
+
+    def _begin_compute(self, key, tag):
+        """Registra um cálculo da chave e retorna a geração em que ele começou."""
+        with self._lock:
+            state = self._inflight.setdefault(key, {'generation': 0, 'tag': tag, 'count': 0})
+            state['count'] += 1
+            return state['generation']
+
+    def _finish_compute(self, key, generation, data, tag, should_cache):
+        """
+        Encerra um cálculo e armazena o resultado se a chave não foi invalidada
+        nesse meio tempo. Retorna True se o resultado foi armazenado.
+        """
+        with self._lock:
+            state = self._inflight[key]
+            state['count'] -= 1
+            if not state['count']:
+                del self._inflight[key]
+            if state['generation'] != generation or data is _FAILED or not should_cache(data):
+                return False
+            self._put(key, data, tag)
+            return True
+
+    def get_or_compute(self, key, compute, tag=None, should_cache=None):
+        """
+        Obtém a resposta do cache ou a calcula.
+        
+        Args:
+            key: Chave da resposta
+            compute (callable): Função sem argumentos que calcula a resposta; não pode
+                depender da requisição nem da sessão, pois também roda em segundo plano
+            tag (optional): Etiqueta da entrada (ver LRUCache.pop_tag)
+            should_cache (callable, optional): Indica se um resultado deve ser armazenado
+                (default: qualquer resultado diferente de None)
+                
+        Returns:
+            tuple: (resposta, bool indicando se a resposta está desatualizada)
+        """
+        should_cache = should_cache or (lambda result: result is not None)
+        entry = self._cache.get(key)
+        if entry is not None:
+            if time.monotonic() < entry['fresh_until']:
+                return entry['data'], False
+            self._schedule_revalidation(key, compute, tag, should_cache)
+            return entry['data'], True
+        generation = self._begin_compute(key, tag)
+        data = _FAILED
+        try:
+            data = compute()
+        finally:
+            self._finish_compute(key, generation, data, tag, should_cache)
+        return data, False
+
+    def _schedule_revalidation(self, key, compute, tag, should_cache):
+        """Agenda o recálculo de uma chave, uma única vez por chave."""
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        app = current_app._get_current_object()
+        _revalidate_executor.submit(self._revalidate, app, key, compute, tag, should_cache)
+
+    def _revalidate(self, app, key, compute, tag, should_cache):
+        generation = self._begin_compute(key, tag)
+        data = _FAILED
+        try:
+            with app.app_context():
+                data = compute()
+        except Exception as e:
+            print(f"[CACHE] Erro ao revalidar {key} em segundo plano: {e}")
+        finally:
+            stored = self._finish_compute(key, generation, data, tag, should_cache)
+            with self._lock:
+                if stored:
+                    self.revalidations += 1
+                self._revalidating.discard(key)
+
+    def pop_tag(self, tag):
+        """Remove todas as respostas de uma etiqueta e descarta os cálculos em andamento dela."""
+        with self._lock:
+            for state in self._inflight.values():
+                if state['tag'] == tag:
+                    state['generation'] += 1
+            return self._cache.pop_tag(tag)
+
+    def stats(self):
+        """Estado do cache (ver LRUCache.stats) e quantidade de revalidações concluídas."""
+        stats = self._cache.stats()
+        with self._lock:
+            stats['revalidations'] = self.revalidations
+            stats['revalidating'] = len(self._revalidating)
+        return stats
+
+# Respostas dos endpoints do painel, servidas com stale-while-revalidate
+_response_caches = {
+    'evolution': StaleWhileRevalidateCache(
+        ttl=EVOLUTION_CACHE_TTL,
+        max_entries=EVOLUTION_CACHE_ENTRIES,
+        max_bytes=EVOLUTION_CACHE_BYTES
+    ),
+    'distribution': StaleWhileRevalidateCache(ttl=60, max_entries=EVOLUTION_CACHE_ENTRIES),
+    'dividends': StaleWhileRevalidateCache(ttl=300, max_entries=EVOLUTION_CACHE_ENTRIES),
+}
+
+def get_cached_response(name, key, compute, user_id, should_cache=None):
     """
-    Obtém um valor do cache de evolução de portfólio.
+    Obtém a resposta de um endpoint do painel com stale-while-revalidate.
     
     Args:
-        key (str): Chave para busca no cache
+        name (str): Cache a usar ('evolution', 'distribution' ou 'dividends')
+        key (str): Chave da resposta
+        compute (callable): Função sem argumentos que calcula a resposta
+        user_id (str): Dono da resposta (para invalidação)
+        should_cache (callable, optional): Ver StaleWhileRevalidateCache.get_or_compute
         
     Returns:
-        dict: Dados do cache ou None se não encontrado ou expirado
+        tuple: (resposta, bool indicando se a resposta está desatualizada)
     """
-    with evolution_cache_lock:
-        if key in _evolution_cache:
-            cached = _evolution_cache[key]
-            if (datetime.now() - cached['timestamp']).total_seconds() < 120:
-                return cached['data']
-    return None
+    return _response_caches[name].get_or_compute(key, compute, tag=user_id, should_cache=should_cache)
 
-def set_evolution_cache(key, data):
+def clear_response_caches_for_user(user_id, names=None):
     """
-    Armazena um valor no cache de evolução de portfólio.
+    Descarta as respostas em cache de um usuário (após mudanças na carteira ou nos dividendos).
     
     Args:
-        key (str): Chave para o armazenamento
-        data (dict): Dados a serem armazenados
+        user_id (str): ID do usuário
+        names (list, optional): Caches a limpar; por padrão, todos
     """
-    with evolution_cache_lock:
-        _evolution_cache[key] = {
-            'timestamp': datetime.now(),
-            'data': data
-        }
+    for name in names or _response_caches:
+        _response_caches[name].pop_tag(user_id)
 
-def clear_evolution_cache_for_user(user_id):
+def get_response_cache_stats():
     """
-    Limpa o cache de evolução para um usuário específico.
+    Retorna o estado de cada cache de respostas do painel.
     
-    Args:
-        user_id (str): ID do usuário
+    Returns:
+        dict: Mapa nome -> estatísticas (ver StaleWhileRevalidateCache.stats)
     """
-    with evolution_cache_lock:
-        keys_to_delete = [k for k in _evolution_cache if k.startswith(f"{user_id}:")]
-        for k in keys_to_delete:
-            del _evolution_cache[k]
+    return {name: cache.stats() for name, cache in _response_caches.items()}
             
-def handle_rate_limit(hours=None):
+def handle_rate_limit(seconds=None):
     """
-    Configura uma pausa por rate limit.
+    Configura uma pausa por rate limit e reduz a taxa de requisições ao provedor.
+    A pausa dobra a cada rate limit seguido, até RATE_LIMIT_MAX_PAUSE_SECONDS.
     
     Args:
-        hours (int, optional): Número de horas para pausa. Se None, usa o valor atual incrementado.
+        seconds (int, optional): Duração da pausa. Se None, usa o backoff atual.
     """
-    with rate_limit_lock:
-        now = datetime.now()
-        if hours is not None:
-            rate_limit_pause['hours'] = hours
-        rate_limit_pause['until'] = now + timedelta(hours=rate_limit_pause['hours'])
-        print(f"[RATE LIMIT] yfinance bloqueado. Pausando atualizações por {rate_limit_pause['hours']}h até {rate_limit_pause['until']}")
-        # Incrementa o tempo de espera exponencialmente para a próxima pausa
-        rate_limit_pause['hours'] *= 2
+    duration, until = rate_limit_pause.trigger(seconds)
+    request_limiter.penalize()
+    print(f"[RATE LIMIT] yfinance bloqueado. Pausando atualizações por {duration}s até {until}")
 
 def is_rate_limited():
     """
@@ -82,13 +403,10 @@ def is_rate_limited():
     Returns:
         bool: True se estiver em pausa, False caso contrário
     """
-    with rate_limit_lock:
-        return rate_limit_pause['until'] is not None and datetime.now() < rate_limit_pause['until']
+    return rate_limit_pause.active()
 
 def reset_rate_limit():
     """
     Reseta a pausa por rate limit.
     """
-    with rate_limit_lock:
-        rate_limit_pause['until'] = None
-        rate_limit_pause['hours'] = 1
\ No newline at end of file
+    rate_limit_pause.reset()
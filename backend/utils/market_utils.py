@@ -1,34 +1,95 @@
-from datetime import datetime, time as dt_time
+from datetime import datetime, timedelta, time as dt_time
 import pytz
 
-def is_market_open():
+# Fuso horário de referência dos horários de mercado
+MARKET_TZ = pytz.timezone('America/Sao_Paulo')
+
+# Horário de funcionamento de cada bolsa, em horário de Brasília
+EXCHANGE_HOURS = {
+    # B3: 10:00 - 17:55
+    'B3': (dt_time(10, 0), dt_time(17, 55)),
+    # NYSE (aproximado, em horário de Brasília)
+    'NYSE': (dt_time(10, 30), dt_time(17, 0)),
+    # Câmbio: negociado o dia todo em dias úteis
+    'FX': (dt_time(0, 0), dt_time(23, 59, 59)),
+}
+
+# Validade de um preço obtido com a bolsa aberta (segundos)
+LIVE_PRICE_TTL_SECONDS = 300
+
+def _to_market_time(when=None):
+    """Converte um datetime (sem fuso = horário local do servidor) para o horário de Brasília."""
+    if when is None:
+        return datetime.now(MARKET_TZ)
+    return when.astimezone(MARKET_TZ)
+
+def is_exchange_open(exchange, when=None):
     """
-    Verifica se o mercado está aberto no momento atual.
-    Considera o horário de funcionamento da B3 e da NYSE, convertidos para horário de Brasília.
+    Verifica se uma bolsa está aberta em um determinado momento.
     
+    Args:
+        exchange (str): Bolsa ('B3', 'NYSE' ou 'FX')
+        when (datetime, optional): Momento a verificar. Default é agora.
+        
     Returns:
-        bool: True se algum mercado estiver aberto, False caso contrário
+        bool: True se a bolsa estiver aberta
     """
-    now = datetime.now(pytz.timezone('America/Sao_Paulo'))
-    weekday = now.weekday()  # 0=Segunda,6=Domingo
-    current_time = now.time()
-
+    when = _to_market_time(when)
     # Finais de semana - mercado fechado
-    if weekday >= 5:
+    if when.weekday() >= 5:
         return False
+    open_time, close_time = EXCHANGE_HOURS.get(exchange, EXCHANGE_HOURS['B3'])
+    return open_time <= when.time() <= close_time
 
-    # B3: 10:00 - 17:55
-    b3_open_time = dt_time(10, 0)
-    b3_close_time = dt_time(17, 55)
+def get_next_exchange_open(exchange, when=None):
+    """
+    Retorna o próximo horário de abertura de uma bolsa.
     
-    # NYSE (aproximado, em horário de Brasília)
-    ny_open_time_br = dt_time(10, 30)
-    ny_close_time_br = dt_time(17, 0)
+    Args:
+        exchange (str): Bolsa ('B3', 'NYSE' ou 'FX')
+        when (datetime, optional): Momento de referência. Default é agora.
+        
+    Returns:
+        datetime: Próxima abertura, em horário de Brasília (o próprio momento se já estiver aberta)
+    """
+    when = _to_market_time(when)
+    if is_exchange_open(exchange, when):
+        return when
+    open_time, _ = EXCHANGE_HOURS.get(exchange, EXCHANGE_HOURS['B3'])
+    next_opening = when.replace(hour=open_time.hour, minute=open_time.minute, second=0, microsecond=0)
+    if when.weekday() >= 5 or when.time() >= open_time:
+        next_opening += timedelta(days=1)
+    while next_opening.weekday() >= 5:
+        next_opening += timedelta(days=1)
+    return next_opening
 
-    is_b3_open = b3_open_time <= current_time <= b3_close_time
-    is_nyse_open = ny_open_time_br <= current_time <= ny_close_time_br
+def get_price_expiry(exchange, fetched_at):
+    """
+    Calcula até quando um preço continua válido, conforme o pregão da sua bolsa.
+    Preços obtidos com a bolsa aberta valem LIVE_PRICE_TTL_SECONDS; preços obtidos
+    com a bolsa fechada valem até a próxima abertura.
+    
+    Args:
+        exchange (str): Bolsa do ticker ('B3', 'NYSE' ou 'FX')
+        fetched_at (datetime): Momento em que o preço foi obtido
+        
+    Returns:
+        datetime: Momento de expiração, em horário de Brasília
+    """
+    fetched_at = _to_market_time(fetched_at)
+    if is_exchange_open(exchange, fetched_at):
+        return fetched_at + timedelta(seconds=LIVE_PRICE_TTL_SECONDS)
+    return get_next_exchange_open(exchange, fetched_at)
+
+def is_market_open():
+    """
+    Verifica se o mercado está aberto no momento atual.
+    Considera o horário de funcionamento da B3 e da NYSE, convertidos para horário de Brasília.
     
-    return is_b3_open or is_nyse_open
+    Returns:
+        bool: True se algum mercado estiver aberto, False caso contrário
+    """
+    return is_exchange_open('B3') or is_exchange_open('NYSE')
 
 def get_next_market_open():
     """
@@ -37,27 +98,4 @@ def get_next_market_open():
     Returns:
         datetime: Data e hora da próxima abertura do mercado
     """
-    now = datetime.now(pytz.timezone('America/Sao_Paulo'))
-    weekday = now.weekday()  # 0=Segunda,6=Domingo
-    
-    # Se for final de semana, a próxima abertura será na segunda-feira
-    if weekday >= 5:  # Sábado ou domingo
-        days_to_add = 7 - weekday  # Dias para segunda-feira
-        next_opening = now.replace(hour=10, minute=0, second=0, microsecond=0)
-        return next_opening.replace(day=next_opening.day + days_to_add)
-    
-    # Se for durante a semana e antes da abertura
-    if now.time() < dt_time(10, 0):
-        return now.replace(hour=10, minute=0, second=0, microsecond=0)
-    
-    # Se for durante a semana após o fechamento
-    if now.time() > dt_time(17, 55):
-        if weekday == 4:  # Sexta-feira
-            days_to_add = 3  # Próxima abertura na segunda-feira
-        else:
-            days_to_add = 1  # Próxima abertura no dia seguinte
-        next_opening = now.replace(hour=10, minute=0, second=0, microsecond=0)
-        return next_opening.replace(day=next_opening.day + days_to_add)
-    
-    # Se estiver dentro do horário de funcionamento, já está aberto
-    return now
\ No newline at end of file
+    return min(get_next_exchange_open('B3'), get_next_exchange_open('NYSE'))
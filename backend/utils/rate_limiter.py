@@ -0,0 +1,255 @@
+"""
+Controle do ritmo de requisições ao provedor de dados de mercado.
+
+- TokenBucket: limita as requisições a uma taxa configurada (com rajadas de até
+  capacity requisições). Ao receber um rate limit a taxa cai pela metade e volta
+  a subir aos poucos a cada requisição bem-sucedida, de modo que as atualizações
+  se estabilizam na maior taxa sustentável.
+- TickerCircuitBreakers: um disjuntor por ticker. Tickers que falham seguidamente
+  ficam bloqueados por um intervalo crescente (e limitado), sem afetar os demais.
+- BackoffPause: pausa global acionada quando o provedor recusa as requisições
+  (rate limit), dobrando a cada recusa seguida até um teto.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+class TokenBucket:
+    """Limitador de taxa por balde de fichas, com redução e recuperação da taxa."""
+
+    def __init__(self, rate, capacity, min_rate=None):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 16
+        self.tokens = float(capacity)
+        self.acquired = 0
+        self.waited_seconds = 0.0
+        self.penalties = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate, capacity):
+        """Redefine a taxa máxima (requisições por segundo) e o tamanho das rajadas."""
+        with self._lock:
+            self.max_rate = self.rate = float(rate)
+            self.min_rate = self.max_rate / 16
+            self.capacity = float(capacity)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Aguarda até haver fichas disponíveis e as consome.
+
+        Args:
+            tokens (int): Quantidade de fichas (requisições)
+            timeout (float, optional): Espera máxima em segundos
+
+        Returns:
+            bool: True se as fichas foram obtidas, False se o timeout expirou
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.acquired += 1
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+            with self._lock:
+                self.waited_seconds += wait
+
+    def penalize(self):
+        """Reduz a taxa pela metade (até min_rate) após um rate limit do provedor."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.penalties += 1
+
+    def reward(self):
+        """Recupera gradualmente a taxa após uma requisição bem-sucedida."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+    def state(self):
+        """Retorna a taxa atual e os contadores do limitador."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate_per_second': round(self.rate, 3),
+                'max_rate_per_second': self.max_rate,
+                'capacity': self.capacity,
+                'tokens': round(self.tokens, 2),
+                'acquired': self.acquired,
+                'waited_seconds': round(self.waited_seconds, 1),
+                'penalties': self.penalties
+            }
+
+class TickerCircuitBreakers:
+    """
+    Disjuntores por ticker. Após threshold falhas seguidas o ticker fica bloqueado
+    (aberto) por cooldown segundos, dobrando a cada nova abertura até max_cooldown.
+    Vencido o bloqueio, o ticker volta a ser consultado (meio-aberto): um sucesso
+    fecha o disjuntor e uma falha o reabre.
+    """
+
+    def __init__(self, threshold, cooldown, max_cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        # Apenas tickers com falhas recentes: ticker -> {'failures', 'opened', 'open_until'}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, threshold, cooldown, max_cooldown):
+        """Redefine o limite de falhas e os intervalos de bloqueio."""
+        with self._lock:
+            self.threshold = threshold
+            self.cooldown = cooldown
+            self.max_cooldown = max_cooldown
+
+    def allowed(self, tickers):
+        """
+        Filtra os tickers que podem ser consultados agora.
+
+        Returns:
+            list: Tickers com disjuntor fechado ou com o bloqueio vencido
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                t for t in tickers
+                if t not in self._breakers or self._breakers[t]['open_until'] <= now
+            ]
+
+    def record(self, succeeded=(), failed=()):
+        """Registra o resultado das consultas de cada ticker."""
+        now = time.monotonic()
+        with self._lock:
+            for ticker in succeeded:
+                self._breakers.pop(ticker, None)
+            for ticker in failed:
+                breaker = self._breakers.setdefault(ticker, {'failures': 0, 'opened': 0, 'open_until': 0.0})
+                breaker['failures'] += 1
+                half_open = breaker['opened'] > 0
+                if half_open or breaker['failures'] >= self.threshold:
+                    breaker['opened'] += 1
+                    cooldown = min(self.cooldown * 2 ** (breaker['opened'] - 1), self.max_cooldown)
+                    breaker['open_until'] = now + cooldown
+
+    def state(self):
+        """Retorna os tickers com disjuntor aberto e os que acumulam falhas."""
+        now = time.monotonic()
+        with self._lock:
+            open_breakers = [
+                {'ticker': t, 'failures': b['failures'], 'reopens_in_seconds': round(b['open_until'] - now)}
+                for t, b in self._breakers.items() if b['open_until'] > now
+            ]
+            return {
+                'tracked': len(self._breakers),
+                'open': sorted(open_breakers, key=lambda b: b['ticker'])
+            }
+
+class BackoffPause:
+    """Pausa global por rate limit com backoff exponencial limitado a max_seconds."""
+
+    def __init__(self, base_seconds, max_seconds):
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.until = None
+        self.next_seconds = base_seconds
+        self.triggered = 0
+        self._lock = threading.Lock()
+
+    def configure(self, base_seconds, max_seconds):
+        """Redefine a pausa inicial e o teto da pausa (segundos)."""
+        with self._lock:
+            self.base_seconds = base_seconds
+            self.max_seconds = max_seconds
+            self.next_seconds = min(max(self.next_seconds, base_seconds), max_seconds)
+
+    def trigger(self, seconds=None):
+        """
+        Inicia uma pausa e dobra a duração da próxima (até max_seconds).
+
+        Args:
+            seconds (int, optional): Duração desta pausa. Se None, usa o backoff atual.
+
+        Returns:
+            tuple: (duração em segundos, fim da pausa)
+        """
+        with self._lock:
+            duration = min(seconds if seconds is not None else self.next_seconds, self.max_seconds)
+            self.until = datetime.now() + timedelta(seconds=duration)
+            self.next_seconds = min(duration * 2, self.max_seconds)
+            self.triggered += 1
+            return duration, self.until
+
+    def active(self):
+        """Indica se a pausa está em vigor."""
+        with self._lock:
+            return self.until is not None and datetime.now() < self.until
+
+    def reset(self):
+        """Encerra a pausa e volta o backoff à duração inicial."""
+        with self._lock:
+            self.until = None
+            self.next_seconds = self.base_seconds
+
+    def state(self):
+        """Retorna o fim da pausa atual e a duração da próxima."""
+        with self._lock:
+            active = self.until is not None and datetime.now() < self.until
+            return {
+                'active': active,
+                'until': self.until.isoformat() if active else None,
+                'next_pause_seconds': self.next_seconds,
+                'max_pause_seconds': self.max_seconds,
+                'triggered': self.triggered
+            }
+
+# Limitador e disjuntores compartilhados pelas requisições ao provedor (ver configure_rate_limits)
+request_limiter = TokenBucket(rate=2.0, capacity=5)
+ticker_breakers = TickerCircuitBreakers(threshold=3, cooldown=1800, max_cooldown=86400)
+rate_limit_pause = BackoffPause(base_seconds=300, max_seconds=3600)
+
+def configure_rate_limits(config):
+    """
+    Aplica os limites definidos na configuração da aplicação.
+
+    Args:
+        config (dict): app.config (MARKET_DATA_RATE, MARKET_DATA_BURST, RATE_LIMIT_*
+            e TICKER_BREAKER_*)
+    """
+    request_limiter.configure(config.get('MARKET_DATA_RATE', 2.0), config.get('MARKET_DATA_BURST', 5))
+    ticker_breakers.configure(
+        config.get('TICKER_BREAKER_THRESHOLD', 3),
+        config.get('TICKER_BREAKER_COOLDOWN_SECONDS', 1800),
+        config.get('TICKER_BREAKER_MAX_COOLDOWN_SECONDS', 86400)
+    )
+    rate_limit_pause.configure(
+        config.get('RATE_LIMIT_PAUSE_SECONDS', 300),
+        config.get('RATE_LIMIT_MAX_PAUSE_SECONDS', 3600)
+    )
+
+def get_rate_limit_state():
+    """
+    Retorna o estado do limitador de requisições, da pausa global e dos disjuntores por ticker.
+
+    Returns:
+        dict: {'limiter': ..., 'pause': ..., 'breakers': ...}
+    """
+    return {
+        'limiter': request_limiter.state(),
+        'pause': rate_limit_pause.state(),
+        'breakers': ticker_breakers.state()
+    }
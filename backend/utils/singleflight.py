@@ -0,0 +1,76 @@
+import threading
+
+class _Call:
+    """Chamada em andamento compartilhada pelos chamadores de uma mesma chave."""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalescência de chamadas concorrentes (single-flight) dentro do processo.
+    Chamadores simultâneos com a mesma chave aguardam uma única execução da
+    função e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._fetches = 0
+        self._coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Executa fn uma única vez para chamadas simultâneas com a mesma chave.
+        
+        Args:
+            key (hashable): Chave que identifica a chamada
+            fn (callable): Função sem argumentos que realiza a busca
+            
+        Returns:
+            Resultado de fn, compartilhado entre os chamadores coalescidos
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._fetches += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        """
+        Retorna os contadores de chamadas reais e coalescidas.
+        
+        Returns:
+            dict: {'fetches', 'coalesced', 'in_flight', 'saved_pct'}
+        """
+        with self._lock:
+            total = self._fetches + self._coalesced
+            return {
+                'fetches': self._fetches,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls),
+                'saved_pct': round(100.0 * self._coalesced / total, 1) if total else 0.0
+            }
@@ -1,27 +1,130 @@
 import re
+import sys
+import threading
+from functools import lru_cache
 
-def format_ticker(ticker):
+# Par de câmbio (Yahoo Finance) que converte cada moeda para BRL
+FX_PAIRS = {
+    'USD': 'USDBRL=X',
+}
+
+# Quantidade de grafias de ticker (ex.: 'petr4', 'PETR4', 'PETR4.SA') memorizadas na resolução
+SYMBOL_ALIAS_CACHE_SIZE = 8192
+
+# Ações americanas já formatadas: 1 a 5 letras e, nas classes de ação, '-A' a '-C' (ex.: 'BRK-B')
+_US_STOCK_RE = re.compile(r'[A-Z]{1,5}(-[A-C])?')
+
+# Classes de ação americanas na grafia com ponto ou hífen ('BRK.B', 'BRK-B')
+_US_CLASS_SHARE_RE = re.compile(r'([A-Z]{1,5})[.-]([A-C])')
+
+class Symbol:
     """
-    Adiciona '.SA' se for ticker BR (sem ponto ou '='); senão retorna o original.
-    
-    Args:
-        ticker (str): Código do ticker a ser formatado
-        
-    Returns:
-        str: Ticker formatado com sufixo .SA se necessário
+    Símbolo canônico de um ativo, criado uma única vez por processo.
+
+    Attributes:
+        ticker (str): Ticker formatado (ver format_ticker), internado; é a chave
+            usada pelos caches e tabelas
+        type (str): 'BR', 'US', 'BDR' ou 'FX'
+        currency (str): Moeda de cotação ('BRL' ou 'USD'; pares de câmbio, a moeda cotada)
+        exchange (str): Bolsa usada para os horários de pregão ('B3', 'NYSE' ou 'FX')
+    """
+    __slots__ = ('ticker', 'type', 'currency', 'exchange')
+
+    def __init__(self, ticker, type, currency, exchange):
+        self.ticker = ticker
+        self.type = type
+        self.currency = currency
+        self.exchange = exchange
+
+    def __repr__(self):
+        return f"Symbol({self.ticker!r}, {self.type})"
+
+# Tabela canônica de símbolos: ticker formatado -> Symbol
+_symbols = {}
+_symbols_lock = threading.Lock()
+
+def _format(ticker):
+    """
+    Regra de formatação: classes de ação americanas usam o hífen do Yahoo Finance
+    ('BRK.B' -> 'BRK-B') e tickers BR (sem ponto ou '=') recebem '.SA'.
     """
     ticker = ticker.strip().upper()
     if '=' in ticker:
         return ticker
+    class_share = _US_CLASS_SHARE_RE.fullmatch(ticker)
+    if class_share:
+        return f"{class_share.group(1)}-{class_share.group(2)}"
     if '.' in ticker:
         return ticker
-    if not re.fullmatch(r'[A-Z]{1,5}', ticker):
+    if not _US_STOCK_RE.fullmatch(ticker):
         return ticker + '.SA'
     return ticker
 
+def _classify(ticker):
+    """Tipo de um ticker já formatado ('BR', 'US', 'BDR' ou 'FX')."""
+    if '=' in ticker:
+        return 'FX'
+    if ticker.endswith(('32.SA', '34.SA', '35.SA')):
+        return 'BDR'
+    if ticker.endswith('.SA'):
+        return 'BR'
+    if _US_STOCK_RE.fullmatch(ticker):
+        return 'US'
+    # Caso não identificado, assume BR
+    return 'BR'
+
+@lru_cache(maxsize=SYMBOL_ALIAS_CACHE_SIZE)
+def resolve_symbol(ticker):
+    """
+    Resolve qualquer grafia de um ticker para o seu símbolo canônico. A
+    formatação e a classificação rodam uma única vez por grafia.
+
+    Args:
+        ticker (str): Código do ticker (original ou formatado)
+
+    Returns:
+        Symbol: Símbolo canônico
+    """
+    canonical = _format(ticker)
+    with _symbols_lock:
+        symbol = _symbols.get(canonical)
+        if symbol is None:
+            ticker_type = _classify(canonical)
+            if ticker_type == 'FX':
+                exchange = 'FX'
+            elif ticker_type == 'US':
+                exchange = 'NYSE'
+            else:
+                exchange = 'B3'
+            if ticker_type == 'FX':
+                # Par 'USDBRL=X' (ou 'BRL=X'): cotado na moeda ao final do par
+                currency = canonical.split('=')[0][-3:]
+            elif canonical.endswith('.SA'):
+                currency = 'BRL'
+            else:
+                currency = 'USD'
+            symbol = Symbol(sys.intern(canonical), ticker_type, currency, exchange)
+            _symbols[canonical] = symbol
+        return symbol
+
+def format_ticker(ticker):
+    """
+    Adiciona '.SA' se for ticker BR (sem ponto ou '=') e usa o hífen nas classes de
+    ação americanas ('BRK.B' -> 'BRK-B'); senão retorna o original.
+    
+    Args:
+        ticker (str): Código do ticker a ser formatado
+        
+    Returns:
+        str: Ticker formatado com sufixo .SA se necessário
+    """
+    return resolve_symbol(ticker).ticker
+
+@lru_cache(maxsize=SYMBOL_ALIAS_CACHE_SIZE)
 def is_us_stock(ticker):
     """
-    Verifica se um ticker é de uma ação americana (padrão de 1-5 letras maiúsculas).
+    Verifica se um ticker é de uma ação americana (padrão de 1-5 letras maiúsculas,
+    com a classe da ação opcional, ex.: 'BRK.B').
     
     Args:
         ticker (str): Código do ticker a ser verificado
@@ -29,8 +132,9 @@ def is_us_stock(ticker):
     Returns:
         bool: True se for uma ação americana, False caso contrário
     """
-    return re.fullmatch(r"[A-Z]{1,5}", ticker.strip().upper()) is not None
+    return _US_STOCK_RE.fullmatch(_format(ticker)) is not None
 
+@lru_cache(maxsize=SYMBOL_ALIAS_CACHE_SIZE)
 def is_bdr(ticker):
     """
     Verifica se um ticker é de um BDR (termina com 32, 34 ou 35 e .SA).
@@ -46,7 +150,7 @@ def is_bdr(ticker):
 
 def get_ticker_type(ticker):
     """
-    Retorna o tipo do ticker (BR, US, BDR, FX).
+    Retorna o tipo do ticker (BR, US, BDR, FX), classificado pelo ticker formatado.
     
     Args:
         ticker (str): Código do ticker a ser verificado
@@ -54,14 +158,28 @@ def get_ticker_type(ticker):
     Returns:
         str: Tipo do ticker ('BR', 'US', 'BDR', 'FX')
     """
-    ticker = ticker.strip().upper()
-    if '=' in ticker:
-        return 'FX'
-    if is_bdr(ticker):
-        return 'BDR'
-    if ticker.endswith('.SA'):
-        return 'BR'
-    if is_us_stock(ticker):
-        return 'US'
-    # Caso não identificado, assume BR
-    return 'BR'
\ No newline at end of file
+    return resolve_symbol(ticker).type
+
+def get_ticker_exchange(ticker):
+    """
+    Retorna a bolsa em que o ticker é negociado, usada para os horários de pregão.
+    
+    Args:
+        ticker (str): Código do ticker a ser verificado
+        
+    Returns:
+        str: Bolsa do ticker ('B3', 'NYSE', 'FX')
+    """
+    return resolve_symbol(ticker).exchange
+
+def get_ticker_currency(ticker):
+    """
+    Retorna a moeda de cotação do ticker: BRL para ativos da B3 (.SA) e USD para os demais.
+    
+    Args:
+        ticker (str): Código do ticker (original ou formatado)
+        
+    Returns:
+        str: Código da moeda ('BRL' ou 'USD')
+    """
+    return resolve_symbol(ticker).currency
@@ -136,8 +136,16 @@ const utilsAPI = {
 
 // API de dividendos
 const dividendAPI = {
-    // Obter dividendos do usuário
-    getDividends: () => fetchAPI('/dividends'),
+    // Obter dividendos do usuário (opcionalmente de um ano e mês)
+    getDividends: (year = null, month = null) => {
+        const params = new URLSearchParams();
+        if (year) params.append('year', year);
+        if (year && month) params.append('month', month);
+        return fetchAPI(`/dividends${params.toString() ? `?${params.toString()}` : ''}`);
+    },
+    
+    // Obter totais por mês, ano e ticker (recebidos e pendentes), calculados no servidor
+    getSummary: (year = null) => fetchAPI(`/dividends/summary${year ? `?year=${year}` : ''}`),
     
     // Atualizar status de recebimento de dividendos
     updateReceiptStatus: (data) => fetchAPI('/dividend-receipt', 'POST', data),